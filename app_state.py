@@ -3,7 +3,7 @@ from threading import Event
 from flask import Flask
 import os
 import io
-from PIL import Image, ImageDraw
+from datetime import datetime
 
 def get_application_path():
     """Get the path where the application is located, whether running as script or executable"""
@@ -30,6 +30,7 @@ start_time = None
 pause_start_time = None
 total_pause_duration = 0.0
 recording_threads = []
+recording_peaks = []  # Накопители пиков формы волны текущей записи (микрофон, системный звук)
 stop_event = Event()
 
 mic_audio_queue = queue.Queue()
@@ -40,6 +41,9 @@ is_post_processing = False
 post_process_file_path = ""
 post_process_stage = ""
 
+# Переменные выше и server_running изменяются только через state_store, здесь — их копия для чтения
+server_running = False
+
 audio_levels = {"mic": 0.0, "sys": 0.0}
 monitoring_stop_event = Event()
 
@@ -59,6 +63,7 @@ FAVICON_STOP_BYTES = None
 
 def create_favicon(shape, color, size=(32, 32)):
     """Создает иконку для favicon и возвращает ее в виде байтов."""
+    from PIL import Image, ImageDraw
     image = Image.new('RGBA', size, (0, 0, 0, 0))
     dc = ImageDraw.Draw(image)
     width, height = size
@@ -77,9 +82,25 @@ def create_favicon(shape, color, size=(32, 32)):
     return img_byte_arr.getvalue()
 
 def generate_favicons():
-    """Генерирует все favicon'ы при старте."""
+    """Генерирует все favicon'ы."""
     global FAVICON_REC_BYTES, FAVICON_PAUSE_BYTES, FAVICON_STOP_BYTES
     FAVICON_REC_BYTES = create_favicon('circle', 'red')
     FAVICON_PAUSE_BYTES = create_favicon('pause', 'orange')
     FAVICON_STOP_BYTES = create_favicon('square', 'gray')
-    print("Favicons generated.")
\ No newline at end of file
+    print("Favicons generated.")
+
+def get_favicon_bytes():
+    """Favicon for the current recording state; the icons are drawn on the first request, not at startup."""
+    if FAVICON_STOP_BYTES is None: generate_favicons()
+    if is_recording and not is_paused: return FAVICON_REC_BYTES
+    if is_recording and is_paused: return FAVICON_PAUSE_BYTES
+    return FAVICON_STOP_BYTES
+
+def get_elapsed_record_time():
+    if not start_time: return 0
+    current_time = datetime.now()
+    elapsed = (current_time - start_time).total_seconds()
+    elapsed -= total_pause_duration
+    if is_paused and pause_start_time:
+        elapsed -= (current_time - pause_start_time).total_seconds()
+    return max(elapsed, 0)
\ No newline at end of file
@@ -0,0 +1,173 @@
+import os
+import hashlib
+import logging
+import threading
+import subprocess
+from collections import OrderedDict
+
+from app_state import get_application_path
+
+AUDIO_PREVIEW_DIR = os.path.join(get_application_path(), 'preview_cache')
+AUDIO_PREVIEW_CACHE_BYTES = 1024 * 1024 * 1024  # Предел размера кэша превью на диске
+AUDIO_PREVIEW_MAX_TRANSCODES = 2  # Сколько ffmpeg может работать одновременно
+AUDIO_PREVIEW_CHUNK = 16 * 1024
+# Речь в моно: Opus 32 кбит/с (~14 МБ в час); MP3 для браузеров без Opus (старые iOS)
+AUDIO_PREVIEW_FORMATS = {
+    'opus': {'ext': '.ogg', 'mimetype': 'audio/ogg', 'args': ['-c:a', 'libopus', '-b:a', '32k', '-application', 'voip', '-f', 'ogg']},
+    'mp3': {'ext': '.mp3', 'mimetype': 'audio/mpeg', 'args': ['-ar', '22050', '-c:a', 'libmp3lame', '-b:a', '32k', '-f', 'mp3']},
+}
+
+class _Transcode:
+    """One running ffmpeg transcode; its output is kept in memory so any number of listeners can follow it."""
+
+    def __init__(self, key, fmt):
+        self.key, self.fmt = key, fmt
+        self.chunks = []
+        self.done = False
+        self.error = None
+        self.condition = threading.Condition()
+
+    def append(self, data):
+        with self.condition:
+            self.chunks.append(data)
+            self.condition.notify_all()
+
+    def finish(self, error=None):
+        with self.condition:
+            self.done, self.error = True, error
+            self.condition.notify_all()
+
+    def wait_started(self):
+        """Waits for the first output; returns the error if the transcode failed before producing any."""
+        with self.condition:
+            while not self.chunks and not self.done:
+                self.condition.wait()
+            return None if self.chunks else (self.error or OSError("ffmpeg produced no output"))
+
+    def iter_chunks(self):
+        """Yields the output from the beginning, waiting for new data until the transcode ends."""
+        index = 0
+        while True:
+            with self.condition:
+                while index >= len(self.chunks) and not self.done:
+                    self.condition.wait()
+                if index >= len(self.chunks): return
+                pending = self.chunks[index:]
+            index += len(pending)
+            yield from pending
+
+class AudioPreviewCache:
+    """
+    Low-bitrate mono transcodes of recordings for listening over a slow network.
+
+    The first request starts ffmpeg and streams its output as it is produced,
+    so playback starts within a second; requests for the same file arriving
+    meanwhile follow the same transcode. Finished transcodes are stored in
+    preview_cache/ under a key of the source path, mtime, size and format, and
+    are evicted least-recently-used first once the folder exceeds max_bytes.
+    """
+
+    def __init__(self, cache_dir, max_bytes):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries = None  # Имя файла -> размер, от давно использованных к недавним
+        self._total = 0
+        self._running = {}
+        self._slots = threading.Semaphore(AUDIO_PREVIEW_MAX_TRANSCODES)
+
+    def _load(self):
+        """Reads the cache folder once: leftovers of interrupted transcodes are removed, LRU order is taken from mtime."""
+        if self._entries is not None: return
+        os.makedirs(self.cache_dir, exist_ok=True)
+        files = []
+        for entry in os.scandir(self.cache_dir):
+            if not entry.is_file(): continue
+            if entry.name.endswith('.part'):
+                try: os.remove(entry.path)
+                except OSError: pass
+                continue
+            st = entry.stat()
+            files.append((st.st_mtime_ns, entry.name, st.st_size))
+        self._entries = OrderedDict((name, size) for _mtime, name, size in sorted(files))
+        self._total = sum(self._entries.values())
+
+    @staticmethod
+    def cache_key(audio_path, fmt):
+        st = os.stat(audio_path)
+        payload = f"{os.path.abspath(audio_path)}|{st.st_mtime_ns}|{st.st_size}|{fmt}"
+        return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+    def get(self, audio_path, fmt):
+        """
+        Returns ('file', path) for a cached transcode or ('stream', transcode)
+        for one in progress, starting it if needed.
+        """
+        key = self.cache_key(audio_path, fmt)
+        name = key + AUDIO_PREVIEW_FORMATS[fmt]['ext']
+        with self._lock:
+            self._load()
+            if name in self._entries:
+                self._entries.move_to_end(name)
+                path = os.path.join(self.cache_dir, name)
+                # mtime хранит порядок LRU между перезапусками
+                try: os.utime(path)
+                except OSError: pass
+                return 'file', path
+            transcode = self._running.get(name)
+            if transcode is None:
+                transcode = self._running[name] = _Transcode(key, fmt)
+                threading.Thread(target=self._run, args=(transcode, audio_path, name), daemon=True).start()
+        return 'stream', transcode
+
+    def _run(self, transcode, audio_path, name):
+        from pydub import AudioSegment
+        path = os.path.join(self.cache_dir, name)
+        part_path = path + '.part'
+        command = [AudioSegment.converter, '-v', 'error', '-nostdin', '-i', audio_path, '-vn', '-ac', '1'] + AUDIO_PREVIEW_FORMATS[transcode.fmt]['args'] + ['-']
+        error = None
+        with self._slots:
+            try:
+                process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+                # stderr читается в отдельном потоке, чтобы ffmpeg не заблокировался на заполненном канале
+                stderr = []
+                reader = threading.Thread(target=lambda: stderr.append(process.stderr.read()), daemon=True)
+                reader.start()
+                with open(part_path, 'wb') as f:
+                    while True:
+                        data = process.stdout.read(AUDIO_PREVIEW_CHUNK)
+                        if not data: break
+                        f.write(data)
+                        transcode.append(data)
+                reader.join()
+                if process.wait() != 0:
+                    raise OSError(f"ffmpeg exited with code {process.returncode}: {b''.join(stderr).decode('utf-8', 'replace').strip()}")
+                os.replace(part_path, path)
+            except Exception as e:
+                error = e
+                logging.error(f"Не удалось подготовить превью {audio_path}: {e}")
+                try: os.remove(part_path)
+                except OSError: pass
+        with self._lock:
+            self._running.pop(name, None)
+            if error is None:
+                size = os.path.getsize(path)
+                self._entries[name] = size
+                self._total += size
+                self._evict(keep=name)
+        transcode.finish(error)
+
+    def _evict(self, keep=None):
+        """Removes the least recently used transcodes until the cache fits in max_bytes (caller holds the lock)."""
+        for name in list(self._entries):
+            if self._total <= self.max_bytes: break
+            if name == keep: continue
+            try:
+                os.remove(os.path.join(self.cache_dir, name))
+            except FileNotFoundError:
+                pass
+            except OSError:
+                continue  # Файл сейчас отдается (Windows не дает удалить открытый файл)
+            self._total -= self._entries.pop(name)
+
+audio_preview_cache = AudioPreviewCache(AUDIO_PREVIEW_DIR, AUDIO_PREVIEW_CACHE_BYTES)
@@ -0,0 +1,170 @@
+import os
+import mmap
+import struct
+
+# Индексы таблиц битрейтов: (версия MPEG, слой) -> кбит/с
+_BITRATES = {
+    (1, 1): (0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448),
+    (1, 2): (0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384),
+    (1, 3): (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320),
+    (2, 1): (0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256),
+    (2, 2): (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+    (2, 3): (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+}
+_SAMPLE_RATES = {1: (44100, 48000, 32000), 2: (22050, 24000, 16000), 2.5: (11025, 12000, 8000)}
+_VERSIONS = {0b00: 2.5, 0b10: 2, 0b11: 1}
+_LAYERS = {0b01: 3, 0b10: 2, 0b11: 1}
+
+# Сколько байт читать в начале файла: ID3-тег + первый кадр с заголовком Xing/VBRI
+_HEAD_READ_BYTES = 64 * 1024
+# Сколько подряд корректных кадров нужно, чтобы поверить найденной синхронизации
+_SYNC_CONFIRM_FRAMES = 3
+
+def _parse_frame_header(data, offset):
+    """Returns (frame_length, samples_per_frame, sample_rate, version, layer, is_mono) or None."""
+    if offset + 4 > len(data): return None
+    b1, b2, b3 = data[offset + 1], data[offset + 2], data[offset + 3]
+    if data[offset] != 0xFF or (b1 & 0xE0) != 0xE0: return None
+    version = _VERSIONS.get((b1 >> 3) & 0b11)
+    layer = _LAYERS.get((b1 >> 1) & 0b11)
+    bitrate_index, rate_index = b2 >> 4, (b2 >> 2) & 0b11
+    if version is None or layer is None or bitrate_index in (0, 15) or rate_index == 3: return None
+    bitrate = _BITRATES[(1 if version == 1 else 2, layer)][bitrate_index] * 1000
+    sample_rate = _SAMPLE_RATES[version][rate_index]
+    padding = (b2 >> 1) & 1
+    if layer == 1:
+        samples, length = 384, (12 * bitrate // sample_rate + padding) * 4
+    elif layer == 2 or version == 1:
+        samples, length = 1152, 144 * bitrate // sample_rate + padding
+    else:
+        samples, length = 576, 72 * bitrate // sample_rate + padding
+    return length, samples, sample_rate, version, layer, (b3 >> 6) == 0b11
+
+def _id3v2_size(data):
+    if len(data) < 10 or data[:3] != b'ID3': return 0
+    size = (data[6] & 0x7F) << 21 | (data[7] & 0x7F) << 14 | (data[8] & 0x7F) << 7 | (data[9] & 0x7F)
+    return 10 + size + (10 if data[5] & 0x10 else 0)
+
+def _find_first_frame(data, start):
+    """Finds a frame sync followed by a few valid frames (random 0xFFE bytes occur inside tags and data)."""
+    offset = data.find(b'\xff', start)
+    while offset != -1:
+        position, confirmed = offset, 0
+        while confirmed < _SYNC_CONFIRM_FRAMES:
+            header = _parse_frame_header(data, position)
+            if not header: break
+            confirmed += 1
+            position += header[0]
+            if position >= len(data): break
+        if confirmed and (confirmed >= _SYNC_CONFIRM_FRAMES or position >= len(data)):
+            return offset
+        offset = data.find(b'\xff', offset + 1)
+    return None
+
+def _vbr_header_samples(data, offset, header):
+    """Reads the Xing/Info or VBRI header of the first frame. Returns the number of decoded samples or None."""
+    _length, samples, _rate, version, layer, is_mono = header
+    if layer != 3: return None
+    side_info = (17 if is_mono else 32) if version == 1 else (9 if is_mono else 17)
+    xing = offset + 4 + side_info
+    tag = bytes(data[xing:xing + 4])
+    if tag in (b'Xing', b'Info'):
+        flags, = struct.unpack_from('>I', data, xing + 4)
+        if not flags & 0x1: return None
+        frames, = struct.unpack_from('>I', data, xing + 8)
+        total = frames * samples
+        # Заголовок LAME после Xing хранит задержку и добивку кодера, которые декодер отбрасывает
+        lame = xing + 8 + (4 if flags & 0x1 else 0) + (4 if flags & 0x2 else 0) + (100 if flags & 0x4 else 0) + (4 if flags & 0x8 else 0)
+        if bytes(data[lame:lame + 4]) in (b'LAME', b'Lavf', b'Lavc') and lame + 24 <= len(data):
+            b0, b1, b2 = data[lame + 21], data[lame + 22], data[lame + 23]
+            delay, padding = (b0 << 4) | (b1 >> 4), ((b1 & 0x0F) << 8) | b2
+            total = max(total - delay - padding, 0)
+        return total
+    vbri = offset + 4 + 32
+    if bytes(data[vbri:vbri + 4]) == b'VBRI':
+        frames, = struct.unpack_from('>I', data, vbri + 14)
+        return frames * samples
+    return None
+
+def _scan_frames(data, offset):
+    """Counts decoded samples by walking frame headers, resynchronizing after damaged frames."""
+    total, sample_rate, end = 0, None, len(data)
+    while offset + 4 <= end:
+        header = _parse_frame_header(data, offset)
+        if header is None or (sample_rate and header[2] != sample_rate):
+            resync = _find_first_frame(data, offset + 1)
+            if resync is None: break
+            offset = resync
+            continue
+        length, samples, rate = header[0], header[1], header[2]
+        if offset + length > end: break  # Обрезанный последний кадр декодер не выдаст
+        sample_rate = rate
+        total += samples
+        offset += length
+    return total, sample_rate
+
+def mp3_duration_ms(path):
+    """Returns the duration of an MP3 file in milliseconds, or None if no MPEG frames were found."""
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0: return None
+        head = f.read(_HEAD_READ_BYTES)
+        start = _id3v2_size(head)
+        if start + 4 <= len(head):
+            offset = _find_first_frame(head, start)
+            if offset is not None:
+                header = _parse_frame_header(head, offset)
+                samples = _vbr_header_samples(head, offset, header)
+                if samples is not None: return round(samples * 1000 / header[2])
+        # Заголовка Xing/VBRI нет (CBR) или тег ID3 слишком большой: проходим по кадрам
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            offset = _find_first_frame(data, start)
+            if offset is None: return None
+            header = _parse_frame_header(data, offset)
+            if _vbr_header_samples(data, offset, header) is not None:
+                # Служебный кадр Xing/Info не содержит звука
+                offset += header[0]
+            total, sample_rate = _scan_frames(data, offset)
+    return round(total * 1000 / sample_rate) if sample_rate else None
+
+def wav_duration_ms(path):
+    """Returns the duration of a RIFF/WAVE file in milliseconds from its fmt and data chunks, or None."""
+    with open(path, 'rb') as f:
+        file_size = os.fstat(f.fileno()).st_size
+        riff = f.read(12)
+        if len(riff) < 12 or riff[:4] not in (b'RIFF', b'RF64') or riff[8:12] != b'WAVE': return None
+        block_align = sample_rate = None
+        ds64_data_size = None
+        while True:
+            chunk = f.read(8)
+            if len(chunk) < 8: return None
+            chunk_id, chunk_size = chunk[:4], struct.unpack('<I', chunk[4:])[0]
+            if chunk_id == b'ds64':
+                body = f.read(chunk_size)
+                if len(body) >= 16: ds64_data_size = struct.unpack_from('<Q', body, 8)[0]
+            elif chunk_id == b'fmt ':
+                body = f.read(chunk_size)
+                if len(body) < 16: return None
+                _format, _channels, sample_rate, _byte_rate, block_align = struct.unpack_from('<HHIIH', body)
+            elif chunk_id == b'data':
+                if not block_align or not sample_rate: return None
+                available = file_size - f.tell()
+                if chunk_size == 0xFFFFFFFF and ds64_data_size is not None: chunk_size = ds64_data_size
+                # Незавершенная запись может оставить в заголовке 0 или размер больше файла
+                data_size = available if chunk_size == 0 or chunk_size > available else chunk_size
+                return round((data_size // block_align) * 1000 / sample_rate)
+            else:
+                f.seek(chunk_size, os.SEEK_CUR)
+            if chunk_size % 2: f.seek(1, os.SEEK_CUR)  # Чанки выровнены по четному размеру
+
+def probe_duration_ms(path):
+    """
+    Returns the duration of a WAV or MP3 file in milliseconds without decoding
+    the audio, or None if the format is not recognized.
+    """
+    ext = os.path.splitext(path)[1].lower()
+    try:
+        if ext == '.wav': return wav_duration_ms(path)
+        if ext == '.mp3': return mp3_duration_ms(path)
+    except (OSError, ValueError, struct.error):
+        return None
+    return None
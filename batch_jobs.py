@@ -0,0 +1,143 @@
+import time
+import uuid
+import logging
+import threading
+from collections import OrderedDict
+
+BATCH_WORKERS = 4  # Общее число потоков, выполняющих операции
+BATCH_KEEP_FINISHED = 50  # Сколько завершенных заданий помнить для /batch
+
+class BatchJob:
+    """A list of recordings to run one operation on, with per-item status."""
+
+    def __init__(self, operation, items):
+        self.id = uuid.uuid4().hex[:12]
+        self.operation = operation
+        self.items = [dict(item, status='pending', error=None) for item in items]
+        self.created_at = time.time()
+        self.finished_at = None
+        self.cancelled = False
+
+    @property
+    def finished(self):
+        return all(item['status'] not in ('pending', 'running') for item in self.items)
+
+    def to_dict(self):
+        counts = {}
+        for item in self.items:
+            counts[item['status']] = counts.get(item['status'], 0) + 1
+        if self.finished: status = 'cancelled' if self.cancelled else 'done'
+        else: status = 'running' if len(self.items) > counts.get('pending', 0) else 'queued'
+        return {
+            "id": self.id, "operation": self.operation, "status": status,
+            "total": len(self.items), "counts": counts,
+            "created_at": self.created_at, "finished_at": self.finished_at,
+            "items": [dict(item) for item in self.items],
+        }
+
+class BatchScheduler:
+    """
+    Runs operations on recordings on a fixed pool of threads.
+
+    Each operation is registered with a concurrency limit (e.g. at most two
+    ffmpeg processes for compression), so a large batch never starts more
+    work at once than the limit allows; other operations can still use the
+    free workers. Items are taken in submission order; a cancelled job drops
+    its pending items, items already running finish normally.
+    """
+
+    def __init__(self, workers=BATCH_WORKERS):
+        self.workers = workers
+        self._condition = threading.Condition()
+        self._operations = {}  # Имя операции -> (функция, предел одновременных запусков)
+        self._running = {}
+        self._queue = []  # (задание, индекс элемента)
+        self._jobs = OrderedDict()
+        self._threads = []
+
+    def register(self, operation, func, concurrency=1):
+        """func(item) performs the operation for one item and raises on failure."""
+        self._operations[operation] = (func, concurrency)
+
+    @property
+    def operations(self):
+        return list(self._operations)
+
+    def submit(self, operation, items):
+        if operation not in self._operations: raise ValueError(f"Неизвестная операция: {operation}")
+        job = BatchJob(operation, items)
+        with self._condition:
+            self._jobs[job.id] = job
+            self._queue.extend((job, index) for index in range(len(job.items)))
+            self._trim_jobs()
+            self._ensure_threads()
+            self._condition.notify_all()
+        return job
+
+    def get(self, job_id):
+        with self._condition:
+            job = self._jobs.get(job_id)
+            return job.to_dict() if job else None
+
+    def list(self):
+        with self._condition:
+            return [job.to_dict() for job in reversed(self._jobs.values())]
+
+    def cancel(self, job_id):
+        with self._condition:
+            job = self._jobs.get(job_id)
+            if job is None: return None
+            job.cancelled = True
+            for item in job.items:
+                if item['status'] == 'pending': item['status'] = 'cancelled'
+            self._queue = [(j, index) for j, index in self._queue if j is not job]
+            self._mark_finished(job)
+            return job.to_dict()
+
+    def _trim_jobs(self):
+        finished = [job_id for job_id, job in self._jobs.items() if job.finished]
+        for job_id in finished[:max(len(finished) - BATCH_KEEP_FINISHED, 0)]:
+            del self._jobs[job_id]
+
+    def _ensure_threads(self):
+        while len(self._threads) < self.workers:
+            thread = threading.Thread(target=self._worker, name=f"batch-{len(self._threads)}", daemon=True)
+            self._threads.append(thread)
+            thread.start()
+
+    def _next_item(self):
+        """First queued item whose operation is below its concurrency limit (caller holds the lock)."""
+        for position, (job, index) in enumerate(self._queue):
+            if self._running.get(job.operation, 0) < self._operations[job.operation][1]:
+                del self._queue[position]
+                return job, index
+        return None
+
+    def _mark_finished(self, job):
+        if job.finished and job.finished_at is None: job.finished_at = time.time()
+
+    def _worker(self):
+        while True:
+            with self._condition:
+                task = self._next_item()
+                while task is None:
+                    self._condition.wait()
+                    task = self._next_item()
+                job, index = task
+                item = job.items[index]
+                item['status'] = 'running'
+                self._running[job.operation] = self._running.get(job.operation, 0) + 1
+            func = self._operations[job.operation][0]
+            try:
+                func(item)
+                status, error = 'done', None
+            except Exception as e:
+                status, error = 'error', str(e)
+                logging.error(f"Ошибка операции {job.operation} для {item}: {e}")
+            with self._condition:
+                item['status'], item['error'] = status, error
+                self._running[job.operation] -= 1
+                self._mark_finished(job)
+                self._condition.notify_all()
+
+batch_scheduler = BatchScheduler()
@@ -0,0 +1,131 @@
+"""
+Бенчмарк определения длительности записи: прежний вариант (полное декодирование
+через AudioSegment.from_file, т.е. ffmpeg) против чтения заголовков audio_probe.
+
+Генерирует часовые файлы: WAV (16 кГц, моно), MP3 CBR без заголовка Xing (проход
+по кадрам) и MP3 с заголовками Info + LAME. Кадры MP3 синтетические (тишина), но
+с корректными заголовками, поэтому ffmpeg их декодирует.
+
+Запуск: python benchmarks/bench_audio_probe.py [минут] [файл.mp3|файл.wav ...]
+Без ffmpeg прежний вариант пропускается, проверяются только ожидаемые значения.
+"""
+import os
+import sys
+import time
+import wave
+import shutil
+import struct
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from audio_probe import probe_duration_ms
+
+MP3_SAMPLE_RATE = 44100
+MP3_SAMPLES_PER_FRAME = 1152
+MP3_BITRATE = 128000
+LAME_DELAY, LAME_PADDING = 576, 1200
+
+def write_wav(path, minutes, rate=16000):
+    frames = minutes * 60 * rate
+    with wave.open(path, 'wb') as wf:
+        wf.setnchannels(1)
+        wf.setsampwidth(2)
+        wf.setframerate(rate)
+        chunk = b'\0\0' * rate
+        for _ in range(frames // rate): wf.writeframes(chunk)
+    return round(frames * 1000 / rate)
+
+def _mp3_frame(padding):
+    # MPEG-1 Layer III, 128 кбит/с, 44.1 кГц, стерео, без CRC
+    header = bytes([0xFF, 0xFB, 0x90 | (padding << 1), 0x00])
+    length = 144 * MP3_BITRATE // MP3_SAMPLE_RATE + padding
+    return header + b'\0' * (length - 4)
+
+def _frame_paddings(count):
+    # Добивка кадров, как у кодера: средняя длина кадра равна битрейту
+    remainder = 0
+    for _ in range(count):
+        remainder += (144 * MP3_BITRATE) % MP3_SAMPLE_RATE
+        padding = 1 if remainder >= MP3_SAMPLE_RATE else 0
+        if padding: remainder -= MP3_SAMPLE_RATE
+        yield padding
+
+def write_mp3(path, minutes, with_info_header):
+    frames = minutes * 60 * MP3_SAMPLE_RATE // MP3_SAMPLES_PER_FRAME
+    with open(path, 'wb') as f:
+        # ID3v2 с небольшим тегом, чтобы проверить его пропуск
+        tag = b'TIT2' + struct.pack('>I', 6) + b'\0\0' + b'\0Test'
+        size = len(tag)
+        f.write(b'ID3\x03\x00\x00' + bytes([(size >> 21) & 0x7F, (size >> 14) & 0x7F, (size >> 7) & 0x7F, size & 0x7F]) + tag)
+        if with_info_header:
+            info = bytearray(_mp3_frame(0))
+            xing = 4 + 32
+            info[xing:xing + 4] = b'Info'
+            info[xing + 4:xing + 8] = struct.pack('>I', 0x1 | 0x2)
+            info[xing + 8:xing + 12] = struct.pack('>I', frames)
+            info[xing + 12:xing + 16] = struct.pack('>I', 0)
+            lame = xing + 16
+            info[lame:lame + 9] = b'LAME3.100'
+            info[lame + 21:lame + 24] = bytes([LAME_DELAY >> 4, ((LAME_DELAY & 0x0F) << 4) | (LAME_PADDING >> 8), LAME_PADDING & 0xFF])
+            f.write(bytes(info))
+        batch = []
+        for padding in _frame_paddings(frames):
+            batch.append(_mp3_frame(padding))
+            if len(batch) == 4096:
+                f.write(b''.join(batch))
+                batch = []
+        f.write(b''.join(batch))
+        f.write(b'TAG' + b'\0' * 125)  # ID3v1 в конце
+    samples = frames * MP3_SAMPLES_PER_FRAME
+    if with_info_header: samples -= LAME_DELAY + LAME_PADDING
+    return round(samples * 1000 / MP3_SAMPLE_RATE)
+
+def legacy_duration_ms(path):
+    from pydub import AudioSegment
+    return len(AudioSegment.from_file(path))
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, (time.perf_counter() - start) * 1000
+
+def run(files):
+    has_ffmpeg = shutil.which('ffmpeg') is not None
+    if not has_ffmpeg: print("ffmpeg не найден: прежний вариант пропускается.\n")
+    print(f"{'файл':<32} {'ожидается':>10} {'probe, мс':>10} {'время':>10} {'ffmpeg, мс':>11} {'время':>10}")
+    mismatches = 0
+    for path, expected in files:
+        probed, probe_time = timed(probe_duration_ms, path)
+        line = f"{os.path.basename(path):<32} {str(expected or '-'):>10} {str(probed):>10} {probe_time:>8.1f}мс"
+        if expected is not None and probed != expected: mismatches += 1
+        if has_ffmpeg:
+            legacy, legacy_time = timed(legacy_duration_ms, path)
+            line += f" {legacy:>11} {legacy_time:>8.0f}мс"
+            # Расхождение в пределах одного кадра MP3 допустимо
+            if probed is None or abs(legacy - probed) > 30: mismatches += 1
+        print(line)
+    return mismatches
+
+def main():
+    minutes = int(sys.argv[1]) if len(sys.argv) > 1 else 60
+    extra_files = [(path, None) for path in sys.argv[2:]]
+    root = tempfile.mkdtemp(prefix='bench_probe_')
+    try:
+        files = [
+            (os.path.join(root, 'hour.wav'), None),
+            (os.path.join(root, 'hour_cbr.mp3'), None),
+            (os.path.join(root, 'hour_info.mp3'), None),
+        ]
+        files[0] = (files[0][0], write_wav(files[0][0], minutes))
+        files[1] = (files[1][0], write_mp3(files[1][0], minutes, with_info_header=False))
+        files[2] = (files[2][0], write_mp3(files[2][0], minutes, with_info_header=True))
+        mismatches = run(files + extra_files)
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+    if mismatches:
+        print(f"\nРасхождений: {mismatches}")
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
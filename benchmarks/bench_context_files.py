@@ -0,0 +1,74 @@
+"""
+Бенчмарк сборки контекста из файлов папки дня: прежний вариант (glob на каждое
+правило + конкатенация через +=) против однопроходного os.scandir.
+
+Запуск: python benchmarks/bench_context_files.py [число_файлов]
+"""
+import os
+import sys
+import time
+import shutil
+import tempfile
+from datetime import datetime
+from pathlib import Path
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils import build_final_prompt_addition
+from bench_html_cleaner import legacy_clean_html_content
+
+RULES = [
+    {"pattern": "*.html", "prompt": "\n--- НАЧАЛО файла @{filename} ---\n{content}\n--- КОНЕЦ файла @{filename} ---\n", "enabled": True},
+    {"pattern": "*.txt", "prompt": "\n[{filename}]\n{content}\n", "enabled": True},
+    {"pattern": "*.md", "prompt": "\n[{filename}]\n{content}\n", "enabled": True},
+    {"pattern": "agenda_*", "prompt": "\n[Повестка {filename}]\n{content}\n", "enabled": True},
+]
+SETTINGS = {"use_custom_prompt": False, "add_meeting_date": False, "context_file_rules": RULES, "selected_contacts": []}
+
+def make_day_folder(root, count):
+    kinds = ['.html', '.txt', '.md', '.mp3', '.json']
+    for i in range(count):
+        ext = kinds[i % len(kinds)]
+        name = f"agenda_{i:04d}{ext}" if i % 10 == 0 else f"file_{i:04d}{ext}"
+        with open(os.path.join(root, name), 'w', encoding='utf-8') as f:
+            if ext == '.html':
+                f.write("<html><body><p>Отчет</p><table><tr><th>Задача</th><th>Статус</th></tr>"
+                        + "".join(f"<tr><td>Задача {j}</td><td>готово</td></tr>" for j in range(20))
+                        + "</table></body></html>")
+            else:
+                f.write(f"Строка контекста {i}\n" * 20)
+
+def legacy_build(base_path):
+    """Копия прежнего цикла по правилам из build_final_prompt_addition (с очисткой HTML через BeautifulSoup)."""
+    result = ""
+    for rule in RULES:
+        if not rule.get("enabled", False): continue
+        pattern, prompt_template = rule.get("pattern"), rule.get("prompt")
+        for found_file in sorted(list(base_path.glob(pattern))):
+            with open(found_file, 'r', encoding='utf-8') as f: content = f.read()
+            if found_file.suffix.lower() in ['.html', '.htm']: content = legacy_clean_html_content(content)
+            if content: result += prompt_template.replace("{filename}", found_file.name).replace("{content}", content)
+    return result
+
+def timed(fn, repeat=5):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+if __name__ == '__main__':
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    root = tempfile.mkdtemp(prefix='crs_bench_')
+    try:
+        make_day_folder(root, count)
+        base_path = Path(root)
+        now = datetime.now()
+        legacy = timed(lambda: legacy_build(base_path))
+        current = timed(lambda: build_final_prompt_addition(base_path, now, override_settings=SETTINGS))
+        print(f"Файлов в папке: {count}, правил: {len(RULES)}")
+        print(f"  glob по правилам + '+=': {legacy * 1000:8.1f} ms")
+        print(f"  один проход scandir:     {current * 1000:8.1f} ms  (x{legacy / current:.2f})")
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
@@ -0,0 +1,114 @@
+"""
+Сравнение потокового очистителя HTML (html_cleaner) с прежней реализацией на
+BeautifulSoup: сначала сверка вывода (golden) на наборе документов, затем
+пропускная способность на многомегабайтной HTML-выгрузке.
+
+Запуск: python benchmarks/bench_html_cleaner.py [размер_МБ]
+Для сверки нужен пакет beautifulsoup4.
+"""
+import os
+import re
+import sys
+import time
+import random
+import warnings
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from html_cleaner import clean_html
+
+try:
+    from bs4 import BeautifulSoup
+    warnings.filterwarnings('ignore', module='bs4')
+    warnings.filterwarnings('ignore', message='.*HTML parser to parse an XML document')
+except ImportError:
+    BeautifulSoup = None
+
+def legacy_clean_html_content(html_content):
+    """Прежняя реализация utils._clean_html_content (эталон)."""
+    if not html_content or not BeautifulSoup: return ""
+    soup = BeautifulSoup(html_content, 'html.parser')
+    allowed_tags = {'table', 'thead', 'tbody', 'tfoot', 'tr', 'th', 'td'}
+    for s in soup(['script', 'style']): s.decompose()
+    for tag in soup.find_all(True):
+        tag.attrs = {}
+        if tag.name not in allowed_tags: tag.unwrap()
+    if soup.body: soup = soup.body
+    for cell in soup.find_all(['td', 'th']):
+        cell.string = cell.get_text(separator=' ', strip=True)
+    cleaned_html = soup.decode(formatter=None)
+    cleaned_html = re.sub(r'(?<=>)\s*\n\s*(?=<)', '', cleaned_html)
+    return re.sub(r'\n{2,}', '\n', cleaned_html).strip()
+
+GOLDEN_DOCUMENTS = [
+    "",
+    "<!DOCTYPE html><html><head><style>td {color: red}</style><script>var t = '<td>';</script></head>"
+    "<body><h1>Отчет</h1><table class='grid'><thead><tr><th>Задача</th><th>Статус</th></tr></thead>"
+    "<tbody><tr><td><b>Миграция</b> <i>БД</i></td><td>готово &amp; проверено</td></tr></tbody></table></body></html>",
+    "<table>\n  <tr>\n    <td>a<td>b</td>\n  </tr>\n</table>",
+    "<table><tr><td>внешняя<table><tr><td>вложенная</td></tr></table></td></tr></table>",
+    "<p>до</p><table><tr><td>x</table>после<!-- комментарий --><![CDATA[данные]]><?xml version='1.0'?>",
+    "<td/><br></br>текст</br><pre>  \n  </pre><textarea>  </textarea>",
+    "&nbsp;&copy &#150; &#x41; &#0; &#1; &foo; &#12a a&b",
+    "<template><td>шаблон<![CDATA[x]]></td></template><table><tr><th colspan=2>Итого</th></tr>",
+]
+FUZZ_TOKENS = [
+    '<table>', '</table>', '<tr>', '</tr>', '<td>', '</td>', '<th class="x">', '</th>', '<tbody>', '</tbody>', '<thead>',
+    '<tfoot>', '</tfoot>', '<div id=a>', '</div>', '<p>', '</p>', '<b>', '</b>', '<br>', '</br>', '<br/>', '<td/>',
+    '<img src=x>', '<pre>', '</pre>', '<textarea>', '</textarea>', '<script>var a="<td>";</script>', '<style>td{}</style>',
+    '<!-- c -->', '<!--  -->', '<!DOCTYPE html>', '<![CDATA[x]]>', '<?xml v?>', ' ', '  ', '\n', '\n\n  ', '\t', 'text',
+    'Привет', '&amp;', '&lt;', '&nbsp;', '&#150;', '&#x41;', '&#0;', '&#1;', '&foo;', '&copy ', '&#12a', 'a&b',
+    '<template>', '</template>', '<html>', '<body>', '</body>', '</html>', '<span>', '</span>', '\xa0',
+]
+
+def check_golden(fuzz_cases=5000, seed=0):
+    rng = random.Random(seed)
+    documents = GOLDEN_DOCUMENTS + [
+        ''.join(rng.choice(FUZZ_TOKENS) for _ in range(rng.randint(0, 40))) for _ in range(fuzz_cases)
+    ]
+    mismatches = 0
+    for doc in documents:
+        expected, actual = legacy_clean_html_content(doc), clean_html(doc)
+        if expected != actual:
+            mismatches += 1
+            if mismatches <= 5:
+                print(f"  расхождение на {doc!r}:\n    ожидалось {expected!r}\n    получено  {actual!r}")
+    print(f"Сверка с BeautifulSoup: {len(documents)} документов, расхождений: {mismatches}")
+    return mismatches == 0
+
+def make_export(size_mb):
+    """HTML-выгрузка в стиле офисных пакетов: много атрибутов, стилей и вложенной разметки."""
+    row = ("<tr style='height:15pt'><td class=xl65 style='border:.5pt solid'><span lang=RU>Иванов И.И.</span></td>"
+           "<td class=xl66><p class=MsoNormal><b>Подготовить отчет</b> по проекту</p></td>"
+           "<td class=xl67 align=right>&nbsp;12&nbsp;</td></tr>\n")
+    header = "<html><head><style>.xl65{mso-style-parent:style0}</style></head><body><table border=0 cellpadding=0>\n"
+    rows = max(1, size_mb * 1024 * 1024 // len(row.encode('utf-8')))
+    return header + row * rows + "</table></body></html>"
+
+def throughput(fn, data, repeat=3):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(data)
+        best = min(best, time.perf_counter() - start)
+    return len(data.encode('utf-8')) / (1024 * 1024) / best, best
+
+if __name__ == '__main__':
+    size_mb = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    ok = True
+    if BeautifulSoup:
+        ok = check_golden()
+    else:
+        print("beautifulsoup4 не установлен: сверка и замер эталона пропущены.")
+
+    doc = make_export(size_mb)
+    mbps, seconds = throughput(clean_html, doc)
+    print(f"Документ {size_mb} МБ")
+    print(f"  потоковый html.parser: {seconds:7.2f} s  ({mbps:6.2f} МБ/с)")
+    if BeautifulSoup:
+        legacy_mbps, legacy_seconds = throughput(legacy_clean_html_content, doc, repeat=1)
+        print(f"  BeautifulSoup:         {legacy_seconds:7.2f} s  ({legacy_mbps:6.2f} МБ/с)  (x{legacy_seconds / seconds:.1f})")
+        if clean_html(doc) != legacy_clean_html_content(doc):
+            print("  ВНИМАНИЕ: вывод на большом документе отличается от эталона")
+            ok = False
+    sys.exit(0 if ok else 1)
@@ -0,0 +1,153 @@
+"""
+Бенчмарк запуска: время до первого ответа веб-сервера и память (RSS) в простое
+для обычного режима (трей) и --headless.
+
+Приложение копируется во временную папку со своими .env, настройками (свободный
+порт) и пустой rec/, затем recordServer.pyw запускается в каждом режиме: замеряется
+время от старта процесса до ответа GET /login, после нескольких секунд простоя
+читается RSS процесса, и процесс завершается.
+
+Отдельно замеряется импорт recordServer.pyw в каждом режиме (время и пиковый RSS
+процесса), он не требует рабочего стола и аудиоустройств. Обычный режим целиком
+запускается только там, где есть рабочий стол; если процесс не поднялся,
+строка помечается как недоступная.
+
+Запуск: python benchmarks/bench_startup.py [повторов] [секунд_простоя]
+RSS на Windows и macOS читается через psutil (если установлен).
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import socket
+import tempfile
+import subprocess
+import statistics
+import urllib.request
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODES = (("трей", []), ("headless", ["--headless"]))
+START_TIMEOUT = 60
+
+IMPORT_PROBE = """
+import sys, time, json, importlib.util, importlib.machinery
+sys.argv = ['recordServer.pyw'] + sys.argv[1:]
+started = time.perf_counter()
+loader = importlib.machinery.SourceFileLoader('recordServer', 'recordServer.pyw')
+module = importlib.util.module_from_spec(importlib.util.spec_from_loader('recordServer', loader))
+loader.exec_module(module)
+elapsed = time.perf_counter() - started
+try:
+    import resource
+    # ru_maxrss: КБ в Linux, байты в macOS
+    peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / (1024 ** 2 if sys.platform == 'darwin' else 1024)
+except ImportError:
+    peak_mb = None
+heavy = [name for name in ('tkinter', 'pystray', 'PIL', 'sounddevice', 'numpy', 'pydub', 'requests') if name in sys.modules]
+print('RESULT ' + json.dumps({"seconds": elapsed, "peak_mb": peak_mb, "modules": heavy}))
+"""
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+def make_app_copy():
+    root = tempfile.mkdtemp(prefix='bench_startup_')
+    for name in os.listdir(APP_DIR):
+        if name.endswith(('.py', '.pyw')): shutil.copy2(os.path.join(APP_DIR, name), root)
+    for folder in ('templates', 'static'):
+        shutil.copytree(os.path.join(APP_DIR, folder), os.path.join(root, folder))
+    os.makedirs(os.path.join(root, 'rec'))
+    from werkzeug.security import generate_password_hash
+    with open(os.path.join(root, '.env'), 'w', encoding='utf-8') as f:
+        # API не используется, но заданные ключи не дают обычному режиму открыть окно первичной настройки
+        f.write(f"CRS_API_URL=http://127.0.0.1:9\nCRS_API_KEY=bench\nCRS_USERNAME=bench\nCRS_PASSWORD_HASH={generate_password_hash('bench')}\n")
+    return root
+
+def write_settings(root, port):
+    with open(os.path.join(root, 'record_server_settings.json'), 'w', encoding='utf-8') as f:
+        json.dump({"port": port, "server_enabled": True, "autostart_server": True}, f)
+
+def rss_mb(pid):
+    try:
+        with open(f'/proc/{pid}/status', encoding='ascii') as f:
+            for line in f:
+                if line.startswith('VmRSS:'): return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    try:
+        import psutil  # type: ignore[import-untyped]
+        return psutil.Process(pid).memory_info().rss / 1024 ** 2
+    except Exception:
+        return None
+
+def run_server(root, args, idle_seconds):
+    """Returns (seconds to first response, idle RSS in MB) or None if the server did not come up."""
+    port = free_port()
+    write_settings(root, port)
+    started = time.perf_counter()
+    process = subprocess.Popen([sys.executable, 'recordServer.pyw'] + args, cwd=root,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        while time.perf_counter() - started < START_TIMEOUT:
+            if process.poll() is not None: return None
+            try:
+                with urllib.request.urlopen(f'http://127.0.0.1:{port}/login', timeout=1) as response:
+                    response.read()
+                break
+            except OSError:
+                time.sleep(0.01)
+        else:
+            return None
+        ready = time.perf_counter() - started
+        time.sleep(idle_seconds)
+        return ready, rss_mb(process.pid)
+    finally:
+        process.terminate()
+        try: process.wait(timeout=10)
+        except subprocess.TimeoutExpired: process.kill()
+
+def probe_imports(root, args):
+    result = subprocess.run([sys.executable, '-c', IMPORT_PROBE] + args, cwd=root, capture_output=True, text=True)
+    for line in result.stdout.splitlines():
+        if line.startswith('RESULT '): return json.loads(line[7:])
+    error = (result.stderr.strip().splitlines() or ['?'])[-1]
+    return {"error": error}
+
+def describe(values, unit, digits):
+    values = [v for v in values if v is not None]
+    if not values: return '-'
+    return f"{statistics.median(values):.{digits}f} {unit}"
+
+def main():
+    repeats = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    idle_seconds = float(sys.argv[2]) if len(sys.argv) > 2 else 3
+    root = make_app_copy()
+    try:
+        print("Импорт recordServer.pyw (медиана из 3):")
+        print(f"{'режим':<10} {'время':>10} {'пик RSS':>10}  тяжелые модули")
+        for name, args in MODES:
+            probes = [probe_imports(root, args) for _ in range(3)]
+            if "error" in probes[0]:
+                print(f"{name:<10} {'-':>10} {'-':>10}  недоступен: {probes[0]['error']}")
+                continue
+            seconds = describe([p["seconds"] * 1000 for p in probes], 'мс', 0)
+            rss = describe([p["peak_mb"] for p in probes], 'МБ', 1)
+            print(f"{name:<10} {seconds:>10} {rss:>10}  {', '.join(probes[0]['modules']) or '—'}")
+
+        print(f"\nЗапуск сервера (медиана из {repeats}, RSS после {idle_seconds:g} с простоя):")
+        print(f"{'режим':<10} {'до ответа':>10} {'RSS':>10}")
+        for name, args in MODES:
+            runs = [run_server(root, args, idle_seconds) for _ in range(repeats)]
+            runs = [r for r in runs if r is not None]
+            if not runs:
+                print(f"{name:<10} {'-':>10} {'-':>10}  не запустился (нет рабочего стола или аудиоустройств?)")
+                continue
+            print(f"{name:<10} {describe([r[0] * 1000 for r in runs], 'мс', 0):>10} {describe([r[1] for r in runs], 'МБ', 1):>10}")
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+if __name__ == '__main__':
+    main()
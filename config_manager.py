@@ -1,6 +1,13 @@
 import os
 import json
+import copy
+import uuid
+import sqlite3
+import atexit
 import secrets
+import tempfile
+import threading
+from types import MappingProxyType
 from dotenv import load_dotenv
 
 from app_state import get_application_path, settings, contacts_data
@@ -9,6 +16,10 @@ from app_state import get_application_path, settings, contacts_data
 SETTINGS_FILE = os.path.join(get_application_path(), 'record_server_settings.json')
 DEFAULT_SETTINGS = {
     "port": 8288,
+    "server_mode": "pooled", # "pooled" — пул обработчиков с keep-alive, "threaded" — поток на каждый запрос
+    "server_workers": 16,
+    "server_queue_size": 64,
+    "slow_request_ms": 1000, # Запросы дольше этого попадают в журнал со снятыми стеками
     "server_enabled": True,
     "autostart_server": True,
     "lan_accessible": False,
@@ -18,9 +29,14 @@ DEFAULT_SETTINGS = {
         {
             "pattern": "*.html",
             "prompt": "\n--- НАЧАЛО файла @{filename} ---\n{content}\n--- КОНЕЦ файла @{filename} ---\n",
-            "enabled": True
+            "enabled": True,
+            "priority": 0,
+            "truncate": "rows"
         }
     ],
+    "prompt_budget": {"enabled": False, "unit": "chars", "limit": 60000},
+    # Политика хранения записей; 0 отключает шаг (см. storage_policy.py)
+    "storage_policy": {"enabled": False, "interval_hours": 24, "compress_after_days": 7, "archive_after_days": 0, "quota_gb": 0},
     "add_meeting_date": True,
     "meeting_date_source": "current",
     "meeting_name_templates": [
@@ -38,70 +54,426 @@ DEFAULT_SETTINGS = {
     "selected_contacts": []
 }
 
+SETTINGS_SAVE_DELAY = 0.5 # Секунды, в течение которых изменения копятся перед записью на диск
+
+def _atomic_write_json(path, data, **dump_kwargs):
+    """Writes JSON to a temp file in the same directory and renames it over the target."""
+    directory = os.path.dirname(path) or '.'
+    fd, tmp_path = tempfile.mkstemp(prefix='.' + os.path.basename(path) + '.', suffix='.tmp', dir=directory)
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(data, f, **dump_kwargs)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        try: os.remove(tmp_path)
+        except OSError: pass
+        raise
+
+def _file_stamp(path):
+    """Returns (mtime_ns, size) of the file or None if it does not exist."""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+class SettingsStore:
+    """
+    Versioned in-memory settings with debounced write-behind persistence.
+
+    Readers get immutable snapshots; every update publishes a new snapshot and
+    bumps the version. The legacy shared `settings` dict is kept in sync in place
+    (without clearing it) for code that still reads it directly. The file is only
+    re-read when its mtime/size differ from what we last read or wrote.
+    """
+
+    def __init__(self, path, defaults, live_view, save_delay=SETTINGS_SAVE_DELAY):
+        self.path = path
+        self.defaults = defaults
+        self.save_delay = save_delay
+        self._live_view = live_view
+        self._lock = threading.RLock()
+        self._snapshot = MappingProxyType({})
+        self._version = 0
+        self._disk_stamp = None
+        self._dirty = False
+        self._timer = None
+
+    @property
+    def version(self):
+        return self._version
+
+    def snapshot(self):
+        """Returns the current read-only settings mapping. Do not mutate nested values."""
+        return self._snapshot
+
+    def _publish(self, new_settings):
+        frozen = copy.deepcopy(dict(new_settings))
+        with self._lock:
+            self._snapshot = MappingProxyType(frozen)
+            self._version += 1
+            # Обновляем общий словарь без очистки, чтобы читатели не увидели его пустым
+            self._live_view.update(copy.deepcopy(frozen))
+            for key in [k for k in self._live_view if k not in frozen]:
+                self._live_view.pop(key, None)
+
+    def replace(self, new_settings):
+        """Replaces all settings and schedules a write."""
+        with self._lock:
+            self._publish(new_settings)
+            self._schedule_save()
+            return self._version
+
+    def update(self, changes):
+        """Atomically merges `changes` into the current settings and schedules a write."""
+        with self._lock:
+            merged = dict(self._snapshot)
+            merged.update(changes)
+            self._publish(merged)
+            self._schedule_save()
+            return self._version
+
+    def _schedule_save(self):
+        self._dirty = True
+        if self._timer:
+            self._timer.cancel()
+        self._timer = threading.Timer(self.save_delay, self.flush)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def flush(self):
+        """Writes pending changes to disk immediately."""
+        with self._lock:
+            if self._timer:
+                self._timer.cancel()
+                self._timer = None
+            if not self._dirty:
+                return
+            _atomic_write_json(self.path, dict(self._snapshot), indent=4)
+            self._dirty = False
+            self._disk_stamp = _file_stamp(self.path)
+        print("Settings saved.")
+
+    def _read_from_disk(self):
+        """Returns (settings, needs_write) normalized against the defaults."""
+        loaded = None
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, 'r') as f:
+                    loaded = json.load(f)
+            except (json.JSONDecodeError, TypeError, OSError):
+                loaded = None
+        result = dict(loaded) if isinstance(loaded, dict) else copy.deepcopy(self.defaults)
+        needs_write = not isinstance(loaded, dict)
+        for key, value in self.defaults.items():
+            if key not in result:
+                result[key] = copy.deepcopy(value)
+                needs_write = True
+        if not result.get("secret_key"):
+            result["secret_key"] = secrets.token_hex(16)
+            needs_write = True
+        return result, needs_write
+
+    def reload_if_changed(self):
+        """Re-reads the file only if it changed since the last read or write. Returns True if reloaded."""
+        stamp = _file_stamp(self.path)
+        with self._lock:
+            if self._version and (self._dirty or stamp == self._disk_stamp):
+                return False
+            loaded, needs_write = self._read_from_disk()
+            self._disk_stamp = stamp
+            self._publish(loaded)
+            if needs_write:
+                # Создаем файл или добавляем недостающие ключи сразу, без задержки
+                self._dirty = True
+                self.flush()
+            return True
+
+settings_store = SettingsStore(SETTINGS_FILE, DEFAULT_SETTINGS, settings)
+atexit.register(settings_store.flush)
+
 def load_settings():
-    """Loads settings from the JSON file or creates it with defaults."""
-    global settings
-    if os.path.exists(SETTINGS_FILE):
-        try:
-            with open(SETTINGS_FILE, 'r') as f:
-                loaded_settings = json.load(f)
-            if isinstance(loaded_settings, dict):
-                settings.clear()
-                settings.update(loaded_settings)
-            else:
-                settings.clear()
-                settings.update(DEFAULT_SETTINGS.copy())
-            for key, value in DEFAULT_SETTINGS.items():
-                settings.setdefault(key, value)
-        except (json.JSONDecodeError, TypeError):
-            settings.clear()
-            settings.update(DEFAULT_SETTINGS.copy())
-    else:
-        # Если файл настроек не существует, создаем его с настройками по умолчанию.
-        settings.clear()
-        settings.update(DEFAULT_SETTINGS.copy())
-    if not settings.get("secret_key"):
-        settings["secret_key"] = secrets.token_hex(16)
-    save_settings(settings.copy()) # Сохраняем, чтобы создать файл или добавить недостающие ключи.
+    """Loads settings from the JSON file (only if it changed on disk) or creates it with defaults."""
+    settings_store.reload_if_changed()
 
 def save_settings(new_settings):
-    """Saves settings to the JSON file."""
-    global settings
-    data_to_save = new_settings.copy()
-    settings.clear()
-    settings.update(data_to_save)
-    with open(SETTINGS_FILE, 'w') as f:
-        json.dump(data_to_save, f, indent=4)
-    print("Settings saved.")
+    """Replaces the settings; the file is written after a short debounce delay."""
+    settings_store.replace(new_settings)
+
+def update_settings(changes):
+    """Atomically merges `changes` into the settings; the file is written after a short debounce delay."""
+    return settings_store.update(changes)
+
+def get_settings_snapshot():
+    """Returns an immutable snapshot of the current settings, picking up external edits of the file."""
+    settings_store.reload_if_changed()
+    return settings_store.snapshot()
+
+def flush_settings():
+    """Writes pending settings changes to disk immediately."""
+    settings_store.flush()
 
 # --- Contacts Management ---
 CONTACTS_FILE = os.path.join(get_application_path(), 'contacts.json')
+CONTACTS_DB_FILE = os.path.join(get_application_path(), 'contacts.db')
+DEFAULT_GROUP_NAME = 'Без группы'
 
-def load_contacts():
-    """Loads contacts from the JSON file or creates it if it doesn't exist."""
-    global contacts_data
-    if os.path.exists(CONTACTS_FILE):
+_CONTACTS_SCHEMA = """
+CREATE TABLE IF NOT EXISTS contact_groups (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS contacts (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    id TEXT NOT NULL UNIQUE,
+    group_id INTEGER NOT NULL REFERENCES contact_groups(id) ON DELETE CASCADE,
+    name TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS contacts_group_idx ON contacts(group_id);
+"""
+
+class ContactsStore:
+    """
+    Contacts directory backed by SQLite with in-memory id and group indexes.
+
+    Every change is a single small transaction instead of a rewrite of the whole
+    file. The legacy shared `contacts_data` dict ({"groups": [...]}) is kept in
+    sync in place for code that still reads it directly. contacts.json is
+    imported on first start and stays available as an import/export format.
+    """
+
+    def __init__(self, db_path, json_path, live_view):
+        self.db_path = db_path
+        self.json_path = json_path
+        self._live_view = live_view
+        self._lock = threading.RLock()
+        self._conn = None
+        self._version = 0
+        self._groups = {}     # Имя группы -> {"name", "contacts"} (тот же объект, что в live_view)
+        self._group_ids = {}  # Имя группы -> id строки в БД
+        self._contacts = {}   # id участника -> (contact, group)
+
+    @property
+    def version(self):
+        return self._version
+
+    def _connect(self):
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.db_path, check_same_thread=False, isolation_level=None)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute("PRAGMA foreign_keys=ON")
+            self._conn.executescript(_CONTACTS_SCHEMA)
+        return self._conn
+
+    def _write(self, statements):
+        """Runs (sql, params) pairs in one transaction and bumps the version."""
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
         try:
-            with open(CONTACTS_FILE, 'r', encoding='utf-8') as f:
-                loaded = json.load(f)
-            contacts_data.clear()
-            contacts_data.update(loaded)
-            if "groups" not in contacts_data:
-                contacts_data["groups"] = []
-        except (json.JSONDecodeError, TypeError):
-            contacts_data.clear()
-            contacts_data["groups"] = []
-    else:
-        contacts_data.clear()
-        contacts_data["groups"] = []
-        save_contacts(contacts_data)
+            cursors = [conn.execute(sql, params) for sql, params in statements]
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        self._version += 1
+        return cursors
+
+    def _rebuild_indexes(self):
+        conn = self._connect()
+        groups, group_ids, contacts = [], {}, {}
+        by_id = {}
+        for group_id, name in conn.execute("SELECT id, name FROM contact_groups ORDER BY id"):
+            group = {"name": name, "contacts": []}
+            groups.append(group)
+            group_ids[name] = group_id
+            by_id[group_id] = group
+        for contact_id, group_id, name in conn.execute("SELECT id, group_id, name FROM contacts ORDER BY seq"):
+            group = by_id[group_id]
+            contact = {"id": contact_id, "name": name}
+            group["contacts"].append(contact)
+            contacts[contact_id] = (contact, group)
+        self._groups = {g["name"]: g for g in groups}
+        self._group_ids = group_ids
+        self._contacts = contacts
+        self._live_view["groups"] = groups
+        for key in [k for k in self._live_view if k != "groups"]:
+            self._live_view.pop(key, None)
+        self._version += 1
+
+    @staticmethod
+    def _normalize(data):
+        """Validates data in the contacts.json format and returns [(group_name, [(id, name), ...]), ...]."""
+        groups, seen_groups, seen_ids = [], {}, set()
+        for group in (data or {}).get("groups", []) or []:
+            if not isinstance(group, dict): continue
+            group_name = str(group.get("name") or DEFAULT_GROUP_NAME).strip() or DEFAULT_GROUP_NAME
+            if group_name not in seen_groups:
+                seen_groups[group_name] = []
+                groups.append((group_name, seen_groups[group_name]))
+            for contact in group.get("contacts", []) or []:
+                if not isinstance(contact, dict) or not str(contact.get("name") or "").strip(): continue
+                contact_id = str(contact.get("id") or uuid.uuid4())
+                if contact_id in seen_ids: contact_id = str(uuid.uuid4())
+                seen_ids.add(contact_id)
+                seen_groups[group_name].append((contact_id, str(contact["name"]).strip()))
+        return groups
+
+    def replace(self, data):
+        """Replaces the whole directory with data in the contacts.json format (import)."""
+        groups = self._normalize(data)
+        with self._lock:
+            conn = self._connect()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.execute("DELETE FROM contacts")
+                conn.execute("DELETE FROM contact_groups")
+                for group_name, contacts in groups:
+                    group_id = conn.execute("INSERT INTO contact_groups(name) VALUES (?)", (group_name,)).lastrowid
+                    conn.executemany(
+                        "INSERT INTO contacts(id, group_id, name) VALUES (?, ?, ?)",
+                        [(contact_id, group_id, name) for contact_id, name in contacts]
+                    )
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            self._rebuild_indexes()
+
+    def load(self):
+        """Opens the database, importing contacts.json on first start."""
+        with self._lock:
+            is_new = not os.path.exists(self.db_path)
+            self._connect()
+            if is_new and os.path.exists(self.json_path):
+                try:
+                    with open(self.json_path, 'r', encoding='utf-8') as f:
+                        self.replace(json.load(f))
+                    print(f"Contacts imported from {self.json_path}.")
+                    return
+                except (json.JSONDecodeError, TypeError, OSError) as e:
+                    print(f"Не удалось импортировать контакты из {self.json_path}: {e}")
+            self._rebuild_indexes()
+
+    def export(self):
+        """Returns the directory in the contacts.json format."""
+        with self._lock:
+            return {"groups": [
+                {"name": g["name"], "contacts": [dict(c) for c in g["contacts"]]} for g in self._live_view.get("groups", [])
+            ]}
+
+    def export_to_file(self, path=None):
+        _atomic_write_json(path or self.json_path, self.export(), indent=4, ensure_ascii=False)
+
+    # --- Чтение ---
+    def has_group(self, name):
+        return name in self._groups
+
+    def group_names(self):
+        with self._lock:
+            return sorted(self._groups)
+
+    def get_contact(self, contact_id):
+        entry = self._contacts.get(contact_id)
+        return dict(entry[0]) if entry else None
+
+    def contact_ids_in_group(self, name):
+        with self._lock:
+            group = self._groups.get(name)
+            return {c["id"] for c in group["contacts"]} if group else set()
+
+    def participants_by_group(self, contact_ids):
+        """Resolves selected contact ids to {group_name: [names]} using the id index."""
+        result = {}
+        with self._lock:
+            for contact_id in contact_ids:
+                entry = self._contacts.get(contact_id)
+                if entry: result.setdefault(entry[1]["name"], []).append(entry[0]["name"])
+        return result
+
+    # --- Изменения ---
+    def add_group(self, name):
+        """Creates an empty group. Returns False if it already exists."""
+        with self._lock:
+            if name in self._groups: return False
+            self._add_group_locked(name)
+            return True
+
+    def _add_group_locked(self, name):
+        cursor, = self._write([("INSERT INTO contact_groups(name) VALUES (?)", (name,))])
+        group = {"name": name, "contacts": []}
+        self._groups[name] = group
+        self._group_ids[name] = cursor.lastrowid
+        self._live_view.setdefault("groups", []).append(group)
+        return group
+
+    def add_contact(self, name, group_name=DEFAULT_GROUP_NAME):
+        """Adds a contact (creating the group if needed) and returns it."""
+        with self._lock:
+            group = self._groups.get(group_name) or self._add_group_locked(group_name)
+            contact = {"id": str(uuid.uuid4()), "name": name}
+            self._write([("INSERT INTO contacts(id, group_id, name) VALUES (?, ?, ?)", (contact["id"], self._group_ids[group_name], name))])
+            group["contacts"].append(contact)
+            self._contacts[contact["id"]] = (contact, group)
+            return dict(contact)
+
+    def rename_contact(self, contact_id, new_name):
+        with self._lock:
+            entry = self._contacts.get(contact_id)
+            if not entry: return False
+            self._write([("UPDATE contacts SET name = ? WHERE id = ?", (new_name, contact_id))])
+            entry[0]["name"] = new_name
+            return True
+
+    def delete_contact(self, contact_id):
+        with self._lock:
+            entry = self._contacts.get(contact_id)
+            if not entry: return False
+            self._write([("DELETE FROM contacts WHERE id = ?", (contact_id,))])
+            del self._contacts[contact_id]
+            contact, group = entry
+            group["contacts"].remove(contact)
+            return True
+
+    def rename_group(self, old_name, new_name):
+        with self._lock:
+            group = self._groups.get(old_name)
+            if group is None or new_name in self._groups: return False
+            self._write([("UPDATE contact_groups SET name = ? WHERE id = ?", (new_name, self._group_ids[old_name]))])
+            group["name"] = new_name
+            self._groups[new_name] = self._groups.pop(old_name)
+            self._group_ids[new_name] = self._group_ids.pop(old_name)
+            return True
+
+    def delete_group(self, name):
+        """Deletes a group with its contacts. Returns the ids of removed contacts, or None if there is no such group."""
+        with self._lock:
+            group = self._groups.get(name)
+            if group is None: return None
+            self._write([
+                ("DELETE FROM contacts WHERE group_id = ?", (self._group_ids[name],)),
+                ("DELETE FROM contact_groups WHERE id = ?", (self._group_ids[name],)),
+            ])
+            removed = {c["id"] for c in group["contacts"]}
+            for contact_id in removed:
+                self._contacts.pop(contact_id, None)
+            del self._groups[name]
+            del self._group_ids[name]
+            self._live_view["groups"] = [g for g in self._live_view.get("groups", []) if g is not group]
+            return removed
+
+contacts_store = ContactsStore(CONTACTS_DB_FILE, CONTACTS_FILE, contacts_data)
+
+def load_contacts():
+    """Opens the contacts database (importing contacts.json on first start)."""
+    contacts_store.load()
 
 def save_contacts(new_contacts_data):
-    """Saves contacts to the JSON file."""
-    global contacts_data
-    # Создаем копию, чтобы избежать проблем с изменением объекта, по которому итерируемся
-    data_to_save = new_contacts_data.copy()
-    contacts_data.clear() # Очищаем глобальный объект
-    contacts_data.update(data_to_save) # Обновляем его свежими данными
-    with open(CONTACTS_FILE, 'w', encoding='utf-8') as f:
-        json.dump(data_to_save, f, indent=4, ensure_ascii=False)
\ No newline at end of file
+    """Replaces all contacts with data in the contacts.json format."""
+    contacts_store.replace(new_contacts_data)
+
+def export_contacts(path=None):
+    """Writes the contacts in the contacts.json format (to CONTACTS_FILE by default)."""
+    contacts_store.export_to_file(path)
@@ -0,0 +1,291 @@
+import os
+import sys
+import time
+import bisect
+import logging
+import threading
+import tracemalloc
+from collections import Counter
+
+from flask import request, g
+
+from app_state import settings
+
+# Верхние границы корзин гистограммы задержек, мс; последняя корзина — все, что дольше
+LATENCY_BUCKETS_MS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+SLOW_REQUEST_MS = 1000  # Порог медленного запроса по умолчанию (settings["slow_request_ms"])
+SLOW_SAMPLE_INTERVAL = 0.05  # Как часто снимать стек с медленного запроса, с
+SLOW_MAX_SAMPLES = 200
+PROFILE_MAX_SECONDS = 300
+PROFILE_INTERVAL_MS = 10
+TRACEMALLOC_FRAMES = 25
+_THIS_FILE = os.path.abspath(__file__)
+
+def _frame_stack(frame, limit=64):
+    """Stack of a frame as 'func (file:line)' strings, outermost first."""
+    stack = []
+    while frame is not None and len(stack) < limit:
+        code = frame.f_code
+        stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+        frame = frame.f_back
+    stack.reverse()
+    return stack
+
+def _thread_names():
+    return {thread.ident: thread.name for thread in threading.enumerate()}
+
+class LatencyHistogram:
+    """Fixed-bucket latency histogram; percentiles are the upper bound of the bucket they fall in."""
+
+    def __init__(self):
+        self.buckets = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+        self.count = 0
+        self.errors = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def add(self, ms, error=False):
+        self.buckets[bisect.bisect_left(LATENCY_BUCKETS_MS, ms)] += 1
+        self.count += 1
+        self.errors += bool(error)
+        self.total_ms += ms
+        self.max_ms = max(self.max_ms, ms)
+
+    def percentile(self, fraction):
+        if not self.count: return None
+        rank, seen = fraction * self.count, 0
+        for index, count in enumerate(self.buckets):
+            seen += count
+            if seen >= rank: return LATENCY_BUCKETS_MS[index] if index < len(LATENCY_BUCKETS_MS) else round(self.max_ms, 1)
+        return round(self.max_ms, 1)
+
+    def to_dict(self):
+        labels = [f"<={bound}" for bound in LATENCY_BUCKETS_MS] + [f">{LATENCY_BUCKETS_MS[-1]}"]
+        return {
+            "count": self.count, "errors": self.errors,
+            "avg_ms": round(self.total_ms / self.count, 1) if self.count else None, "max_ms": round(self.max_ms, 1),
+            "p50_ms": self.percentile(0.5), "p95_ms": self.percentile(0.95), "p99_ms": self.percentile(0.99),
+            "buckets_ms": {label: count for label, count in zip(labels, self.buckets) if count},
+        }
+
+class RequestMetrics:
+    """
+    Per-endpoint latency histograms and slow request reports.
+
+    While a request runs longer than slow_request_ms, a watchdog thread
+    samples the stack of the thread serving it; when such a request
+    finishes, it is logged together with its most frequent stacks, which
+    shows where the time went (a query, prompt building, or waiting for
+    the GIL held by another thread).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms = {}
+        self._active = {}  # ident потока -> [endpoint, начало, Counter стеков]
+        self._watchdog = None
+        self.started_at = time.time()
+
+    def init_app(self, app):
+        app.before_request(self._before)
+        app.after_request(self._record_status)
+        app.teardown_request(self._teardown)
+
+    @staticmethod
+    def slow_threshold_ms():
+        return float(settings.get("slow_request_ms") or SLOW_REQUEST_MS)
+
+    def _before(self):
+        g.request_started = time.perf_counter()
+        with self._lock:
+            self._active[threading.get_ident()] = [request.endpoint or "<unmatched>", g.request_started, None]
+            if self._watchdog is None:
+                self._watchdog = threading.Thread(target=self._watch, name='slow-request-watchdog', daemon=True)
+                self._watchdog.start()
+
+    def _teardown(self, exc):
+        started = g.pop('request_started', None)
+        if started is None: return
+        ms = (time.perf_counter() - started) * 1000
+        endpoint = request.endpoint or "<unmatched>"
+        status = getattr(g, 'response_status', None)
+        with self._lock:
+            active = self._active.pop(threading.get_ident(), None)
+            histogram = self._histograms.get(endpoint)
+            if histogram is None: histogram = self._histograms[endpoint] = LatencyHistogram()
+            histogram.add(ms, error=exc is not None or (status or 0) >= 500)
+        if ms >= self.slow_threshold_ms():
+            samples = active[2] if active else None
+            top = "\n".join(f"  {count} x {' > '.join(stack[-8:])}" for stack, count in samples.most_common(3)) if samples else "  (стеки не сняты)"
+            logging.warning(f"Медленный запрос {request.method} {request.path} ({endpoint}): {ms:.0f} мс. Частые стеки:\n{top}")
+
+    def _record_status(self, response):
+        g.response_status = response.status_code
+        return response
+
+    def _watch(self):
+        while True:
+            time.sleep(SLOW_SAMPLE_INTERVAL)
+            now = time.perf_counter()
+            threshold = self.slow_threshold_ms() / 1000
+            with self._lock:
+                slow = [(ident, entry) for ident, entry in self._active.items() if now - entry[1] >= threshold]
+            if not slow: continue
+            frames = sys._current_frames()
+            with self._lock:
+                for ident, entry in slow:
+                    frame = frames.get(ident)
+                    if frame is None or self._active.get(ident) is not entry: continue
+                    if entry[2] is None: entry[2] = Counter()
+                    if sum(entry[2].values()) < SLOW_MAX_SAMPLES: entry[2][tuple(_frame_stack(frame))] += 1
+            del frames
+
+    def snapshot(self):
+        with self._lock:
+            endpoints = {name: histogram.to_dict() for name, histogram in sorted(self._histograms.items())}
+            in_flight = len(self._active)
+        return {"since": self.started_at, "slow_request_ms": self.slow_threshold_ms(), "in_flight": in_flight, "endpoints": endpoints}
+
+    def reset(self):
+        with self._lock:
+            self._histograms = {}
+            self.started_at = time.time()
+
+class SamplingProfiler:
+    """
+    Statistical profiler: samples the stacks of all threads every interval
+    for a limited time. Negligible overhead when not running.
+
+    The sampler is a Python thread, so it needs the GIL to take a sample;
+    how late it wakes up (sampler_lag_ms) shows how long other threads hold
+    the GIL.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._result = None
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, seconds, interval_ms=PROFILE_INTERVAL_MS):
+        """Starts sampling; returns False if a run is already in progress."""
+        with self._lock:
+            if self.running: return False
+            seconds = min(max(float(seconds), 0.1), PROFILE_MAX_SECONDS)
+            interval = max(float(interval_ms), 1) / 1000
+            self._stop.clear()
+            self._result = {
+                "status": "running", "started_at": time.time(), "seconds": seconds, "interval_ms": interval * 1000,
+                "samples": 0, "sampler_lag_ms": None, "threads": {}, "functions": [], "stacks": [],
+            }
+            self._thread = threading.Thread(target=self._run, args=(seconds, interval), name='sampling-profiler', daemon=True)
+            self._thread.start()
+            return True
+
+    def stop(self):
+        self._stop.set()
+        thread = self._thread
+        if thread is not None: thread.join(timeout=5)
+        return self.result()
+
+    def result(self):
+        with self._lock:
+            return dict(self._result) if self._result else {"status": "idle"}
+
+    def _run(self, seconds, interval):
+        own = threading.get_ident()
+        stacks, threads = Counter(), Counter()
+        samples, lag_total, lag_max = 0, 0.0, 0.0
+        deadline = time.perf_counter() + seconds
+        expected = time.perf_counter()
+        while not self._stop.is_set() and expected < deadline:
+            now = time.perf_counter()
+            lag = max(now - expected, 0.0)
+            lag_total, lag_max = lag_total + lag, max(lag_max, lag)
+            names = _thread_names()
+            for ident, frame in sys._current_frames().items():
+                if ident == own: continue
+                name = names.get(ident, str(ident))
+                stacks[(name,) + tuple(_frame_stack(frame))] += 1
+                threads[name] += 1
+            samples += 1
+            expected = now + interval
+            self._stop.wait(max(expected - time.perf_counter(), 0))
+        # Собственное время функции — сколько раз она была на вершине стека
+        functions = Counter()
+        for stack, count in stacks.items():
+            if len(stack) > 1: functions[stack[-1]] += count
+        with self._lock:
+            self._result.update({
+                "status": "done", "finished_at": time.time(), "samples": samples,
+                "sampler_lag_ms": {"avg": round(lag_total / samples * 1000, 2) if samples else None, "max": round(lag_max * 1000, 2)},
+                "threads": dict(threads.most_common()),
+                "functions": [{"function": function, "samples": count} for function, count in functions.most_common(50)],
+                # Формат collapsed stacks: подходит для flamegraph.pl и speedscope
+                "stacks": [f"{';'.join(stack)} {count}" for stack, count in stacks.most_common(500)],
+            })
+
+class AllocationTracker:
+    """tracemalloc wrapper: start() takes a baseline, diff() compares the current heap with it."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._baseline = None
+
+    @property
+    def running(self):
+        return tracemalloc.is_tracing()
+
+    def start(self):
+        with self._lock:
+            if not tracemalloc.is_tracing(): tracemalloc.start(TRACEMALLOC_FRAMES)
+            self._baseline = self._snapshot()
+
+    def stop(self):
+        with self._lock:
+            self._baseline = None
+            tracemalloc.stop()
+
+    @staticmethod
+    def _snapshot():
+        # Собственные выделения tracemalloc и этого модуля не интересны
+        return tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, _THIS_FILE),
+        ))
+
+    def diff(self, limit=30, group_by='lineno'):
+        """Top allocation changes since start(), or None if tracing is off."""
+        with self._lock:
+            if not tracemalloc.is_tracing() or self._baseline is None: return None
+            snapshot = self._snapshot()
+            current, peak = tracemalloc.get_traced_memory()
+            stats = snapshot.compare_to(self._baseline, group_by)
+        return {
+            "traced_bytes": current, "peak_bytes": peak,
+            "top": [{
+                "location": str(stat.traceback[0]) if stat.traceback else "?",
+                "size_bytes": stat.size, "size_diff_bytes": stat.size_diff,
+                "count": stat.count, "count_diff": stat.count_diff,
+            } for stat in stats[:limit]],
+        }
+
+def thread_dump():
+    """Stacks of all threads (recorder, mixer, HTTP workers, batch jobs...), main thread first."""
+    frames = sys._current_frames()
+    dump = []
+    for thread in threading.enumerate():
+        frame = frames.get(thread.ident)
+        dump.append({
+            "name": thread.name, "ident": thread.ident, "daemon": thread.daemon,
+            "stack": _frame_stack(frame) if frame is not None else [],
+        })
+    dump.sort(key=lambda entry: (entry["name"] != "MainThread", entry["name"]))
+    return dump
+
+request_metrics = RequestMetrics()
+sampling_profiler = SamplingProfiler()
+allocation_tracker = AllocationTracker()
@@ -0,0 +1,205 @@
+import re
+from html.parser import HTMLParser
+from html.entities import html5 as _HTML5_ENTITIES
+
+# Теги, которые сохраняются в очищенном HTML. Все остальные теги "разворачиваются" (остается только их текст).
+ALLOWED_TAGS = frozenset({'table', 'thead', 'tbody', 'tfoot', 'tr', 'th', 'td'})
+CELL_TAGS = frozenset({'td', 'th'})
+# Содержимое этих тегов выбрасывается целиком
+DROPPED_TAGS = frozenset({'script', 'style'})
+# Пустые элементы: html.parser не присылает для них закрывающих тегов
+VOID_TAGS = frozenset({
+    'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input', 'keygen', 'link', 'menuitem', 'meta',
+    'param', 'source', 'track', 'wbr', 'basefont', 'bgsound', 'command', 'frame', 'image', 'isindex',
+    'nextid', 'spacer',
+})
+PRESERVE_WHITESPACE_TAGS = frozenset({'pre', 'textarea'})
+_ASCII_SPACES = '\x20\x0a\x09\x0c\x0d'
+
+_NUMERIC_REFERENCE_WITH_FOLLOWING_DATA = re.compile(r'^([0-9]+)(.*)', re.S)
+_HEX_REFERENCE_WITH_FOLLOWING_DATA = re.compile(r'^([0-9a-fA-F]+)(.*)', re.S)
+
+def _numeric_character_reference(number):
+    """Resolves &#NNN; the way HTML parsers do: invalid code points become U+FFFD, C1 controls are read as Windows-1252."""
+    if number == 0 or number > 0x10ffff or 0xd800 <= number <= 0xdfff:
+        return '\ufffd'
+    if 0x80 <= number <= 0x9f:
+        try:
+            return bytes([number]).decode('windows-1252')
+        except UnicodeDecodeError:
+            pass
+    return chr(number)
+
+class TableHTMLExtractor(HTMLParser):
+    """
+    Single-pass HTML cleaner driven by the html.parser event stream.
+
+    Keeps only table markup (without attributes), flattens every table cell to
+    its text and drops script/style content. Produces the same output as the
+    previous BeautifulSoup-based cleaner without building a document tree: only
+    the stack of open tags and the text of the current cell are kept in memory.
+    """
+
+    def __init__(self):
+        super().__init__(convert_charrefs=False)
+        self._out = []
+        self._stack = []            # Имена открытых тегов
+        self._text = []             # Текст, накопленный с последнего события-тега
+        self._dropped_depth = 0     # Глубина вложенности в script/style
+        self._preserve_depth = 0    # Глубина вложенности в pre/textarea
+        self._template_depth = 0
+        self._cell_depth = 0        # Глубина вложенности в td/th
+        self._cell_parts = None     # Строки текущей ячейки верхнего уровня
+        self._closed_void_tags = [] # Пустые элементы, чей закрывающий тег (</br>) нужно пропустить
+
+    # --- Текст ---
+    def _flush_text(self):
+        """Closes the current text run, as a tree builder would when a node boundary is reached."""
+        if not self._text: return None
+        data = ''.join(self._text)
+        self._text = []
+        if not self._preserve_depth and not data.strip(_ASCII_SPACES):
+            data = '\n' if '\n' in data else ' '
+        return data
+
+    def _emit_text(self):
+        data = self._flush_text()
+        if data is None or self._dropped_depth: return
+        if self._cell_parts is not None:
+            if not self._template_depth:
+                stripped = data.strip()
+                if stripped: self._cell_parts.append(stripped)
+        else:
+            self._out.append(data)
+
+    def _emit_special(self, prefix, data, suffix, is_cell_text=False):
+        """
+        Comments, doctype, CDATA and processing instructions are kept as is outside
+        cells. Inside cells only CDATA contributes to the cell text.
+        """
+        self._emit_text()
+        self._text = [data]
+        data = self._flush_text()
+        if self._dropped_depth: return
+        if self._cell_parts is None:
+            self._out.append(prefix + data + suffix)
+        elif is_cell_text:
+            stripped = data.strip()
+            if stripped: self._cell_parts.append(stripped)
+
+    # --- Стек тегов ---
+    def _push(self, tag):
+        self._stack.append(tag)
+        if tag in DROPPED_TAGS: self._dropped_depth += 1
+        if tag in PRESERVE_WHITESPACE_TAGS: self._preserve_depth += 1
+        if tag == 'template': self._template_depth += 1
+        if self._dropped_depth: return
+        if tag in CELL_TAGS:
+            self._cell_depth += 1
+            if self._cell_depth == 1:
+                self._out.append(f'<{tag}>')
+                self._cell_parts = []
+        elif tag in ALLOWED_TAGS and self._cell_parts is None:
+            self._out.append(f'<{tag}>')
+
+    def _pop(self):
+        tag = self._stack.pop()
+        was_dropped = self._dropped_depth > 0
+        if tag in DROPPED_TAGS: self._dropped_depth -= 1
+        if tag in PRESERVE_WHITESPACE_TAGS: self._preserve_depth -= 1
+        if tag == 'template': self._template_depth -= 1
+        if was_dropped: return tag
+        if tag in CELL_TAGS:
+            self._cell_depth -= 1
+            if self._cell_depth == 0:
+                self._out.append(' '.join(self._cell_parts))
+                self._cell_parts = None
+                self._out.append(f'</{tag}>')
+        elif tag in ALLOWED_TAGS and self._cell_parts is None:
+            self._out.append(f'</{tag}>')
+        return tag
+
+    def _pop_to(self, tag):
+        if tag not in self._stack: return
+        while self._stack:
+            if self._pop() == tag: break
+
+    # --- События html.parser ---
+    def handle_starttag(self, tag, attrs):
+        self._emit_text()
+        if tag in VOID_TAGS:
+            self._closed_void_tags.append(tag)
+            return
+        self._push(tag)
+
+    def handle_startendtag(self, tag, attrs):
+        self._emit_text()
+        self._push(tag)
+        self._pop()
+
+    def handle_endtag(self, tag):
+        if tag in self._closed_void_tags:
+            # Лишний </br> после <br> не разрывает текущий текст
+            self._closed_void_tags.remove(tag)
+            return
+        self._emit_text()
+        self._pop_to(tag)
+
+    def handle_data(self, data):
+        self._text.append(data)
+
+    def handle_entityref(self, name):
+        character = _HTML5_ENTITIES.get(name + ';')
+        self._text.append(character if character is not None else f'&{name}')
+
+    def handle_charref(self, name):
+        is_hex = name[:1] in ('x', 'X')
+        digits = name[1:] if is_hex else name
+        regex = _HEX_REFERENCE_WITH_FOLLOWING_DATA if is_hex else _NUMERIC_REFERENCE_WITH_FOLLOWING_DATA
+        match = regex.match(digits)
+        if not match:
+            self._text.append(digits)
+            return
+        number, extra = match.groups()
+        self._text.append(_numeric_character_reference(int(number, 16 if is_hex else 10)) + extra)
+
+    def handle_comment(self, data):
+        self._emit_special('<!--', data, '-->')
+
+    def handle_decl(self, decl):
+        self._emit_special('<!DOCTYPE ', decl[len('DOCTYPE '):], '>\n')
+
+    def unknown_decl(self, data):
+        if data.upper().startswith('CDATA['):
+            self._emit_special('<![CDATA[', data[len('CDATA['):], ']]>', is_cell_text=True)
+        else:
+            self._emit_special('<!', data, '>')
+
+    def handle_pi(self, data):
+        self._emit_special('<?', data, '>')
+
+    def close(self):
+        super().close()
+        self._emit_text()
+        while self._stack:
+            self._pop()
+
+    def getvalue(self):
+        return ''.join(self._out)
+
+def _normalize_whitespace(cleaned_html):
+    cleaned_html = re.sub(r'(?<=>)\s*\n\s*(?=<)', '', cleaned_html)
+    return re.sub(r'\n{2,}', '\n', cleaned_html).strip()
+
+def clean_html_chunks(chunks):
+    """Cleans HTML fed as an iterable of text chunks (e.g. a file read block by block)."""
+    extractor = TableHTMLExtractor()
+    for chunk in chunks:
+        extractor.feed(chunk)
+    extractor.close()
+    return _normalize_whitespace(extractor.getvalue())
+
+def clean_html(html_content):
+    """Keeps only table markup from an HTML document; see TableHTMLExtractor."""
+    if not html_content: return ""
+    return clean_html_chunks((html_content,))
@@ -0,0 +1,127 @@
+import gzip
+import uuid
+import hashlib
+import threading
+from collections import OrderedDict
+
+from flask import request, jsonify, Response
+
+try:
+    import brotli  # type: ignore[import-untyped]
+except ImportError:
+    brotli = None  # type: ignore[assignment]
+
+COMPRESS_MIN_BYTES = 1024  # Меньшие ответы не сжимаем: выигрыш меньше заголовков и затрат на сжатие
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+RESPONSE_CACHE_SIZE = 256  # Сколько готовых тел ответов (по адресу запроса) держим в памяти
+
+# Версии хранилищ начинаются заново при каждом запуске: эпоха не дает старому ETag совпасть с новыми данными
+_EPOCH = uuid.uuid4().hex[:8]
+_ENCODING_SUFFIXES = {'br': '-br', 'gzip': '-gz'}
+
+class _ResponseCache:
+    """LRU of encoded response bodies: path -> (etag, {encoding: body})."""
+
+    def __init__(self, size):
+        self.size = size
+        self._lock = threading.Lock()
+        self._items = OrderedDict()
+
+    def get(self, key, etag, encoding):
+        with self._lock:
+            item = self._items.get(key)
+            if item is None or item[0] != etag: return None
+            self._items.move_to_end(key)
+            return item[1].get(encoding)
+
+    def put(self, key, etag, encoding, body):
+        with self._lock:
+            item = self._items.get(key)
+            if item is None or item[0] != etag:
+                item = (etag, {})
+                self._items[key] = item
+            item[1][encoding] = body
+            self._items.move_to_end(key)
+            while len(self._items) > self.size:
+                self._items.popitem(last=False)
+
+_response_cache = _ResponseCache(RESPONSE_CACHE_SIZE)
+
+def make_etag(key, version):
+    """Returns a strong ETag for the data `version` of resource `key`."""
+    digest = hashlib.sha1(repr((key, version)).encode('utf-8')).hexdigest()[:16]
+    return f'"{_EPOCH}-{digest}"'
+
+def _etag_matches(if_none_match, etag):
+    """Checks If-None-Match against an ETag, ignoring the suffix of the compressed variants."""
+    if not if_none_match: return False
+    if if_none_match.strip() == '*': return True
+    base = etag.strip('"')
+    for candidate in if_none_match.split(','):
+        candidate = candidate.strip()
+        if candidate.startswith('W/'): candidate = candidate[2:]
+        candidate = candidate.strip('"')
+        for suffix in _ENCODING_SUFFIXES.values():
+            if candidate.endswith(suffix): candidate = candidate[:-len(suffix)]
+        if candidate == base: return True
+    return False
+
+def choose_encoding(accept_encoding):
+    """Picks 'br', 'gzip' or 'identity' from an Accept-Encoding header."""
+    accepted = {}
+    for part in (accept_encoding or '').lower().split(','):
+        name, _, params = part.strip().partition(';')
+        quality = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try: quality = float(params[2:])
+            except ValueError: quality = 0.0
+        if name: accepted[name.strip()] = quality
+    for encoding in ('br', 'gzip'):
+        if encoding == 'br' and brotli is None: continue
+        if accepted.get(encoding, accepted.get('*', 0)) > 0: return encoding
+    return 'identity'
+
+def compress(body, encoding):
+    if encoding == 'br': return brotli.compress(body, quality=BROTLI_QUALITY)
+    if encoding == 'gzip': return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+    return body
+
+def cached_json(version, build):
+    """
+    Returns the JSON response for `build()` with conditional GET and
+    compression. `version` identifies the state of the underlying data: while
+    it stays the same, a client holding the ETag gets 304 Not Modified without
+    `build()` being called, and other clients get the cached encoded body.
+    With version=None the data has no reliable version: the body is built and
+    compressed on every call, without an ETag.
+    """
+    key = request.full_path
+    encoding = choose_encoding(request.headers.get('Accept-Encoding'))
+    headers = {'Vary': 'Accept-Encoding', 'Cache-Control': 'no-cache'}
+    if version is None:
+        body = jsonify(build()).get_data()
+        return _encoded_response(body, encoding, headers)
+
+    etag = make_etag(key, version)
+    if _etag_matches(request.headers.get('If-None-Match'), etag):
+        return Response(status=304, headers=dict(headers, ETag=etag))
+    cached = _response_cache.get(key, etag, encoding)
+    if cached is not None:
+        body, used_encoding = cached
+    else:
+        body = jsonify(build()).get_data()
+        used_encoding = encoding if len(body) >= COMPRESS_MIN_BYTES else 'identity'
+        body = compress(body, used_encoding)
+        _response_cache.put(key, etag, encoding, (body, used_encoding))
+    if used_encoding != 'identity':
+        headers['Content-Encoding'] = used_encoding
+        etag = etag[:-1] + _ENCODING_SUFFIXES[used_encoding] + '"'
+    return Response(body, mimetype='application/json', headers=dict(headers, ETag=etag))
+
+def _encoded_response(body, encoding, headers):
+    if encoding != 'identity' and len(body) >= COMPRESS_MIN_BYTES:
+        body = compress(body, encoding)
+        headers['Content-Encoding'] = encoding
+    return Response(body, mimetype='application/json', headers=headers)
@@ -1,5 +1,4 @@
 import os
-import requests
 import time
 import logging
 from pathlib import Path
@@ -7,14 +6,24 @@ from datetime import datetime
 import json
 from threading import Thread
 
-import app_state
 from app_state import settings, contacts_data
+from state_store import state_store
 from utils import build_final_prompt_addition
+from prompt_budget import describe_report
+from recordings_index import recordings_index
 
-def post_task(file_path, task_type, prompt_addition_str=None):
+RESULT_WAIT_TIMEOUT = 2 * 3600  # Предел ожидания результата: зависшая задача API не должна держать очередь вечно
+
+def api_configured():
+    return bool(os.getenv("CRS_API_URL") and os.getenv("CRS_API_KEY"))
+
+def post_task(file_path, task_type, prompt_addition_str=None, budget_report=None):
+    import requests  # Загружается при первой задаче: сервер без постобработки его не импортирует
     API_URL = os.getenv("CRS_API_URL")
     API_KEY = os.getenv("CRS_API_KEY")
-    if not API_URL or not API_KEY: return None
+    if not API_URL or not API_KEY:
+        logging.warning(f"Задача '{task_type}' не отправлена: не заданы CRS_API_URL и CRS_API_KEY")
+        return None
     try:
         with open(file_path, 'rb') as f:
             files = {'file': (os.path.basename(file_path), f)}
@@ -34,6 +43,8 @@ def post_task(file_path, task_type, prompt_addition_str=None):
             if 'prompt_addition' in log_data and log_data['prompt_addition']:
                 log_data['prompt_addition'] = log_data['prompt_addition'][:100] + '...'
             logging.info(f"Отправка задачи: файл='{os.path.basename(file_path)}', параметры={log_data}")
+            if task_type == 'protocol' and budget_report:
+                logging.info(f"Бюджет промпта для '{os.path.basename(file_path)}': {describe_report(budget_report)}")
 
             response = requests.post(f"{API_URL}/add_task", files=files, data=data, verify=False)
         if response.status_code == 202:
@@ -49,14 +60,18 @@ def post_task(file_path, task_type, prompt_addition_str=None):
         logging.error(f"Непредвиденная ошибка в post_task для задачи '{task_type}': {e}", exc_info=True)
         return None
 
-def poll_and_save_result(task_id, output_path):
+def poll_and_save_result(task_id, output_path, timeout=RESULT_WAIT_TIMEOUT):
+    """Waits for the task result and saves it; returns False on failure or after the timeout."""
+    import requests
     API_URL = os.getenv("CRS_API_URL")
     if not task_id: return False
-    while True:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
         try:
             response = requests.get(f"{API_URL}/get_result/{task_id}", timeout=10, verify=False)
             if response.status_code == 200:
                 with open(output_path, 'wb') as f: f.write(response.content)
+                recordings_index.refresh_path(output_path)
                 logging.info(f"Задача {task_id} успешно завершена. Результат сохранен в {output_path}")
                 return True
             elif response.status_code == 202: time.sleep(5)
@@ -66,25 +81,31 @@ def poll_and_save_result(task_id, output_path):
                 logging.error(f"Задача {task_id} провалена на сервере: {error_msg}")
                 return False
             else: time.sleep(10)
-        except requests.exceptions.RequestException as e:
+        except (requests.exceptions.RequestException, ValueError) as e:
             logging.warning(f"Ошибка соединения при проверке статуса задачи {task_id}: {e}. Повтор...")
             time.sleep(10)
+    logging.error(f"Задача {task_id} не завершилась за {timeout // 60} мин, ожидание прекращено")
+    return False
 
-def process_transcription_task(file_path):
-    app_state.is_post_processing = True
-    app_state.post_process_file_path = file_path
-    app_state.post_process_stage = "transcribe"
-    base_name, _ = os.path.splitext(file_path)
-    txt_output_path = base_name + ".txt"
-    transcription_task_id = post_task(file_path, "transcribe")
-    if transcription_task_id:
-        poll_and_save_result(transcription_task_id, txt_output_path)
-    app_state.is_post_processing = False
+def process_transcription_task(file_path, txt_output_path=None):
+    """Returns True if the transcription was saved (next to the audio unless txt_output_path is given)."""
+    state_store.update(is_post_processing=True, post_process_file_path=file_path, post_process_stage="transcribe")
+    try:
+        txt_output_path = txt_output_path or os.path.splitext(file_path)[0] + ".txt"
+        transcription_task_id = post_task(file_path, "transcribe")
+        return bool(transcription_task_id) and poll_and_save_result(transcription_task_id, txt_output_path)
+    finally:
+        state_store.update(is_post_processing=False)
 
 def process_protocol_task(txt_file_path):
-    app_state.is_post_processing = True
-    app_state.post_process_file_path = txt_file_path
-    app_state.post_process_stage = "protocol"
+    """Returns True if the protocol was saved."""
+    state_store.update(is_post_processing=True, post_process_file_path=txt_file_path, post_process_stage="protocol")
+    try:
+        return _run_protocol_task(txt_file_path)
+    finally:
+        state_store.update(is_post_processing=False)
+
+def _run_protocol_task(txt_file_path):
     txt_path = Path(txt_file_path)
     try:
         recording_date = datetime.strptime(txt_path.parent.name, '%Y-%m-%d')
@@ -93,21 +114,22 @@ def process_protocol_task(txt_file_path):
 
     # По умолчанию используем промпт из метаданных
     final_prompt_addition = ""
+    budget_report = None
     json_path = txt_path.with_suffix('.json')
     if os.path.exists(json_path):
         try:
             with open(json_path, 'r', encoding='utf-8') as f:
                 metadata = json.load(f)
                 final_prompt_addition = metadata.get('promptAddition', '')
+                budget_report = metadata.get('promptBudget')
         except Exception as e:
             logging.error(f"Не удалось прочитать promptAddition из {json_path}: {e}")
 
-    protocol_task_id = post_task(txt_file_path, "protocol", prompt_addition_str=final_prompt_addition)
-    if protocol_task_id:
-        base_name, _ = os.path.splitext(txt_file_path)
-        protocol_output_path = base_name + "_protocol.pdf"
-        poll_and_save_result(protocol_task_id, protocol_output_path)
-    app_state.is_post_processing = False
+    protocol_task_id = post_task(txt_file_path, "protocol", prompt_addition_str=final_prompt_addition, budget_report=budget_report)
+    if not protocol_task_id: return False
+    base_name, _ = os.path.splitext(txt_file_path)
+    protocol_output_path = base_name + "_protocol.pdf"
+    return poll_and_save_result(protocol_task_id, protocol_output_path)
 
 def process_recording_tasks(final_audio_path):
     process_transcription_task(final_audio_path)
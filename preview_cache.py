@@ -0,0 +1,105 @@
+import os
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+
+from config_manager import contacts_store
+
+def _folder_state(path):
+    """Returns a sorted list of (name, mtime_ns, size) for the files of a folder, or None if it does not exist."""
+    try:
+        with os.scandir(path) as entries:
+            state = []
+            for entry in entries:
+                try:
+                    if entry.is_file():
+                        st = entry.stat()
+                        state.append((entry.name, st.st_mtime_ns, st.st_size))
+                except OSError:
+                    continue
+    except OSError:
+        return None
+    return sorted(state)
+
+def _contacts_state():
+    return contacts_store.version
+
+def preview_cache_key(effective_settings, preview_date, context_path):
+    """
+    Hashes everything the preview depends on: the effective settings, the date,
+    the files of the context folder and the version of the contacts store.
+    """
+    payload = json.dumps({
+        "settings": effective_settings,
+        "date": preview_date.strftime('%Y-%m-%d'),
+        "folder": _folder_state(context_path),
+        "contacts": _contacts_state(),
+    }, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+class PreviewSuperseded(Exception):
+    """Raised when a newer preview request from the same client has arrived."""
+
+class PreviewCache:
+    """
+    LRU memo of prompt previews with request coalescing.
+
+    Concurrent requests for the same key share one computation. Each client
+    (browser tab) sends an increasing sequence number; requests that are older
+    than the latest one seen for the client are dropped before computing.
+    """
+
+    def __init__(self, max_entries=64, max_clients=256):
+        self.max_entries = max_entries
+        self.max_clients = max_clients
+        self._lock = threading.Lock()
+        self._results = OrderedDict()
+        self._in_flight = {}
+        self._latest_seq = OrderedDict()
+
+    def register_request(self, client_id, seq):
+        """Remembers the newest sequence number for the client."""
+        if not client_id or seq is None: return
+        with self._lock:
+            if seq > self._latest_seq.get(client_id, -1):
+                self._latest_seq[client_id] = seq
+            self._latest_seq.move_to_end(client_id)
+            while len(self._latest_seq) > self.max_clients:
+                self._latest_seq.popitem(last=False)
+
+    def is_superseded(self, client_id, seq):
+        if not client_id or seq is None: return False
+        with self._lock:
+            return self._latest_seq.get(client_id, -1) > seq
+
+    def get_or_compute(self, key, compute, client_id=None, seq=None):
+        with self._lock:
+            if key in self._results:
+                self._results.move_to_end(key)
+                return self._results[key]
+            future = self._in_flight.get(key)
+            is_owner = future is None
+            if is_owner:
+                if client_id and seq is not None and self._latest_seq.get(client_id, -1) > seq:
+                    raise PreviewSuperseded()
+                future = Future()
+                self._in_flight[key] = future
+        if not is_owner:
+            return future.result()
+        try:
+            value = compute()
+        except BaseException as e:
+            with self._lock: self._in_flight.pop(key, None)
+            future.set_exception(e)
+            raise
+        with self._lock:
+            self._in_flight.pop(key, None)
+            self._results[key] = value
+            while len(self._results) > self.max_entries:
+                self._results.popitem(last=False)
+        future.set_result(value)
+        return value
+
+preview_cache = PreviewCache()
@@ -1,76 +1,189 @@
 import os
 import json
 import re
-from datetime import datetime, timedelta
+import sys
+import time
+import signal
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
 from pydub import AudioSegment
 
+from audio_probe import probe_duration_ms
+from waveform_peaks import peaks_path_for
+
+AUDIO_EXTENSIONS = ('.wav', '.mp3')
+CHECKPOINT_NAME = '.process_archive{suffix}.checkpoint'
+
 def get_application_path():
     """Get the path where the application is located."""
     return os.path.dirname(os.path.abspath(__file__))
 
-def process_existing_recordings():
+def find_recordings(rec_dir):
+    """Returns the paths of all audio files under rec_dir, sorted so that runs process them in the same order."""
+    found = []
+    for root, _, files in os.walk(rec_dir):
+        for filename in files:
+            if filename.lower().endswith(AUDIO_EXTENSIONS): found.append(os.path.join(root, filename))
+    return sorted(found)
+
+def plan_recording(audio_path, compress):
+    """Returns the actions the file still needs: 'metadata' if it has no JSON sidecar, 'compress' for a WAV when compressing."""
+    actions = []
+    if not os.path.exists(os.path.splitext(audio_path)[0] + '.json'): actions.append('metadata')
+    if compress and audio_path.lower().endswith('.wav'): actions.append('compress')
+    return actions
+
+def build_metadata(audio_path):
     """
-    Iterates through the 'rec' directory and creates JSON metadata files
-    for existing audio files that don't have one.
+    Builds the JSON metadata of a recording from its folder (date), file name
+    (time) and duration. Raises ValueError if the time cannot be parsed.
     """
-    app_path = get_application_path()
-    rec_dir = os.path.join(app_path, 'rec')
+    root, filename = os.path.split(audio_path)
+    time_match = re.match(r'(\d{2})\.(\d{2})', filename)  # e.g., '14.30'
+    if not time_match: raise ValueError(f"Could not parse time from filename: {filename}")
+    hour, minute = map(int, time_match.groups())
+    start_time = datetime.strptime(os.path.basename(root), '%Y-%m-%d').replace(hour=hour, minute=minute)
+
+    # Duration comes from the audio headers, the file is decoded only if they cannot be read
+    duration_ms = probe_duration_ms(audio_path)
+    if duration_ms is None: duration_ms = len(AudioSegment.from_file(audio_path))
+    return {
+        "startTime": start_time.isoformat(),
+        "duration": duration_ms / 1000.0,
+        "title": os.path.splitext(filename)[0],
+    }
+
+def compress_recording(wav_path):
+    """Converts a WAV to MP3 next to it and removes the WAV. Returns the MP3 path."""
+    mp3_path = os.path.splitext(wav_path)[0] + '.mp3'
+    AudioSegment.from_wav(wav_path).export(mp3_path, format="mp3", parameters=["-y", "-loglevel", "quiet"])
+    os.remove(wav_path)
+    # Same audio: the waveform sidecar stays valid for the MP3
+    if os.path.exists(peaks_path_for(mp3_path)): os.utime(peaks_path_for(mp3_path))
+    return mp3_path
+
+def _ignore_interrupt():
+    # Ctrl+C is handled by the main process: workers finish their current file
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+def process_recording(audio_path, actions):
+    """Worker: performs the planned actions for one file and returns a result dict for the report."""
+    result = {"path": audio_path, "done": [], "duration": 0.0, "bytes_in": 0, "bytes_out": 0, "error": None}
+    try:
+        result["bytes_in"] = result["bytes_out"] = os.path.getsize(audio_path)
+        if 'metadata' in actions:
+            metadata = build_metadata(audio_path)
+            with open(os.path.splitext(audio_path)[0] + '.json', 'w', encoding='utf-8') as f:
+                json.dump(metadata, f, indent=4, ensure_ascii=False)
+            result["duration"] = metadata["duration"]
+            result["done"].append('metadata')
+        if 'compress' in actions:
+            if not result["duration"]:
+                duration_ms = probe_duration_ms(audio_path)
+                result["duration"] = (duration_ms or 0) / 1000.0
+            result["bytes_out"] = os.path.getsize(compress_recording(audio_path))
+            result["done"].append('compress')
+    except Exception as e:
+        result["error"] = str(e)
+    return result
+
+def _load_checkpoint(path):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return {line.rstrip('\n') for line in f if line.strip()}
+    except FileNotFoundError:
+        return set()
+
+def _print_report(results, skipped, elapsed, dry_run):
+    done = [r for r in results if not r["error"]]
+    errors = [r for r in results if r["error"]]
+    audio_seconds = sum(r["duration"] for r in done)
+    bytes_in = sum(r["bytes_in"] for r in done)
+    saved = sum(r["bytes_in"] - r["bytes_out"] for r in done if 'compress' in r["done"])
+    print("\n--- Report ---")
+    if dry_run:
+        print(f"Dry run: {len(results)} files would be processed ({bytes_in / 1e6:.1f} MB), {skipped} skipped by checkpoint.")
+        return
+    print(f"Files processed: {len(done)}, errors: {len(errors)}, skipped by checkpoint: {skipped}")
+    print(f"Metadata created: {sum('metadata' in r['done'] for r in done)}, compressed to MP3: {sum('compress' in r['done'] for r in done)} (saved {saved / 1e6:.1f} MB)")
+    if elapsed > 0:
+        # Durations are not probed for every format: without them the realtime ratio is meaningless
+        audio = f", {audio_seconds / 3600:.1f} h of audio ({audio_seconds / elapsed:.0f}x realtime)" if audio_seconds else ""
+        print(f"Elapsed: {elapsed:.1f} s, {len(results) / elapsed:.1f} files/s, {bytes_in / 1e6 / elapsed:.1f} MB/s{audio}")
+    for r in errors[:20]:
+        print(f"  ! {r['path']}: {r['error']}")
+    if len(errors) > 20: print(f"  ... and {len(errors) - 20} more errors")
+
+def process_existing_recordings(rec_dir=None, workers=None, compress=False, dry_run=False, checkpoint_path=None, restart=False):
+    """
+    Creates JSON metadata files for audio files in 'rec' that don't have one
+    and, with compress=True, converts WAV recordings to MP3.
 
+    Files are processed by a pool of worker processes. Every finished file is
+    appended to a checkpoint file, so an interrupted run resumes where it
+    stopped; files that failed are retried on the next run.
+    """
+    rec_dir = rec_dir or os.path.join(get_application_path(), 'rec')
     if not os.path.exists(rec_dir):
         print(f"Directory '{rec_dir}' not found. Nothing to process.")
-        return
+        return []
+    # Compression has its own checkpoint: files finished without it still need compressing
+    checkpoint_path = checkpoint_path or os.path.join(rec_dir, CHECKPOINT_NAME.format(suffix='-compress' if compress else ''))
+    if restart and not dry_run and os.path.exists(checkpoint_path): os.remove(checkpoint_path)
+    finished = set() if restart else _load_checkpoint(checkpoint_path)
 
     print(f"Scanning for recordings in '{rec_dir}'...")
-
-    # Walk through all directories and files
-    for root, _, files in os.walk(rec_dir):
-        for filename in files:
-            if not (filename.lower().endswith('.wav') or filename.lower().endswith('.mp3')):
-                continue
-
-            base_name, _ = os.path.splitext(filename)
-            audio_path = os.path.join(root, filename)
-            json_path = os.path.join(root, base_name + '.json')
-
-            if os.path.exists(json_path):
-                continue  # Skip if JSON already exists
-
-            print(f"Processing: {audio_path}")
-
-            try:
-                # 1. Get duration from audio file
-                audio = AudioSegment.from_file(audio_path)
-                duration_seconds = len(audio) / 1000.0
-
-                # 2. Parse start time from directory and filename
-                date_str = os.path.basename(root)  # e.g., '2023-10-27'
-                time_match = re.match(r'(\d{2})\.(\d{2})', filename) # e.g., '14.30'
-                
-                if not time_match:
-                    print(f"  - Could not parse time from filename: {filename}. Skipping.")
+    tasks, skipped = [], 0
+    for audio_path in find_recordings(rec_dir):
+        key = os.path.relpath(audio_path, rec_dir)
+        if key in finished:
+            skipped += 1
+            continue
+        actions = plan_recording(audio_path, compress)
+        if actions: tasks.append((key, audio_path, actions))
+    print(f"{len(tasks)} files to process, {skipped} already done according to the checkpoint.")
+
+    start = time.perf_counter()
+    results = []
+    if dry_run:
+        for key, audio_path, actions in tasks:
+            print(f"Would {' and '.join(actions)}: {audio_path}")
+            results.append({"path": audio_path, "done": actions, "duration": 0.0, "bytes_in": os.path.getsize(audio_path), "bytes_out": 0, "error": None})
+        _print_report(results, skipped, time.perf_counter() - start, dry_run=True)
+        return results
+
+    workers = workers or os.cpu_count() or 1
+    with open(checkpoint_path, 'a', encoding='utf-8') as checkpoint, ProcessPoolExecutor(max_workers=workers, initializer=_ignore_interrupt) as executor:
+        futures = {executor.submit(process_recording, audio_path, actions): key for key, audio_path, actions in tasks}
+        try:
+            for number, future in enumerate(as_completed(futures), 1):
+                result = future.result()
+                results.append(result)
+                if result["error"]:
+                    print(f"[{number}/{len(tasks)}] Error processing {result['path']}: {result['error']}")
                     continue
-
-                hour, minute = map(int, time_match.groups())
-                start_time = datetime.strptime(date_str, '%Y-%m-%d').replace(hour=hour, minute=minute)
-
-                # 3. Set title to filename
-                title = base_name
-
-                # 4. Create metadata dictionary
-                metadata = {
-                    "startTime": start_time.isoformat(),
-                    "duration": duration_seconds,
-                    "title": title
-                }
-
-                # 5. Write JSON file
-                with open(json_path, 'w', encoding='utf-8') as f:
-                    json.dump(metadata, f, indent=4, ensure_ascii=False)
-                print(f"  - Created metadata file: {json_path}")
-
-            except Exception as e:
-                print(f"  - Error processing file {filename}: {e}")
+                checkpoint.write(futures[future] + '\n')
+                checkpoint.flush()
+                print(f"[{number}/{len(tasks)}] {', '.join(result['done'])}: {result['path']}")
+        except KeyboardInterrupt:
+            print("\nInterrupted, waiting for running files to finish. Run again to resume.")
+            for future in futures: future.cancel()
+    _print_report(results, skipped, time.perf_counter() - start, dry_run=False)
+    return results
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Create metadata for (and optionally compress) existing recordings.")
+    parser.add_argument('--rec-dir', help="recordings folder (default: rec/ next to this script)")
+    parser.add_argument('--workers', type=int, help="number of worker processes (default: CPU count)")
+    parser.add_argument('--compress', action='store_true', help="convert WAV recordings to MP3 and remove the WAV")
+    parser.add_argument('--dry-run', action='store_true', help="only list what would be done")
+    parser.add_argument('--checkpoint', help="checkpoint file (default: a hidden file in the recordings folder)")
+    parser.add_argument('--restart', action='store_true', help="ignore the checkpoint and start over")
+    args = parser.parse_args(argv)
+    results = process_existing_recordings(args.rec_dir, args.workers, args.compress, args.dry_run, args.checkpoint, args.restart)
+    print("\nProcessing complete.")
+    return 1 if any(r["error"] for r in results) else 0
 
 if __name__ == '__main__':
-    process_existing_recordings()
-    print("\nProcessing complete.")
\ No newline at end of file
+    sys.exit(main())
@@ -0,0 +1,144 @@
+import re
+import math
+
+# Грубая оценка для смешанного русско-английского текста
+CHARS_PER_TOKEN = 3
+# Если на источник остается меньше, он отбрасывается целиком, а не превращается в обрывок
+MIN_SOURCE_CHARS = 200
+TRUNCATE_STRATEGIES = ('head', 'tail', 'rows')
+DEFAULT_TRUNCATE_STRATEGY = 'head'
+
+_HEAD_MARKER = "\n[... сокращено: {cut} ...]"
+_TAIL_MARKER = "[... сокращено: {cut} ...]\n"
+_ROWS_MARKER = "\n[... пропущено строк: {skipped} из {total} ...]"
+_TABLE_ROW_RE = re.compile(r'<tr>.*?</tr>', re.S)
+
+def to_chars(amount, unit):
+    return int(amount) * CHARS_PER_TOKEN if unit == 'tokens' else int(amount)
+
+def from_chars(chars, unit):
+    return math.ceil(chars / CHARS_PER_TOKEN) if unit == 'tokens' else chars
+
+def _truncate_head(content, limit):
+    marker = _HEAD_MARKER.format(cut=len(content))
+    keep = max(limit - len(marker), 0)
+    marker = _HEAD_MARKER.format(cut=len(content) - keep)
+    return content[:keep] + marker
+
+def _truncate_tail(content, limit):
+    marker = _TAIL_MARKER.format(cut=len(content))
+    keep = max(limit - len(marker), 0)
+    marker = _TAIL_MARKER.format(cut=len(content) - keep)
+    return marker + content[len(content) - keep:]
+
+def _split_rows(content):
+    """Splits content into (glue, rows): table rows if there are any, lines otherwise."""
+    matches = list(_TABLE_ROW_RE.finditer(content))
+    if len(matches) >= 2:
+        glue, rows, pos = [], [], 0
+        for m in matches:
+            glue.append(content[pos:m.start()])
+            rows.append(m.group(0))
+            pos = m.end()
+        glue.append(content[pos:])
+        return glue, rows
+    lines = content.split('\n')
+    return [''] + ['\n'] * (len(lines) - 1) + [''], lines
+
+def _sample_rows(content, limit):
+    """
+    Keeps the first row (table header) and an evenly spaced sample of the other
+    rows, preserving everything between rows. Falls back to head truncation when
+    there is nothing to sample.
+    """
+    glue, rows = _split_rows(content)
+    total = len(rows)
+    if total < 3:
+        return _truncate_head(content, limit)
+
+    def assemble(k):
+        rest = total - 1
+        keep = {0} | {1 + (i * rest) // k for i in range(k)} if k else {0}
+        parts = [glue[0]]
+        for i, row in enumerate(rows):
+            if i in keep: parts.append(row)
+            # Пробелы после пропущенной строки не нужны; текст между таблицами сохраняется
+            if i in keep or glue[i + 1].strip(): parts.append(glue[i + 1])
+        return ''.join(parts) + _ROWS_MARKER.format(skipped=total - len(keep), total=total)
+
+    low, high = 0, total - 1
+    while low < high:
+        mid = (low + high + 1) // 2
+        if len(assemble(mid)) <= limit: low = mid
+        else: high = mid - 1
+    result = assemble(low)
+    return result if len(result) <= limit else _truncate_head(content, limit)
+
+def truncate(content, limit, strategy=DEFAULT_TRUNCATE_STRATEGY):
+    """Shortens content to at most `limit` characters using the given strategy."""
+    if len(content) <= limit: return content
+    if strategy == 'tail': return _truncate_tail(content, limit)
+    if strategy == 'rows': return _sample_rows(content, limit)
+    return _truncate_head(content, limit)
+
+class PromptBudget:
+    """
+    Tracks how much of the prompt budget is used while the prompt is assembled.
+
+    Fixed sections (date, meeting name, participants, custom prompt) are reserved
+    first and never cut; context files are fitted afterwards in priority order.
+    """
+
+    def __init__(self, config):
+        config = config or {}
+        self.enabled = bool(config.get("enabled"))
+        self.unit = config.get("unit") if config.get("unit") in ('chars', 'tokens') else 'chars'
+        try:
+            self.limit = to_chars(max(int(config.get("limit") or 0), 0), self.unit)
+        except (TypeError, ValueError):
+            self.limit = 0
+        self.used = 0
+        self.cut = []
+
+    @property
+    def remaining(self):
+        return max(self.limit - self.used, 0)
+
+    def reserve(self, text):
+        self.used += len(text)
+
+    def fit(self, content, overhead, source, rule=None, strategy=DEFAULT_TRUNCATE_STRATEGY):
+        """Returns the part of `content` that fits (possibly truncated), or "" if the source is dropped."""
+        if not self.enabled:
+            return content
+        needed = len(content) + overhead
+        if needed <= self.remaining:
+            self.used += needed
+            return content
+        available = self.remaining - overhead
+        kept = truncate(content, available, strategy) if available >= MIN_SOURCE_CHARS else ""
+        if kept: self.used += len(kept) + overhead
+        self.cut.append({
+            "source": source, "rule": rule, "strategy": strategy if kept else "dropped",
+            "original": from_chars(len(content), self.unit), "kept": from_chars(len(kept), self.unit),
+        })
+        return kept
+
+    def report(self):
+        if not self.enabled:
+            return None
+        return {
+            "unit": self.unit, "limit": from_chars(self.limit, self.unit), "used": from_chars(self.used, self.unit),
+            "cut": self.cut,
+        }
+
+def describe_report(report):
+    """One-line human-readable summary of a budget report, for logs."""
+    if not report: return ""
+    summary = f"использовано {report['used']} из {report['limit']} ({report['unit']})"
+    if report.get("cut"):
+        cut = ", ".join(
+            f"{c['source']}: {c['original']} → {c['kept']} ({c['strategy']})" for c in report["cut"]
+        )
+        summary += f"; сокращено: {cut}"
+    return summary
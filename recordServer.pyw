@@ -1,16 +1,13 @@
 import time
 import sys
 import os
+import signal
 import platform
-from datetime import datetime, timedelta
-from threading import Thread, Event
+from threading import Thread
 
-import sounddevice as sd
-import numpy as np
-try:
-    import pyaudiowpatch as pyaudio
-except ImportError:
-    pyaudio = None
+# --headless: только веб-сервер, без трея и окон (служба на машине без рабочего стола).
+# Интерфейс в этом режиме не импортируется вовсе, модули звука и кодеков загружаются при первой записи
+HEADLESS = '--headless' in sys.argv[1:]
 
 # Для проверки одного экземпляра приложения
 try:
@@ -20,22 +17,34 @@ try:
 except ImportError:
     CreateMutex, GetLastError, ERROR_ALREADY_EXISTS = None, None, None
 
-import requests
 from dotenv import load_dotenv
 
 from werkzeug.serving import make_server
 
-import tkinter as tk
-from tkinter import messagebox
-from pystray import Icon, Menu, MenuItem as item
-from PIL import Image, ImageDraw
+if not HEADLESS:
+    try:
+        import pyaudiowpatch as pyaudio
+    except ImportError:
+        pyaudio = None
+    import tkinter as tk
+    from tkinter import messagebox
+    from pystray import Icon, Menu, MenuItem as item
+    from PIL import Image, ImageDraw
+    from gui import open_main_window, open_web_interface, check_and_prompt_config
+    from recorder import monitor_mic, monitor_sys
 import app_state
-from app_state import get_application_path, settings, main_icon, http_server, monitoring_stop_event, app, generate_favicons
-from config_manager import load_settings, load_contacts, DEFAULT_SETTINGS
-from gui import open_main_window, open_web_interface, check_and_prompt_config
-from recorder import start_recording_from_tray, pause_recording_from_tray, stop_recording_from_tray, resume_recording_from_tray, monitor_mic, monitor_sys
+from app_state import get_application_path, settings, main_icon, monitoring_stop_event, app
+from config_manager import load_settings, load_contacts, flush_settings, DEFAULT_SETTINGS
+from recording_commands import recording_commands, submit_from_tray, InvalidTransition
+from state_store import state_store
 from utils import setup_logging
+from recordings_watcher import recordings_watcher
+from recordings_index import REC_DIR
+from waveform_peaks import start_backfill
+from storage_policy import storage_policy
+from resumable_uploads import resumable_uploads
 from web_app import create_app
+from wsgi_server import PooledWSGIServer
 
 # --- Load Environment Variables ---
 dotenv_path = os.path.join(get_application_path(), '.env')
@@ -53,7 +62,6 @@ flask_thread = None
 # --- Server Lifecycle Management ---
 def start_server():
     global flask_thread
-    flask_thread = None
     if settings.get("server_enabled"):
         if flask_thread and flask_thread.is_alive():
             print("Server thread is already running.")
@@ -65,8 +73,8 @@ def start_server():
 
 def stop_server(old_settings):
     global flask_thread
-    flask_thread = None
     if flask_thread and flask_thread.is_alive() and old_settings.get("server_enabled"):
+        import requests
         print("Attempting to shut down old server...")
         try:
             port = old_settings.get("port")
@@ -90,14 +98,15 @@ def update_tray_menu():
     if not main_icon:
         return
 
-    server_is_on = settings.get("server_enabled")
+    state = state_store.snapshot()
+    server_is_on = state["server_running"]
 
-    if app_state.is_recording and not app_state.is_paused:
+    if state["is_recording"] and not state["is_paused"]:
         # Recording is active
         return Menu(
-            item('Начать запись', start_recording_from_tray, enabled=False),
-            item('Приостановить запись', pause_recording_from_tray, enabled=True),
-            item('Остановить запись', lambda: stop_recording_from_tray(), enabled=True),
+            item('Начать запись', lambda: submit_from_tray("start"), enabled=False),
+            item('Приостановить запись', lambda: submit_from_tray("pause"), enabled=True),
+            item('Остановить запись', lambda: submit_from_tray("stop"), enabled=True),
             Menu.SEPARATOR,
             item('Веб-интерфейс', lambda: open_web_interface(), enabled=server_is_on),
             item('Настройки', lambda: open_main_window(restart_server_cb=restart_server)),
@@ -105,12 +114,12 @@ def update_tray_menu():
             Menu.SEPARATOR,
             item('Выход', exit_action)
         )
-    elif app_state.is_recording and app_state.is_paused:
+    elif state["is_recording"] and state["is_paused"]:
         # Recording is paused
         return Menu(
-            item('Начать запись', start_recording_from_tray, enabled=False),
-            item('Возобновить запись', resume_recording_from_tray, enabled=True),
-            item('Остановить запись', lambda: stop_recording_from_tray(), enabled=True),
+            item('Начать запись', lambda: submit_from_tray("start"), enabled=False),
+            item('Возобновить запись', lambda: submit_from_tray("resume"), enabled=True),
+            item('Остановить запись', lambda: submit_from_tray("stop"), enabled=True),
             Menu.SEPARATOR,
             item('Веб-интерфейс', lambda: open_web_interface(), enabled=server_is_on),
             item('Настройки', lambda: open_main_window(restart_server_cb=restart_server)),
@@ -121,9 +130,9 @@ def update_tray_menu():
     else:
         # Not recording
         return Menu(
-            item('Начать запись', start_recording_from_tray, enabled=True),
-            item('Приостановить запись', pause_recording_from_tray, enabled=False),
-            item('Остановить запись', lambda: stop_recording_from_tray(), enabled=False),
+            item('Начать запись', lambda: submit_from_tray("start"), enabled=True),
+            item('Приостановить запись', lambda: submit_from_tray("pause"), enabled=False),
+            item('Остановить запись', lambda: submit_from_tray("stop"), enabled=False),
             Menu.SEPARATOR,
             item('Веб-интерфейс', lambda: open_web_interface(), enabled=server_is_on),
             item('Настройки', lambda: open_main_window(restart_server_cb=restart_server)),
@@ -134,17 +143,29 @@ def update_tray_menu():
 
 # --- Основная часть ---
 def run_flask():
-    global http_server
     host = '0.0.0.0' if settings.get("lan_accessible") else '127.0.0.1'
     port = settings.get("port", DEFAULT_SETTINGS["port"])
     try: # pragma: no cover
-        http_server = make_server(host, port, app, threaded=True)
-        http_server.serve_forever()
+        if settings.get("server_mode", DEFAULT_SETTINGS["server_mode"]) == "pooled":
+            # Фиксированный пул обработчиков с keep-alive; при перегрузке запросы получают 503
+            app_state.http_server = PooledWSGIServer(
+                host, port, app,
+                workers=settings.get("server_workers", DEFAULT_SETTINGS["server_workers"]),
+                queue_size=settings.get("server_queue_size", DEFAULT_SETTINGS["server_queue_size"]),
+            )
+        else:
+            app_state.http_server = make_server(host, port, app, threaded=True)
+        # /shutdown останавливает сервер через app_state.http_server
+        state_store.update(server_running=True)
+        app_state.http_server.serve_forever()
     except Exception as e: # pragma: no cover
         print(f"Failed to start Flask server: {e}")
+    finally:
+        state_store.update(server_running=False)
 
 def exit_action(icon, item):
     if flask_thread and flask_thread.is_alive() and settings.get("server_enabled"):
+        import requests
         print("Attempting to shut down server on exit...") # pragma: no cover
         try:
             port = settings.get("port")
@@ -152,6 +173,7 @@ def exit_action(icon, item):
             flask_thread.join(timeout=2)
         except requests.exceptions.RequestException as e:
             print(f"Info: Request to shutdown endpoint failed on exit: {e}")
+    flush_settings() # os._exit не вызывает atexit, поэтому сохраняем отложенные изменения вручную
     icon.stop()
     monitoring_stop_event.set() # Останавливаем потоки мониторинга
     # A small delay to allow tray icon to disappear before the process exits
@@ -178,31 +200,28 @@ def create_icon(shape, color):
     return image
 
 def update_icon_and_menu(icon):
-    """A dedicated thread to update the icon and menu based on app state."""
+    """A dedicated thread that redraws the icon and menu when the recording or server state changes."""
     rec_icon = create_icon('circle', 'red'); stop_icon = create_icon('square', 'gray'); pause_icon = create_icon('pause', 'orange')
-    last_recording_state = None
-    last_pause_state = None
-    last_server_state = None
-    
+    version = 0
+    last_shown = None
+
     while True:
-        # Check if any relevant state has changed
-        if app_state.is_recording != last_recording_state or app_state.is_paused != last_pause_state or settings.get("server_enabled") != last_server_state:
-            if app_state.is_recording and app_state.is_paused:
-                icon.icon = pause_icon
-            elif app_state.is_recording:
-                icon.icon = rec_icon
-            else:
-                icon.icon = stop_icon
-            
-            # Safely update the menu
-            icon.menu = update_tray_menu()
-            icon.update_menu()
-            
-            last_recording_state = app_state.is_recording
-            last_pause_state = app_state.is_paused
-            last_server_state = settings.get("server_enabled")
-        
-        time.sleep(0.1)
+        # Поток спит, пока хранилище состояния не сообщит об изменении
+        version, state = state_store.wait_for_change(version)
+        shown = (state["is_recording"], state["is_paused"], state["server_running"])
+        # Постобработка меняет состояние, но не иконку и меню
+        if shown == last_shown: continue
+        if state["is_recording"] and state["is_paused"]:
+            icon.icon = pause_icon
+        elif state["is_recording"]:
+            icon.icon = rec_icon
+        else:
+            icon.icon = stop_icon
+
+        # Safely update the menu
+        icon.menu = update_tray_menu()
+        icon.update_menu()
+        last_shown = shown
 
 def open_rec_folder(icon, item):
     rec_dir = os.path.join(get_application_path(), 'rec')
@@ -230,12 +249,40 @@ def _suppress_subprocess_window():
         except Exception as e:
             print(f"Не удалось применить патч для скрытия окон subprocess: {e}")
 
+def run_headless():
+    """Serves the web interface from the main thread until SIGINT/SIGTERM: no tray, windows or level meters."""
+    if not (USERNAME and PASSWORD_HASH):
+        print("Не заданы CRS_USERNAME и CRS_PASSWORD_HASH в .env: войти в веб-интерфейс будет невозможно.")
+        sys.exit(1)
+
+    def request_shutdown(signum, frame):
+        print("Остановка сервера...")
+        # shutdown() ждет выхода из serve_forever, поэтому вызывается не из основного потока
+        if app_state.http_server: Thread(target=app_state.http_server.shutdown, daemon=True).start()
+
+    signal.signal(signal.SIGINT, request_shutdown)
+    signal.signal(signal.SIGTERM, request_shutdown)
+    run_flask()
+    if app_state.is_recording:
+        # Идущая запись сохраняется, а не теряется при остановке службы
+        print("Сохранение текущей записи...")
+        try:
+            recording_commands.submit("stop")
+        except InvalidTransition:
+            pass  # Остановка уже в очереди: достаточно дождаться ее
+        if state_store.wait_for(lambda s: not s["is_recording"], 120) is None: print("Запись не остановилась за 120 секунд")
+    flush_settings()
+    if app_state.http_server is None: sys.exit(1)
+
 if __name__ == '__main__':
     # --- Проверка на запуск только одного экземпляра приложения ---
     if CreateMutex:
         mutex_name = "ChroniqueXRecordServerMutex"
         mutex = CreateMutex(None, 1, mutex_name)
         if GetLastError() == ERROR_ALREADY_EXISTS:
+            if HEADLESS:
+                print("Приложение ChroniqueX Record Server уже запущено.")
+                sys.exit(0)
             # Если мьютекс уже существует, значит, приложение уже запущено.
             # Можно показать сообщение пользователю.
             root = tk.Tk()
@@ -259,10 +306,17 @@ if __name__ == '__main__':
     app.secret_key = settings.get("secret_key")
 
     # Проверяем конфигурацию перед загрузкой контактов и запуском сервера
-    check_and_prompt_config()
+    if not HEADLESS: check_and_prompt_config()
 
     load_contacts() # pragma: no cover
-    generate_favicons()
+    recordings_watcher.start()
+    start_backfill(REC_DIR)
+    storage_policy.start()
+    resumable_uploads.start()
+
+    if HEADLESS:
+        run_headless()
+        sys.exit(0)
 
     stop_icon = create_icon('square', 'gray')
     main_icon = Icon('ChroniqueX Record Server', stop_icon, 'ChroniqueX Record Server', menu=Menu(lambda: update_tray_menu().items))
@@ -20,22 +20,16 @@ from pydub import AudioSegment
 from tkinter import messagebox
 
 from app_state import (
-    get_application_path, is_recording, is_paused, start_time, pause_start_time,
-    total_pause_duration, recording_threads, stop_event, mic_audio_queue,
+    get_application_path, recording_threads, stop_event, mic_audio_queue,
     sys_audio_queue, relay_audio_queue, audio_levels, settings, RATE
 )
 import app_state
+from state_store import state_store
 from postprocessing import process_recording_tasks
-from utils import build_final_prompt_addition
+from utils import build_prompt_addition_with_report
+from recordings_index import recordings_index
+from waveform_peaks import PeakAccumulator, write_peaks_from, peaks_path_for
 
-def get_elapsed_record_time():
-    if not app_state.start_time: return 0
-    current_time = datetime.now()
-    elapsed = (current_time - app_state.start_time).total_seconds()
-    elapsed -= app_state.total_pause_duration
-    if app_state.is_paused and app_state.pause_start_time:
-        elapsed -= (current_time - app_state.pause_start_time).total_seconds()
-    return max(elapsed, 0)
 
 def recorder_mic(device_index, stop_event, audio_queue):
     def callback(indata, frames, time, status):
@@ -84,8 +78,9 @@ def recorder_sys(stop_event, audio_queue):
     finally:
         print("System audio recording process finished.")
 
-def audio_mixer_and_writer(stop_event, mic_file, sys_file):
+def audio_mixer_and_writer(stop_event, mic_file, sys_file, peaks=(None, None)):
     import wave
+    mic_peaks, sys_peaks = peaks
     with wave.open(mic_file, 'wb') as wf_mic, wave.open(sys_file, 'wb') as wf_sys:
         wf_mic.setnchannels(1); wf_mic.setsampwidth(2); wf_mic.setframerate(app_state.RATE)
         wf_sys.setnchannels(2); wf_sys.setsampwidth(2); wf_sys.setframerate(app_state.RATE)
@@ -96,11 +91,13 @@ def audio_mixer_and_writer(stop_event, mic_file, sys_file):
             try:
                 mic_data = app_state.mic_audio_queue.get_nowait()
                 wf_mic.writeframes(mic_data)
+                if mic_peaks: mic_peaks.add(mic_data)
                 mic_data_stereo = np.repeat(mic_data, 2, axis=1)
             except queue.Empty: mic_data = mic_data_stereo = None
             try:
                 sys_data = app_state.sys_audio_queue.get_nowait()
                 wf_sys.writeframes(sys_data)
+                if sys_peaks: sys_peaks.add(sys_data)
             except queue.Empty: sys_data = None
 
             if settings.get("relay_enabled"):
@@ -138,10 +135,7 @@ def start_recording():
         return
 
     logging.info("Setting app state for recording...")
-    app_state.is_recording = True
-    app_state.is_paused = False
-    app_state.total_pause_duration = 0.0
-    app_state.start_time = datetime.now()
+    state_store.update(is_recording=True, is_paused=False, total_pause_duration=0.0, pause_start_time=None, start_time=datetime.now())
     app_state.stop_event.clear()
     app_state.mic_audio_queue = queue.Queue()
     app_state.sys_audio_queue = queue.Queue()
@@ -156,16 +150,18 @@ def start_recording():
     app_state.recording_threads = []
     if mic_device_index is not None:
         logging.info("...starting mic thread.")
-        mic_thread = Thread(target=recorder_mic, args=(mic_device_index, app_state.stop_event, app_state.mic_audio_queue))
+        mic_thread = Thread(target=recorder_mic, name='rec-mic', args=(mic_device_index, app_state.stop_event, app_state.mic_audio_queue))
         app_state.recording_threads.append(mic_thread)
         mic_thread.start()
     if platform.system() == "Windows":
         logging.info("...starting system audio thread.")
-        sys_thread = Thread(target=recorder_sys, args=(app_state.stop_event, app_state.sys_audio_queue))
+        sys_thread = Thread(target=recorder_sys, name='rec-sys', args=(app_state.stop_event, app_state.sys_audio_queue))
         app_state.recording_threads.append(sys_thread)
         sys_thread.start()
     logging.info("...starting mixer thread.")
-    mixer_thread = Thread(target=audio_mixer_and_writer, args=(app_state.stop_event, mic_temp_file, sys_temp_file))
+    # Пики формы волны считаются по ходу записи, чтобы не декодировать файл заново
+    app_state.recording_peaks = [PeakAccumulator(app_state.RATE), PeakAccumulator(app_state.RATE)]
+    mixer_thread = Thread(target=audio_mixer_and_writer, name='rec-mixer', args=(app_state.stop_event, mic_temp_file, sys_temp_file, tuple(app_state.recording_peaks)))
     app_state.recording_threads.append(mixer_thread)
     mixer_thread.start()
     logging.info("All recording threads started.")
@@ -176,9 +172,7 @@ def stop_recording(request_settings=None):
         if thread.is_alive(): thread.join(timeout=5)
     app_state.recording_threads = []
     end_time = datetime.now()
-    app_state.is_recording = False
-    app_state.is_paused = False
-    app_state.total_pause_duration = 0.0
+    state_store.update(is_recording=False, is_paused=False, total_pause_duration=0.0)
 
     day_dir = os.path.join(get_application_path(), 'rec', app_state.start_time.strftime('%Y-%m-%d'))
     os.makedirs(day_dir, exist_ok=True)
@@ -218,6 +212,11 @@ def stop_recording(request_settings=None):
         final_audio_path = wav_filename
 
     if final_audio_path:
+        try:
+            write_peaks_from(peaks_path_for(final_audio_path), final_audio.frame_rate, app_state.recording_peaks, int(final_audio.frame_count()))
+        except (OSError, ValueError) as e:
+            print(f"Не удалось сохранить форму волны: {e}")
+        app_state.recording_peaks = []
         json_path = os.path.splitext(final_audio_path)[0] + '.json'
         title = os.path.basename(os.path.splitext(final_audio_path)[0])
         active_template_id = settings.get("active_meeting_name_template_id")
@@ -229,14 +228,14 @@ def stop_recording(request_settings=None):
         # Если настройки пришли из запроса (из модального окна), используем их.
         # Иначе используем глобальные настройки.
         if request_settings:
-            final_prompt_addition = build_final_prompt_addition(
+            final_prompt_addition, budget_report = build_prompt_addition_with_report(
                 base_path=Path(day_dir), 
                 recording_date=app_state.start_time,
                 override_settings=request_settings
             )
             recording_settings = request_settings
         else:
-            final_prompt_addition = build_final_prompt_addition(
+            final_prompt_addition, budget_report = build_prompt_addition_with_report(
                 base_path=Path(day_dir), 
                 recording_date=app_state.start_time
             )
@@ -250,66 +249,27 @@ def stop_recording(request_settings=None):
                 "meeting_date_source": settings.get("meeting_date_source", "current"),
                 "meeting_name_templates": settings.get("meeting_name_templates", []),
                 "active_meeting_name_template_id": settings.get("active_meeting_name_template_id", None),
+                "prompt_budget": settings.get("prompt_budget"),
             }
 
         metadata = {"startTime": app_state.start_time.isoformat(), "duration": duration.total_seconds(), "title": title, "promptAddition": final_prompt_addition, "settings": recording_settings}
+        if budget_report: metadata["promptBudget"] = budget_report
         
         with open(json_path, 'w', encoding='utf-8') as f: json.dump(metadata, f, indent=4, ensure_ascii=False)
+        recordings_index.refresh_path(json_path)
         
         Thread(target=process_recording_tasks, args=(final_audio_path,), daemon=True).start()
 
 def pause_recording():
-    app_state.is_paused = True
-    app_state.pause_start_time = datetime.now()
+    state_store.transition({"is_recording": True, "is_paused": False}, is_paused=True, pause_start_time=datetime.now())
 
 def resume_recording():
-    if app_state.pause_start_time:
-        app_state.total_pause_duration += (datetime.now() - app_state.pause_start_time).total_seconds()
-    app_state.is_paused = False
-    app_state.pause_start_time = None
-
-def start_recording_from_tray(icon=None, item=None):
-    logging.info("start_recording_from_tray called.")
-    if app_state.is_recording:
-        logging.warning("Recording is already in progress. Aborting start.")
-        return
-    def _start():
-        logging.info("Background thread for starting recording is running...")
-        try:
-            start_recording()
-            logging.info("start_recording() function completed successfully.")
-        except Exception as e:
-            logging.error(f"Exception in _start thread: {e}", exc_info=True)
-            app_state.is_recording = False
-    logging.info("Starting background thread `_start`.")
-    Thread(target=_start, daemon=True).start()
-
-def stop_recording_from_tray(icon=None, item=None, request_settings=None):
-    logging.info("stop_recording_from_tray called.")
-    if not app_state.is_recording: return
-
-    try:
-        stop_recording(request_settings)
-        logging.info("Recording stopped successfully.")
-    except Exception as e:
-        print(f"Ошибка при остановке записи: {e}")
-        app_state.is_recording = False
-
-def pause_recording_from_tray(icon=None, item=None):
-    logging.info("pause_recording_from_tray called.")
-    if not app_state.is_recording or app_state.is_paused: return
-    try:
-        pause_recording()
-        print("Запись приостановлена.")
-    except Exception as e: print(f"Ошибка при паузе записи: {e}")
-
-def resume_recording_from_tray(icon=None, item=None):
-    logging.info("resume_recording_from_tray called.")
-    if not app_state.is_recording or not app_state.is_paused: return
-    try:
-        resume_recording()
-        print("Запись возобновлена.")
-    except Exception as e: print(f"Ошибка при возобновлении записи: {e}")
+    state = state_store.snapshot()
+    total_pause_duration = state["total_pause_duration"]
+    if state["pause_start_time"]: total_pause_duration += (datetime.now() - state["pause_start_time"]).total_seconds()
+    # Пауза учитывается один раз, даже если возобновление пришло дважды
+    state_store.transition({"is_paused": True, "pause_start_time": state["pause_start_time"]},
+                           is_paused=False, pause_start_time=None, total_pause_duration=total_pause_duration)
 
 def monitor_mic(stop_event):
     try:
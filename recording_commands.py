@@ -0,0 +1,165 @@
+import time
+import uuid
+import queue
+import logging
+import threading
+from collections import OrderedDict
+
+from state_store import state_store
+
+COMMANDS_KEEP = 200  # Сколько последних команд (и ключей идемпотентности) помнить для /commands
+
+# Команда -> (состояния, из которых она допустима, состояние после нее)
+TRANSITIONS = {
+    "start": (("idle",), "recording"),
+    "pause": (("recording",), "paused"),
+    "resume": (("paused",), "recording"),
+    "stop": (("recording", "paused"), "idle"),
+}
+
+class InvalidTransition(Exception):
+    """The command is not allowed in the state the recorder will be in when it runs."""
+
+def current_state():
+    state = state_store.snapshot()
+    if not state["is_recording"]: return "idle"
+    return "paused" if state["is_paused"] else "recording"
+
+class RecordingCommand:
+    def __init__(self, name, kwargs, key):
+        self.id = uuid.uuid4().hex[:12]
+        self.name = name
+        self.kwargs = kwargs
+        self.key = key
+        self.status = "queued"
+        self.error = None
+        self.submitted_at = time.time()
+        self._submitted = time.perf_counter()
+        self._started = self._finished = None
+        self.done = threading.Event()
+
+    def to_dict(self):
+        def ms(a, b): return round((b - a) * 1000, 1) if a is not None and b is not None else None
+        return {
+            "id": self.id, "command": self.name, "status": self.status, "error": self.error,
+            "idempotency_key": self.key, "submitted_at": self.submitted_at,
+            # Ожидание в очереди, выполнение и полное время от приема до завершения
+            "queue_ms": ms(self._submitted, self._started), "run_ms": ms(self._started, self._finished),
+            "latency_ms": ms(self._submitted, self._finished),
+        }
+
+class RecordingCommandExecutor:
+    """
+    Runs start/pause/resume/stop one at a time on a single thread, in the
+    order they were accepted, so the recorder globals in app_state are never
+    changed by two commands at once.
+
+    A command is checked against the state the recorder will be in after the
+    commands already queued (a second "start" from a double click is refused
+    right away) and checked again just before it runs. A repeated
+    idempotency key returns the command accepted first instead of a new one.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._queue = queue.Queue()
+        self._commands = OrderedDict()
+        self._keys = {}  # Ключ идемпотентности -> id команды
+        self._pending = []  # Принятые, но еще не завершенные команды
+        self._thread = None
+
+    def _projected_state(self):
+        # Пока команды не выполнены, app_state еще не отражает их результат
+        if self._pending: return TRANSITIONS[self._pending[-1].name][1]
+        return current_state()
+
+    def submit(self, name, key=None, **kwargs):
+        """Queues a command and returns it; raises InvalidTransition if it cannot apply."""
+        if name not in TRANSITIONS: raise ValueError(f"Неизвестная команда: {name}")
+        with self._lock:
+            if key and key in self._keys and self._keys[key] in self._commands:
+                return self._commands[self._keys[key]]
+            allowed_from, _ = TRANSITIONS[name]
+            state = self._projected_state()
+            if state not in allowed_from:
+                raise InvalidTransition(f"Команда {name} недопустима в состоянии {state}")
+            command = RecordingCommand(name, kwargs, key)
+            self._commands[command.id] = command
+            if key: self._keys[key] = command.id
+            self._pending.append(command)
+            self._trim()
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='recording-commands', daemon=True)
+                self._thread.start()
+        self._queue.put(command)
+        return command
+
+    def get(self, command_id):
+        with self._lock:
+            command = self._commands.get(command_id)
+            return command.to_dict() if command else None
+
+    def list(self):
+        with self._lock:
+            return [command.to_dict() for command in reversed(self._commands.values())]
+
+    def _trim(self):
+        while len(self._commands) > COMMANDS_KEEP:
+            oldest = next(iter(self._commands.values()))
+            if oldest.status in ("queued", "running"): break
+            del self._commands[oldest.id]
+            if oldest.key and self._keys.get(oldest.key) == oldest.id: del self._keys[oldest.key]
+
+    def _run(self):
+        while True:
+            command = self._queue.get()
+            with self._lock:
+                command._started = time.perf_counter()
+                allowed_from, _ = TRANSITIONS[command.name]
+                state = current_state()
+                # Предыдущая команда могла завершиться ошибкой, и состояние оказалось не тем, что ожидалось
+                if state not in allowed_from:
+                    command.status, command.error = "rejected", f"Команда {command.name} недопустима в состоянии {state}"
+                else:
+                    command.status = "running"
+            if command.status == "running":
+                try:
+                    self._execute(command)
+                    command.status = "done"
+                except Exception as e:
+                    command.status, command.error = "error", str(e)
+                    logging.error(f"Ошибка команды записи {command.name}: {e}", exc_info=True)
+            with self._lock:
+                command._finished = time.perf_counter()
+                self._pending.remove(command)
+            command.done.set()
+            logging.info(f"Команда записи {command.name} ({command.id}): {command.status}, {command.to_dict()['latency_ms']} мс")
+
+    def _execute(self, command):
+        # Модули звука и кодеков загружаются при первой команде, а не при запуске сервера
+        from recorder import start_recording, stop_recording, pause_recording, resume_recording
+        if command.name == "start":
+            try:
+                start_recording()
+            except Exception:
+                state_store.update(is_recording=False, is_paused=False)
+                raise
+            if not state_store.get("is_recording"): raise RuntimeError("Запись не началась: нет устройства записи")
+        elif command.name == "stop":
+            try:
+                stop_recording(**command.kwargs)
+            finally:
+                state_store.update(is_recording=False, is_paused=False)
+        elif command.name == "pause":
+            pause_recording()
+        elif command.name == "resume":
+            resume_recording()
+
+recording_commands = RecordingCommandExecutor()
+
+def submit_from_tray(name):
+    """Tray menu handler: invalid transitions (e.g. a stale menu) are only logged."""
+    try:
+        recording_commands.submit(name)
+    except InvalidTransition as e:
+        logging.warning(str(e))
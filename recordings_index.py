@@ -0,0 +1,507 @@
+import os
+import json
+import sqlite3
+import threading
+from datetime import datetime
+
+from app_state import get_application_path
+from audio_probe import probe_duration_ms
+from text_search import parse_query, build_match_query, highlight_pattern, make_snippet, fold_text
+
+REC_DIR = os.path.join(get_application_path(), 'rec')
+RECORDINGS_INDEX_FILE = os.path.join(get_application_path(), 'recordings_index.db')
+# Архивный уровень: аудио старых записей в компактном Opus, в папках дат вне rec/
+ARCHIVE_DIR = os.path.join(get_application_path(), 'archive')
+ARCHIVE_AUDIO_EXT = '.ogg'
+AUDIO_EXTENSIONS = ('.wav', '.mp3', ARCHIVE_AUDIO_EXT)
+# При изменении схемы индекс пересобирается с нуля
+RECORDINGS_INDEX_SCHEMA_VERSION = 3
+PROTOCOL_SUFFIX = '_protocol'
+TRANSCRIPT_INDEX_MAX_CHARS = 4 * 1024 * 1024  # Сколько текста расшифровки попадает в полнотекстовый индекс
+# Веса столбцов в ранжировании bm25: совпадение в названии важнее, чем в тексте расшифровки
+SEARCH_WEIGHTS = (10.0, 4.0, 1.0)
+
+def resolve_audio_path(path):
+    """
+    Maps rec/<date>/<name>.<ext> to archive/<date>/<name>.ogg once the storage
+    policy has moved the audio to the archive; other paths are returned as is.
+    """
+    if os.path.exists(path) or not path.lower().endswith(AUDIO_EXTENSIONS): return path
+    date_path, filename = os.path.split(path)
+    return os.path.join(ARCHIVE_DIR, os.path.basename(date_path), os.path.splitext(filename)[0] + ARCHIVE_AUDIO_EXT)
+
+_RECORDINGS_SCHEMA = """
+CREATE TABLE IF NOT EXISTS date_dirs (
+    date TEXT PRIMARY KEY,
+    dir_mtime_ns INTEGER
+);
+CREATE TABLE IF NOT EXISTS recordings (
+    id INTEGER PRIMARY KEY,
+    date TEXT NOT NULL,
+    base_name TEXT NOT NULL,
+    audio_filename TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    audio_mtime_ns INTEGER NOT NULL,
+    json_stamp TEXT,
+    txt_stamp TEXT,
+    title TEXT NOT NULL,
+    start_time TEXT NOT NULL,
+    display_time TEXT NOT NULL,
+    duration REAL NOT NULL,
+    prompt_addition TEXT NOT NULL,
+    transcription_exists INTEGER NOT NULL,
+    protocol_exists INTEGER NOT NULL,
+    UNIQUE (date, base_name)
+);
+CREATE INDEX IF NOT EXISTS recordings_start_idx ON recordings(start_time, date, base_name);
+CREATE VIRTUAL TABLE IF NOT EXISTS recordings_fts USING fts5(
+    title, prompt_addition, transcript,
+    tokenize = "unicode61 remove_diacritics 2"
+);
+"""
+
+def is_date_dir_name(name):
+    try:
+        datetime.strptime(name, '%Y-%m-%d')
+        return True
+    except ValueError:
+        return False
+
+def _stat(path):
+    try:
+        return os.stat(path)
+    except OSError:
+        return None
+
+def _stamp(st):
+    return f"{st.st_mtime_ns}:{st.st_size}" if st else None
+
+def _read_metadata(json_path):
+    try:
+        with open(json_path, 'r', encoding='utf-8') as f:
+            metadata = json.load(f)
+        return metadata if isinstance(metadata, dict) else {}
+    except (OSError, json.JSONDecodeError, TypeError, UnicodeDecodeError):
+        return {}
+
+def _read_transcript(txt_path):
+    try:
+        with open(txt_path, 'r', encoding='utf-8', errors='replace') as f:
+            return f.read(TRANSCRIPT_INDEX_MAX_CHARS)
+    except OSError:
+        return ''
+
+def _keeps_text(json_st, txt_st, protocol_exists):
+    """
+    Whether a recording without audio (evicted by the storage quota) stays in
+    the index: it needs its metadata, or a transcript with a protocol (a lone
+    .txt in a date folder may be a prompt context file).
+    """
+    return json_st is not None or (txt_st is not None and protocol_exists)
+
+def _probe_duration(audio_path):
+    duration_ms = probe_duration_ms(audio_path)
+    if duration_ms is not None: return duration_ms / 1000.0
+    # Нестандартный файл: определяем длительность полным декодированием
+    from pydub import AudioSegment
+    try: return len(AudioSegment.from_file(audio_path)) / 1000.0
+    except Exception: return 0
+
+class RecordingsIndex:
+    """
+    SQLite index of the recordings in rec/<date>/ folders.
+
+    A date folder is rescanned only when its mtime differs from the one stored
+    in the index. A rescan re-reads the metadata and probes the duration only
+    for recordings whose audio or .json file changed. Code that writes files in
+    rec/ calls refresh_path() so the affected recording is re-indexed right
+    away, including in-place rewrites of the .json that do not touch the
+    folder mtime. On a cold start every folder is checked once by mtime.
+
+    While a watcher (recordings_watcher) is running, changes made by other
+    processes arrive through invalidate(), so query() and search() re-check
+    only the folders invalidated since their last check instead of every
+    folder in the range.
+
+    Titles, prompt additions and transcripts are also kept in an FTS5 table
+    (rowid = recordings.id) that is updated together with the recording row,
+    so search() never has to read the .txt files.
+    """
+
+    def __init__(self, rec_dir, db_path, archive_dir=None):
+        self.rec_dir = rec_dir
+        self.archive_dir = archive_dir
+        self.db_path = db_path
+        self._lock = threading.RLock()
+        self._conn = None
+        self._root_mtime_ns = None
+        self._listeners = []
+        self._verified = set()  # Папки дат, сверенные с диском после последнего сброса
+        self.watcher = None  # Наблюдатель за rec/: пока он работает, сверенные папки повторно не проверяются
+
+    def _connect(self):
+        if self._conn is not None: return self._conn
+        try:
+            conn = self._open()
+        except sqlite3.DatabaseError as e:
+            # Индекс — производные данные: поврежденный файл просто пересоздаем
+            print(f"Индекс записей поврежден, пересоздаю: {e}")
+            for suffix in ('', '-wal', '-shm'):
+                try: os.remove(self.db_path + suffix)
+                except OSError: pass
+            conn = self._open()
+        self._conn = conn
+        return conn
+
+    def _open(self):
+        conn = sqlite3.connect(self.db_path, check_same_thread=False, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        if conn.execute("PRAGMA user_version").fetchone()[0] != RECORDINGS_INDEX_SCHEMA_VERSION:
+            conn.executescript("DROP TABLE IF EXISTS recordings_fts; DROP TABLE IF EXISTS recordings; DROP TABLE IF EXISTS date_dirs;")
+            conn.execute(f"PRAGMA user_version = {RECORDINGS_INDEX_SCHEMA_VERSION}")
+        conn.executescript(_RECORDINGS_SCHEMA)
+        return conn
+
+    def _transaction(self, work):
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            result = work(conn)
+            conn.execute("COMMIT")
+            return result
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    # --- Синхронизация с диском ---
+    def _sync_dates(self):
+        """Updates the list of date folders if the rec/ folder itself changed."""
+        st = _stat(self.rec_dir)
+        mtime_ns = st.st_mtime_ns if st else None
+        if self._root_mtime_ns is not None and mtime_ns == self._root_mtime_ns: return
+        on_disk = set()
+        if st:
+            with os.scandir(self.rec_dir) as entries:
+                for entry in entries:
+                    try:
+                        if entry.is_dir() and is_date_dir_name(entry.name): on_disk.add(entry.name)
+                    except OSError:
+                        continue
+
+        def work(conn):
+            indexed = {row[0] for row in conn.execute("SELECT date FROM date_dirs")}
+            for date in indexed - on_disk:
+                _delete_date(conn, date)
+            conn.executemany("INSERT INTO date_dirs(date, dir_mtime_ns) VALUES (?, NULL)", [(d,) for d in on_disk - indexed])
+        self._transaction(work)
+        self._verified &= on_disk
+        self._root_mtime_ns = mtime_ns
+
+    def _sync_date(self, date):
+        """Rescans a date folder if its mtime differs from the indexed one. Returns False if the folder is gone."""
+        date_path = os.path.join(self.rec_dir, date)
+        st = _stat(date_path)
+        if st is None or not os.path.isdir(date_path):
+            self._transaction(lambda conn: _delete_date(conn, date))
+            self._verified.discard(date)
+            return False
+        row = self._connect().execute("SELECT dir_mtime_ns FROM date_dirs WHERE date = ?", (date,)).fetchone()
+        if row is None or row[0] != st.st_mtime_ns: self._scan_date(date, date_path, st.st_mtime_ns)
+        self._verified.add(date)
+        return True
+
+    def _scan_date(self, date, date_path, dir_mtime_ns):
+        file_groups = {}
+        with os.scandir(date_path) as entries:
+            for entry in entries:
+                try:
+                    if not entry.is_file(): continue
+                except OSError:
+                    continue
+                name, ext = os.path.splitext(entry.name)
+                file_groups.setdefault(name, {})[ext] = entry
+        archived = self._archived_entries(date)
+
+        conn = self._connect()
+        previous = {row["base_name"]: row for row in conn.execute("SELECT * FROM recordings WHERE date = ?", (date,))}
+        rows = []
+        for base_name in file_groups.keys() | archived.keys():
+            file_dict = file_groups.get(base_name, {})
+            audio_entry = file_dict.get('.wav') or file_dict.get('.mp3') or archived.get(base_name)
+            try: audio_st = audio_entry.stat() if audio_entry else None
+            except OSError: continue
+            json_entry = file_dict.get('.json')
+            try: json_st = json_entry.stat() if json_entry else None
+            except OSError: json_st = None
+            protocol_exists = '.pdf' in file_groups.get(base_name + PROTOCOL_SUFFIX, {})
+            txt_entry = file_dict.get('.txt')
+            try: txt_st = txt_entry.stat() if txt_entry else None
+            except OSError: txt_st = None
+            if audio_st is None and not _keeps_text(json_st, txt_st, protocol_exists): continue
+            rows.append(self._build_row(
+                date, date_path, base_name, audio_entry.path if audio_entry else None, audio_st, json_st,
+                txt_st, protocol_exists, previous.get(base_name)
+            ))
+
+        def work(conn):
+            present = {row[1] for row, _text in rows}
+            for base_name, row in previous.items():
+                if base_name not in present: _delete_recording(conn, row["id"])
+            for row, text in rows:
+                _store_row(conn, row, text)
+            conn.execute(
+                "INSERT INTO date_dirs(date, dir_mtime_ns) VALUES (?, ?) "
+                "ON CONFLICT(date) DO UPDATE SET dir_mtime_ns = excluded.dir_mtime_ns", (date, dir_mtime_ns)
+            )
+        self._transaction(work)
+
+    def _archived_entries(self, date):
+        """Returns {base name: DirEntry} of the archived audio of a date (the archive has no other files)."""
+        archived = {}
+        if not self.archive_dir: return archived
+        try:
+            with os.scandir(os.path.join(self.archive_dir, date)) as entries:
+                for entry in entries:
+                    name, ext = os.path.splitext(entry.name)
+                    if ext == ARCHIVE_AUDIO_EXT: archived[name] = entry
+        except OSError:
+            pass
+        return archived
+
+    def _build_row(self, date, date_path, base_name, audio_path, audio_st, json_st, txt_st, protocol_exists, previous):
+        """
+        Returns (row, text) where text holds the changed searchable columns
+        ({} if none changed, None for a recording new to the index).
+        audio_path is None for a recording whose audio was evicted: it is
+        stored with an empty audio_filename and zero size.
+        """
+        audio_filename = os.path.basename(audio_path) if audio_path else ''
+        audio_size, audio_mtime_ns = (audio_st.st_size, audio_st.st_mtime_ns) if audio_st else (0, 0)
+        json_stamp, txt_stamp = _stamp(json_st), _stamp(txt_st)
+        text = None if previous is None else {}
+        if previous is None or previous["txt_stamp"] != txt_stamp:
+            text_value = _read_transcript(os.path.join(date_path, base_name + '.txt')) if txt_st else ''
+            if text is not None: text['transcript'] = text_value
+        if (previous is not None and previous["audio_filename"] == audio_filename and previous["size"] == audio_size
+                and previous["audio_mtime_ns"] == audio_mtime_ns and previous["json_stamp"] == json_stamp):
+            # Аудио и метаданные не менялись: не перечитываем .json и не декодируем аудио
+            return (date, base_name, audio_filename, audio_size, audio_mtime_ns, json_stamp, txt_stamp,
+                    previous["title"], previous["start_time"], previous["display_time"], previous["duration"],
+                    previous["prompt_addition"], int(txt_st is not None), int(protocol_exists)), text
+
+        metadata = _read_metadata(os.path.join(date_path, base_name + '.json')) if json_st else {}
+        try:
+            start_time_obj = datetime.fromisoformat(metadata['startTime'])
+        except (KeyError, TypeError, ValueError):
+            start_time_obj = datetime.fromtimestamp((audio_st or json_st or txt_st).st_ctime)
+        duration = metadata.get('duration')
+        if duration is None: duration = _probe_duration(audio_path) if audio_path else 0
+        title, prompt_addition = metadata.get('title', base_name), metadata.get('promptAddition', '')
+        if text is None:
+            text = {'title': title, 'prompt_addition': prompt_addition, 'transcript': text_value}
+        else:
+            if title != previous["title"]: text['title'] = title
+            if prompt_addition != previous["prompt_addition"]: text['prompt_addition'] = prompt_addition
+        return (date, base_name, audio_filename, audio_size, audio_mtime_ns, json_stamp, txt_stamp,
+                title, start_time_obj.isoformat(), start_time_obj.strftime('%H:%M:%S'),
+                duration, prompt_addition, int(txt_st is not None), int(protocol_exists)), text
+
+    # --- Запросы ---
+    def date_dirs(self):
+        """Returns the names of the date folders, newest first."""
+        with self._lock:
+            self._sync_dates()
+            return [row[0] for row in self._connect().execute("SELECT date FROM date_dirs ORDER BY date DESC")]
+
+    def recordings_for_date(self, date):
+        """Returns the recordings of a date folder in the format of the /get_recordings_for_date endpoint."""
+        with self._lock:
+            if not self._sync_date(date): return []
+            rows = self._connect().execute(
+                "SELECT * FROM recordings WHERE date = ? ORDER BY display_time DESC, base_name DESC", (date,)
+            ).fetchall()
+        return [_row_to_recording(row) for row in rows]
+
+    def query(self, date_from=None, date_to=None, limit=50, after=None, descending=True):
+        """
+        Returns up to `limit` recordings across date folders ordered by start
+        time, plus the sort key of the last one if there may be more. `after` is
+        such a key from the previous page: pages are keyset-based, so they stay
+        stable while recordings are added and cost the same at any depth.
+        """
+        with self._lock:
+            self._sync_range(date_from, date_to)
+            direction, compare = ("DESC", "<") if descending else ("ASC", ">")
+            sql = "SELECT * FROM recordings WHERE date >= ? AND date <= ?"
+            params = [date_from or '', date_to or '9999-99-99']
+            if after:
+                sql += f" AND (start_time, date, base_name) {compare} (?, ?, ?)"
+                params.extend(after)
+            sql += f" ORDER BY start_time {direction}, date {direction}, base_name {direction} LIMIT ?"
+            params.append(limit + 1)
+            rows = self._connect().execute(sql, params).fetchall()
+        page = rows[:limit]
+        next_key = (page[-1]["start_time"], page[-1]["date"], page[-1]["base_name"]) if len(rows) > limit else None
+        return [dict(_row_to_recording(row), date=row["date"]) for row in page], next_key
+
+    def search(self, text, limit=20, date_from=None, date_to=None):
+        """
+        Full-text search over titles, prompt additions and transcripts. Returns
+        up to `limit` recordings, best matches first, each with an HTML snippet
+        of the matching fragment (<mark> around the hits). Words match any
+        Russian word form (see text_search.build_match_query).
+        """
+        terms = parse_query(text)
+        if not terms: return []
+        ranking = f"bm25({', '.join(map(str, SEARCH_WEIGHTS))})"
+        with self._lock:
+            self._sync_range(date_from, date_to)
+            conn = self._connect()
+            rows = conn.execute(
+                "SELECT recordings.*, recordings_fts.rank AS rank FROM recordings_fts "
+                "JOIN recordings ON recordings.id = recordings_fts.rowid "
+                "WHERE recordings_fts MATCH ? AND recordings_fts.rank MATCH ? AND recordings.date >= ? AND recordings.date <= ? "
+                "ORDER BY recordings_fts.rank LIMIT ?",
+                (build_match_query(terms), ranking, date_from or '', date_to or '9999-99-99', limit)
+            ).fetchall()
+            # Текст читаем только для найденных записей; фрагменты строим сами: snippet() токенизирует расшифровку целиком
+            texts = {row[0]: row[1:] for row in conn.execute(
+                f"SELECT rowid, transcript, prompt_addition, title FROM recordings_fts WHERE rowid IN ({', '.join('?' * len(rows))})",
+                [row["id"] for row in rows]
+            )} if rows else {}
+        pattern = highlight_pattern(terms)
+        return [
+            dict(_row_to_recording(row), date=row["date"], rank=row["rank"], snippet=make_snippet(texts.get(row["id"], ()), pattern))
+            for row in rows
+        ]
+
+    def _sync_range(self, date_from, date_to):
+        """Brings every date folder in [date_from, date_to] up to date with the disk."""
+        self._sync_dates()
+        dates = self._connect().execute(
+            "SELECT date FROM date_dirs WHERE date >= ? AND date <= ?", (date_from or '', date_to or '9999-99-99')
+        ).fetchall()
+        watched = self.watcher is not None and self.watcher.is_running
+        for (date,) in dates:
+            if watched and date in self._verified: continue
+            self._sync_date(date)
+
+    # --- Инкрементальные обновления ---
+    def add_listener(self, callback):
+        """Registers callback(date) called after refresh_path() re-indexed a recording of that date."""
+        self._listeners.append(callback)
+
+    def invalidate(self, date=None):
+        """Forces a rescan of a date folder (or of the list of dates when date is None) on the next query."""
+        with self._lock:
+            if date is None:
+                self._root_mtime_ns = None
+                return
+            self._verified.discard(date)
+            try:
+                self._transaction(lambda conn: conn.execute("UPDATE date_dirs SET dir_mtime_ns = NULL WHERE date = ?", (date,)))
+            except sqlite3.Error as e:
+                print(f"Ошибка сброса индекса записей для {date}: {e}")
+
+    def invalidate_all(self):
+        """Makes the next query check every date folder by mtime again (events about changes may have been lost)."""
+        with self._lock:
+            self._root_mtime_ns = None
+            self._verified.clear()
+
+    def refresh_path(self, path):
+        """
+        Re-indexes the recording a file in rec/<date>/ belongs to (audio, .json,
+        .txt or _protocol.pdf). Call it after the app writes, renames or deletes
+        such a file.
+        """
+        path = os.path.abspath(path)
+        date_path = os.path.dirname(path)
+        if os.path.dirname(date_path) != os.path.abspath(self.rec_dir): return
+        date = os.path.basename(date_path)
+        if not is_date_dir_name(date): return
+        base_name, ext = os.path.splitext(os.path.basename(path))
+        if ext.lower() == '.pdf' and base_name.endswith(PROTOCOL_SUFFIX): base_name = base_name[:-len(PROTOCOL_SUFFIX)]
+        try:
+            with self._lock:
+                self._refresh_recording(date, date_path, base_name)
+        except (sqlite3.Error, OSError) as e:
+            print(f"Ошибка обновления индекса записей для {path}: {e}")
+        for callback in self._listeners:
+            callback(date)
+
+    def _refresh_recording(self, date, date_path, base_name):
+        conn = self._connect()
+        if conn.execute("SELECT 1 FROM date_dirs WHERE date = ?", (date,)).fetchone() is None:
+            # Новая папка даты: она будет просканирована целиком при первом запросе
+            self._root_mtime_ns = None
+            return
+        audio_path, audio_st = None, None
+        candidates = [os.path.join(date_path, base_name + ext) for ext in ('.wav', '.mp3')]
+        if self.archive_dir: candidates.append(os.path.join(self.archive_dir, date, base_name + ARCHIVE_AUDIO_EXT))
+        for candidate in candidates:
+            st = _stat(candidate)
+            if st:
+                audio_path, audio_st = candidate, st
+                break
+        previous = conn.execute("SELECT * FROM recordings WHERE date = ? AND base_name = ?", (date, base_name)).fetchone()
+        json_st = _stat(os.path.join(date_path, base_name + '.json'))
+        txt_st = _stat(os.path.join(date_path, base_name + '.txt'))
+        protocol_exists = os.path.isfile(os.path.join(date_path, base_name + PROTOCOL_SUFFIX + '.pdf'))
+        if audio_st is None and not _keeps_text(json_st, txt_st, protocol_exists):
+            if previous is not None: self._transaction(lambda conn: _delete_recording(conn, previous["id"]))
+            return
+        row, text = self._build_row(date, date_path, base_name, audio_path, audio_st, json_st, txt_st, protocol_exists, previous)
+        self._transaction(lambda conn: _store_row(conn, row, text))
+
+def _row_to_recording(row):
+    """Converts an index row to the recording dict the UI expects."""
+    # Без аудио (удалено квотой) запись адресуется по .json: действия с ней используют только базовое имя
+    return {
+        'filename': row["audio_filename"] or row["base_name"] + ".json", 'audio_evicted': not row["audio_filename"],
+        'size': row["size"], 'time': row["display_time"],
+        'transcription_exists': bool(row["transcription_exists"]), 'transcription_filename': row["base_name"] + ".txt",
+        'protocol_exists': bool(row["protocol_exists"]), 'protocol_filename': row["base_name"] + PROTOCOL_SUFFIX + ".pdf",
+        'title': row["title"], 'startTime': row["start_time"],
+        'promptAddition': row["prompt_addition"], 'duration': row["duration"],
+    }
+
+_RECORDING_FIELDS = (
+    "date", "base_name", "audio_filename", "size", "audio_mtime_ns", "json_stamp", "txt_stamp", "title",
+    "start_time", "display_time", "duration", "prompt_addition", "transcription_exists", "protocol_exists",
+)
+# ON CONFLICT DO UPDATE сохраняет id записи, а с ним и строку полнотекстового индекса
+_UPSERT_RECORDING = (
+    f"INSERT INTO recordings({', '.join(_RECORDING_FIELDS)}) VALUES ({', '.join('?' * len(_RECORDING_FIELDS))}) "
+    f"ON CONFLICT(date, base_name) DO UPDATE SET "
+    + ", ".join(f"{field} = excluded.{field}" for field in _RECORDING_FIELDS[2:])
+)
+
+def _store_row(conn, row, text):
+    """Upserts a recording row and the changed columns of its full-text entry (see RecordingsIndex._build_row)."""
+    conn.execute(_UPSERT_RECORDING, row)
+    if text == {}: return
+    recording_id = conn.execute("SELECT id FROM recordings WHERE date = ? AND base_name = ?", row[:2]).fetchone()[0]
+    text = {column: fold_text(value) for column, value in text.items()}
+    if len(text) == 3:
+        conn.execute("DELETE FROM recordings_fts WHERE rowid = ?", (recording_id,))
+        conn.execute(
+            "INSERT INTO recordings_fts(rowid, title, prompt_addition, transcript) VALUES (?, ?, ?, ?)",
+            (recording_id, text['title'], text['prompt_addition'], text['transcript'])
+        )
+    else:
+        assignments = ", ".join(f"{column} = ?" for column in text)
+        conn.execute(f"UPDATE recordings_fts SET {assignments} WHERE rowid = ?", (*text.values(), recording_id))
+
+def _delete_recording(conn, recording_id):
+    conn.execute("DELETE FROM recordings_fts WHERE rowid = ?", (recording_id,))
+    conn.execute("DELETE FROM recordings WHERE id = ?", (recording_id,))
+
+def _delete_date(conn, date):
+    conn.execute("DELETE FROM recordings_fts WHERE rowid IN (SELECT id FROM recordings WHERE date = ?)", (date,))
+    conn.execute("DELETE FROM recordings WHERE date = ?", (date,))
+    conn.execute("DELETE FROM date_dirs WHERE date = ?", (date,))
+
+recordings_index = RecordingsIndex(REC_DIR, RECORDINGS_INDEX_FILE, ARCHIVE_DIR)
@@ -0,0 +1,289 @@
+import os
+import sys
+import time
+import uuid
+import select
+import struct
+import ctypes
+import ctypes.util
+import logging
+import threading
+from collections import deque
+
+from recordings_index import recordings_index, REC_DIR, is_date_dir_name
+
+RECORDINGS_POLL_INTERVAL = 2.0  # Секунды между проходами опроса, если inotify недоступен
+RECORDINGS_POLL_RECENT_DATES = 3  # В скольких последних папках опрос проверяет сами файлы, а не только mtime папки
+CHANGE_LOG_SIZE = 1024  # Сколько последних изменений помнит сервер для ответа "что изменилось"
+
+class RecordingsWatcher:
+    """
+    Tracks changes under rec/ as a monotonically increasing generation number.
+
+    Every change bumps the generation and is logged with the date folder it
+    touched (None for changes to the list of dates itself). Clients pass the
+    generation they last saw and get back only the dates that changed since
+    then. The epoch changes on every server start, so a client that saw a
+    generation from a previous run knows it has to reload everything.
+
+    Changes come from the app itself (through the recordings index) and from
+    an inotify watch on Linux, or from a polling thread elsewhere.
+    """
+
+    def __init__(self, rec_dir, index):
+        self.rec_dir = rec_dir
+        self.index = index
+        self.epoch = uuid.uuid4().hex[:8]
+        self._lock = threading.Lock()
+        self._generation = 0
+        self._last_change_time = time.time()
+        self._log = deque(maxlen=CHANGE_LOG_SIZE)  # (generation, date)
+        self._date_generations = {}  # Папка даты -> поколение последнего изменения в ней
+        self._rescan_generation = 0  # Поколение последней потери событий, после которой измениться могло что угодно
+        self._thread = None
+        self._stop_event = threading.Event()
+        self.backend = None
+        index.add_listener(self._on_index_refresh)
+        index.watcher = self
+
+    @property
+    def generation(self):
+        return self._generation
+
+    def mark_changed(self, dates, rescan=False):
+        """
+        Records one change covering the given date folders (None = the list of
+        dates). rescan=True means events were lost and any folder may have changed.
+        """
+        dates = set(dates)
+        if not dates: return
+        with self._lock:
+            self._generation += 1
+            self._last_change_time = time.time()
+            if rescan: self._rescan_generation = self._generation
+            for date in dates:
+                self._log.append((self._generation, date))
+                if date is not None: self._date_generations[date] = self._generation
+
+    @property
+    def is_running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def date_generation(self, date):
+        """
+        Returns the generation of the last change that may have touched the
+        date folder: a change in the folder itself or a loss of events (queue
+        overflow, rec/ folder replaced) after which anything may have changed.
+        """
+        with self._lock:
+            return max(self._date_generations.get(date, 0), self._rescan_generation)
+
+    def _on_index_refresh(self, date):
+        self.mark_changed([date])
+
+    def _on_disk_change(self, dates, rescan=False):
+        """Changes seen by the watcher may come from other processes: the index has to re-check them."""
+        if rescan: self.index.invalidate_all()
+        for date in dates:
+            self.index.invalidate(date)
+        self.mark_changed(dates, rescan)
+
+    def state(self, since=None, epoch=None):
+        """
+        Returns the current generation and, if `since` is a generation of this
+        epoch still covered by the change log, the dates changed after it.
+        """
+        with self._lock:
+            result = {
+                "epoch": self.epoch, "generation": self._generation,
+                "last_modified": self._last_change_time, "full": True, "changed_dates": [],
+            }
+            if since is None or epoch != self.epoch or since > self._generation: return result
+            if since == self._generation:
+                result["full"] = False
+                return result
+            if not self._log or self._log[0][0] > since + 1: return result  # Журнал уже не покрывает этот промежуток
+            changed = set()
+            for generation, date in reversed(self._log):
+                if generation <= since: break
+                if date is None: return result
+                changed.add(date)
+            result["full"] = False
+            result["changed_dates"] = sorted(changed)
+            return result
+
+    # --- Фоновое наблюдение ---
+    def start(self):
+        if self._thread and self._thread.is_alive(): return
+        self._stop_event.clear()
+        inotify = _Inotify.create()
+        if inotify:
+            self.backend = 'inotify'
+            target = lambda: self._run_inotify(inotify)
+        else:
+            self.backend = 'polling'
+            target = self._run_polling
+        self._thread = threading.Thread(target=target, name='recordings-watcher', daemon=True)
+        self._thread.start()
+        logging.info(f"Наблюдение за папкой записей запущено ({self.backend}).")
+
+    def stop(self):
+        self._stop_event.set()
+
+    def _run_inotify(self, inotify):
+        try:
+            with inotify:
+                while not self._stop_event.is_set():
+                    if not inotify.root_wd and os.path.isdir(self.rec_dir):
+                        inotify.watch_tree(self.rec_dir)
+                        self._on_disk_change([None], rescan=True)
+                    dates = inotify.read_changes(timeout=1.0)
+                    if dates: self._on_disk_change(dates, rescan=inotify.take_lost_events())
+        except OSError as e:
+            logging.error(f"Ошибка inotify, переключаюсь на опрос папки записей: {e}")
+            self.backend = 'polling'
+            self._run_polling()
+
+    def _run_polling(self):
+        snapshot = self._poll_snapshot()
+        # Изменения до первого снимка опрос не увидит: индекс сверяет все папки заново
+        self.index.invalidate_all()
+        while not self._stop_event.wait(RECORDINGS_POLL_INTERVAL):
+            new_snapshot = self._poll_snapshot()
+            dates = set()
+            if new_snapshot[0] != snapshot[0]: dates.add(None)
+            for date, stamp in new_snapshot[1].items():
+                if snapshot[1].get(date) != stamp: dates.add(date)
+            if set(snapshot[1]) - set(new_snapshot[1]): dates.add(None)
+            if dates: self._on_disk_change(dates)
+            snapshot = new_snapshot
+
+    def _poll_snapshot(self):
+        """
+        Returns (root mtime, {date: stamp}). For most folders the stamp is the
+        folder mtime (files added, removed or renamed); for the most recent
+        folders it also covers the mtime and size of every file, so in-place
+        rewrites by other processes are noticed too.
+        """
+        try:
+            root_mtime = os.stat(self.rec_dir).st_mtime_ns
+            with os.scandir(self.rec_dir) as entries:
+                date_entries = sorted((e for e in entries if is_date_dir_name(e.name) and e.is_dir()), key=lambda e: e.name)
+        except OSError:
+            return (None, {})
+        stamps = {}
+        recent = {e.name for e in date_entries[-RECORDINGS_POLL_RECENT_DATES:]}
+        for entry in date_entries:
+            try:
+                stamp = entry.stat().st_mtime_ns
+                if entry.name in recent:
+                    with os.scandir(entry.path) as files:
+                        file_stats = [(f.name, f.stat()) for f in files if f.is_file()]
+                    stamp = (stamp, tuple(sorted((name, st.st_mtime_ns, st.st_size) for name, st in file_stats)))
+            except OSError:
+                continue
+            stamps[entry.name] = stamp
+        return (root_mtime, stamps)
+
+class _Inotify:
+    """Minimal ctypes wrapper over Linux inotify for the rec/<date>/ layout."""
+
+    IN_MODIFY = 0x00000002
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_FROM = 0x00000040
+    IN_MOVED_TO = 0x00000080
+    IN_CREATE = 0x00000100
+    IN_DELETE = 0x00000200
+    IN_DELETE_SELF = 0x00000400
+    IN_MOVE_SELF = 0x00000800
+    IN_Q_OVERFLOW = 0x00004000
+    IN_IGNORED = 0x00008000
+    IN_ISDIR = 0x40000000
+    IN_NONBLOCK = 0o4000
+    IN_CLOEXEC = 0o2000000
+    # IN_MODIFY не слушаем: при записи файла он приходит на каждый блок, достаточно IN_CLOSE_WRITE
+    WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF
+    _EVENT_HEADER = struct.Struct('iIII')
+
+    def __init__(self, libc, fd):
+        self._libc = libc
+        self.fd = fd
+        self.root_wd = None
+        self._wd_dates = {}  # Дескриптор наблюдения -> имя папки даты
+        self._lost_events = False
+
+    @classmethod
+    def create(cls):
+        if not sys.platform.startswith('linux'): return None
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+            fd = libc.inotify_init1(cls.IN_NONBLOCK | cls.IN_CLOEXEC)
+        except (OSError, AttributeError):
+            return None
+        return cls(libc, fd) if fd >= 0 else None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        os.close(self.fd)
+
+    def _add_watch(self, path):
+        wd = self._libc.inotify_add_watch(self.fd, os.fsencode(path), self.WATCH_MASK)
+        if wd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno), path)
+        return wd
+
+    def watch_tree(self, rec_dir):
+        self.rec_dir = rec_dir
+        self.root_wd = self._add_watch(rec_dir)
+        with os.scandir(rec_dir) as entries:
+            for entry in entries:
+                if is_date_dir_name(entry.name) and entry.is_dir(): self._watch_date(entry.name)
+
+    def _watch_date(self, date):
+        try:
+            self._wd_dates[self._add_watch(os.path.join(self.rec_dir, date))] = date
+        except OSError as e:
+            logging.warning(f"Не удалось наблюдать за папкой {date}: {e}")
+
+    def take_lost_events(self):
+        """Returns True (once) if events were lost since the last call: queue overflow or rec/ itself gone."""
+        lost, self._lost_events = self._lost_events, False
+        return lost
+
+    def read_changes(self, timeout):
+        """Waits for events and returns the set of changed dates (None = the list of dates changed)."""
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable: return set()
+        try:
+            buffer = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return set()
+        changed, offset = set(), 0
+        while offset + self._EVENT_HEADER.size <= len(buffer):
+            wd, mask, _cookie, length = self._EVENT_HEADER.unpack_from(buffer, offset)
+            offset += self._EVENT_HEADER.size
+            name = buffer[offset:offset + length].rstrip(b'\0').decode('utf-8', 'surrogateescape')
+            offset += length
+            if mask & self.IN_Q_OVERFLOW:
+                self._lost_events = True
+                changed.add(None)
+            elif wd == self.root_wd:
+                if mask & (self.IN_DELETE_SELF | self.IN_MOVE_SELF | self.IN_IGNORED):
+                    # Папку rec/ удалили или переместили: наблюдение восстановится, когда она появится снова
+                    self.root_wd = None
+                    self._wd_dates.clear()
+                    self._lost_events = True
+                    changed.add(None)
+                elif mask & self.IN_ISDIR and is_date_dir_name(name):
+                    if mask & (self.IN_CREATE | self.IN_MOVED_TO): self._watch_date(name)
+                    changed.update((None, name))
+            elif wd in self._wd_dates:
+                date = self._wd_dates[wd]
+                if mask & self.IN_IGNORED: self._wd_dates.pop(wd, None)
+                changed.add(date)
+        return changed
+
+recordings_watcher = RecordingsWatcher(REC_DIR, recordings_index)
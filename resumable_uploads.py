@@ -0,0 +1,277 @@
+import os
+import time
+import uuid
+import base64
+import hashlib
+import logging
+import threading
+
+from upload_transcoder import upload_jobs, StreamingTranscoder, UPLOAD_STAGING_DIR
+
+RESUMABLE_EXPIRE_SECONDS = 24 * 3600  # Незавершенная загрузка без новых частей удаляется через сутки
+RESUMABLE_SWEEP_INTERVAL = 600
+RESUMABLE_MAX_SIZE = 16 * 1024 ** 3
+RESUMABLE_WRITE_CHUNK = 64 * 1024
+RESUMABLE_FEED_CHUNK = 1024 * 1024
+CHECKSUM_ALGORITHMS = ('sha256', 'sha1', 'md5')
+
+class UploadConflict(Exception):
+    """The chunk is outside the file or overlaps a chunk that is still being written."""
+
+class UploadGone(Exception):
+    """The upload was cancelled or has expired."""
+
+class ChecksumMismatch(Exception):
+    """The chunk does not match its Upload-Checksum."""
+
+def parse_upload_metadata(header):
+    """Parses tus Upload-Metadata: comma-separated "key base64(value)" pairs."""
+    metadata = {}
+    for pair in filter(None, (p.strip() for p in (header or '').split(','))):
+        key, _, value = pair.partition(' ')
+        try:
+            metadata[key] = base64.b64decode(value.strip(), validate=True).decode('utf-8')
+        except ValueError:
+            raise ValueError(f"Некорректное значение метаданных '{key}'")
+    return metadata
+
+def parse_checksum(header):
+    """Parses tus Upload-Checksum ("sha256 base64(digest)"); returns (algorithm, digest) or None."""
+    if not header: return None
+    algorithm, _, value = header.strip().partition(' ')
+    if algorithm not in CHECKSUM_ALGORITHMS: raise ValueError(f"Неподдерживаемый алгоритм контрольной суммы: {algorithm}")
+    try:
+        return algorithm, base64.b64decode(value.strip(), validate=True)
+    except ValueError:
+        raise ValueError("Некорректная контрольная сумма")
+
+def _add_range(ranges, start, end):
+    merged = []
+    for s, e in sorted(ranges + [(start, end)]):
+        if merged and s <= merged[-1][1]: merged[-1] = (merged[-1][0], max(merged[-1][1], e))
+        else: merged.append((s, e))
+    return merged
+
+def _remove_range(ranges, start, end):
+    result = []
+    for s, e in ranges:
+        if s < start: result.append((s, min(e, start)))
+        if e > end: result.append((max(s, end), e))
+    return [(s, e) for s, e in result if s < e]
+
+class ResumableUpload:
+    """
+    One file uploaded in chunks (tus-like): PATCH requests write their bytes
+    at the given offset of a preallocated file, in any order and in
+    parallel. A feeder thread follows the contiguous prefix of received
+    bytes, hashes it and pipes it into the streaming transcoder, so
+    conversion runs while chunks are still arriving.
+
+    Bytes already fed to ffmpeg are never rewritten, and the feeder never
+    reads past the start of a chunk that is still being written.
+    """
+
+    def __init__(self, job, transcoder, length, sha256, on_done):
+        self.id = uuid.uuid4().hex
+        self.job = job
+        self.length = length
+        self.expected_sha256 = sha256.lower() if sha256 else None
+        self.updated_at = time.time()
+        job.size = length
+        self._transcoder = transcoder
+        self._on_done = on_done
+        self._condition = threading.Condition()
+        self._received = []  # Принятые диапазоны [начало, конец), объединенные и отсортированные
+        self._in_flight = {}  # Диапазоны, которые сейчас пишут запросы PATCH
+        self._fed = 0  # Сколько байт от начала уже передано в ffmpeg
+        self._complete = False
+        self._abort_reason = None
+        # Файл нужного размера создается сразу: части пишутся на свои места в любом порядке
+        with open(transcoder.source_path, 'wb') as f: f.truncate(length)
+        threading.Thread(target=self._feed, name=f'upload-feed-{self.id[:8]}', daemon=True).start()
+
+    @property
+    def source_path(self):
+        return self._transcoder.source_path
+
+    @property
+    def part_path(self):
+        return self._transcoder.part_path
+
+    @property
+    def finished(self):
+        return self._complete or self._abort_reason is not None
+
+    def _prefix(self):
+        return self._received[0][1] if self._received and self._received[0][0] == 0 else 0
+
+    def _feed_limit(self):
+        return min([self._prefix()] + [start for start, _ in self._in_flight.values()])
+
+    def status(self):
+        with self._condition:
+            return {
+                "upload_id": self.id, "job_id": self.job.id, "length": self.length,
+                "offset": self.length if self._complete else self._prefix(),
+                "ranges": [list(r) for r in self._received], "complete": self._complete,
+            }
+
+    def write_chunk(self, offset, stream, content_length, checksum=None):
+        """Writes one PATCH body of content_length bytes at offset; returns the new contiguous offset."""
+        end = offset + content_length
+        with self._condition:
+            if self._abort_reason: raise UploadGone(self._abort_reason)
+            # Повтор последней части, ответ на которую потерялся
+            if self._complete: return self.length
+            if offset < 0 or content_length < 0 or end > self.length:
+                raise UploadConflict(f"Часть {offset}-{end} выходит за размер файла {self.length}")
+            if any(offset < e and s < end for s, e in self._in_flight.values()):
+                raise UploadConflict(f"Часть {offset}-{end} пересекается с частью, которая загружается сейчас")
+            # Уже переданное в ffmpeg не перезаписывается: повтор части после обрыва безопасен
+            start = min(max(offset, self._fed), end)
+            token = object()
+            self._in_flight[token] = (start, end)
+        digest = hashlib.new(checksum[0]) if checksum else None
+        position = offset
+        try:
+            with open(self._transcoder.source_path, 'r+b') as f:
+                f.seek(start)
+                while position < end and not self._abort_reason:
+                    data = stream.read(min(RESUMABLE_WRITE_CHUNK, end - position))
+                    if not data: break
+                    if digest: digest.update(data)
+                    skip = max(start - position, 0)
+                    if skip < len(data): f.write(data[skip:])
+                    position += len(data)
+        finally:
+            with self._condition:
+                del self._in_flight[token]
+                written = max(position, start)
+                if checksum and (written < end or digest.digest() != checksum[1]):
+                    # Содержимое диапазона теперь неизвестно: часть нужно прислать заново
+                    self._received = _remove_range(self._received, start, end)
+                    mismatch = written == end
+                elif written > start:
+                    self._received = _add_range(self._received, start, written)
+                    mismatch = False
+                else:
+                    mismatch = False
+                self.job.received_bytes = sum(e - s for s, e in self._received)
+                self.updated_at = time.time()
+                self._condition.notify_all()
+                new_offset = self._prefix()
+        if self._abort_reason: raise UploadGone(self._abort_reason)
+        if mismatch: raise ChecksumMismatch(f"Контрольная сумма части {offset}-{end} не совпадает")
+        if position < end: raise UploadConflict(f"Часть {offset}-{end} получена не полностью ({position - offset} байт)")
+        return new_offset
+
+    def abort(self, reason):
+        """Cancels the upload; files are removed once running chunk writes stop."""
+        with self._condition:
+            if self.finished: return False
+            self._abort_reason = reason
+            self._condition.notify_all()
+        return True
+
+    def _feed(self):
+        sha256 = hashlib.sha256()
+        try:
+            # Без буфера: буферизованное чтение заранее захватило бы еще не записанные части
+            with open(self._transcoder.source_path, 'rb', buffering=0) as f:
+                while self._fed < self.length:
+                    with self._condition:
+                        self._condition.wait_for(lambda: self._abort_reason or self._feed_limit() > self._fed)
+                        if self._abort_reason: break
+                        limit = self._feed_limit()
+                    while self._fed < limit:
+                        data = f.read(min(RESUMABLE_FEED_CHUNK, limit - self._fed))
+                        if not data: raise OSError("файл загрузки короче ожидаемого")
+                        sha256.update(data)
+                        self._transcoder.write(data)
+                        with self._condition: self._fed += len(data)
+        except Exception as e:
+            logging.error(f"Ошибка передачи загрузки {self.job.filename} в ffmpeg: {e}")
+            with self._condition:
+                if not self._abort_reason: self._abort_reason = f"Ошибка чтения загрузки: {e}"
+        with self._condition:
+            if self._abort_reason:
+                # Файл удаляется только после того, как все запросы PATCH его закрыли
+                self._condition.wait_for(lambda: not self._in_flight)
+                reason = self._abort_reason
+            else:
+                reason = None
+                self.job.sha256 = sha256.hexdigest()
+                if self.expected_sha256 and self.expected_sha256 != self.job.sha256:
+                    reason = self._abort_reason = f"Контрольная сумма файла не совпадает (получен {self.job.sha256})"
+                else:
+                    self._complete = True
+            self.updated_at = time.time()
+        if reason:
+            self._transcoder.abort(reason)
+            logging.warning(f"Загрузка {self.job.filename} отменена: {reason}")
+        else:
+            self._transcoder.finish(self._on_done)
+
+class ResumableUploads:
+    """
+    Registry of chunked uploads. A background sweep cancels uploads that got
+    no chunks for RESUMABLE_EXPIRE_SECONDS and removes staging files left
+    behind by a previous run of the server (upload state is kept in memory).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._uploads = {}
+        self._thread = None
+
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._loop, name='resumable-uploads-sweep', daemon=True)
+                self._thread.start()
+
+    def _loop(self):
+        while True:
+            try:
+                self.sweep()
+            except Exception as e:
+                logging.error(f"Ошибка очистки загрузок: {e}")
+            time.sleep(RESUMABLE_SWEEP_INTERVAL)
+
+    def create(self, filename, length, source_path, mp3_path, sha256, on_done):
+        self.start()
+        job = upload_jobs.create(filename)
+        transcoder = StreamingTranscoder(job, source_path, mp3_path, tee=False)
+        try:
+            upload = ResumableUpload(job, transcoder, length, sha256, on_done)
+        except Exception as e:
+            transcoder.abort(f"Не удалось создать файл загрузки: {e}")
+            raise
+        with self._lock:
+            self._uploads[upload.id] = upload
+        return upload
+
+    def get(self, upload_id):
+        with self._lock:
+            return self._uploads.get(upload_id)
+
+    def sweep(self):
+        deadline = time.time() - RESUMABLE_EXPIRE_SECONDS
+        with self._lock:
+            expired = [u for u in self._uploads.values() if u.updated_at < deadline]
+            for upload in expired: del self._uploads[upload.id]
+            in_use = {path for u in self._uploads.values() for path in (u.source_path, u.part_path)}
+        for upload in expired:
+            upload.abort("Загрузка не завершена вовремя")
+        # Файлы без владельца (остались после перезапуска или сбоя) удаляются, когда давно не менялись
+        try: entries = list(os.scandir(UPLOAD_STAGING_DIR))
+        except OSError: return
+        for entry in entries:
+            try:
+                if entry.path not in in_use and entry.is_file() and entry.stat().st_mtime < deadline:
+                    os.remove(entry.path)
+                    logging.info(f"Удален брошенный файл загрузки {entry.name}")
+            except OSError:
+                pass
+
+resumable_uploads = ResumableUploads()
@@ -0,0 +1,100 @@
+import logging
+import threading
+from types import MappingProxyType
+
+import app_state
+
+# Состояние, которым владеет хранилище; значения по умолчанию совпадают с глобальными переменными app_state
+STATE_KEYS = (
+    "is_recording", "is_paused", "start_time", "pause_start_time", "total_pause_duration",
+    "is_post_processing", "post_process_file_path", "post_process_stage",
+    "server_running",
+)
+
+class StateStore:
+    """
+    Recording, post-processing and server state with change notification.
+
+    Every change is made under one lock and publishes a new read-only
+    snapshot with a bumped version, so readers never see a half-applied
+    transition (e.g. is_recording set but start_time not yet). Consumers
+    either block in wait_for_change()/wait_for() on a condition variable or
+    subscribe() a callback instead of polling. Updates that change nothing
+    do not bump the version or wake anyone.
+
+    The legacy module globals in app_state are kept in sync for code that
+    still reads them directly; they must not be assigned outside the store.
+    """
+
+    def __init__(self, keys, mirror=None):
+        self._mirror = mirror
+        self._condition = threading.Condition()
+        self._subscribers = []
+        self._version = 1
+        self._snapshot = MappingProxyType({key: getattr(mirror, key, None) for key in keys})
+
+    @property
+    def version(self):
+        return self._version
+
+    def snapshot(self):
+        return self._snapshot
+
+    def get(self, key):
+        return self._snapshot[key]
+
+    def update(self, **changes):
+        """Applies the changes atomically; returns the new version."""
+        return self.transition(None, **changes)
+
+    def transition(self, expected, **changes):
+        """
+        Compare-and-set: applies the changes only if every key in `expected`
+        currently has the given value. Returns the new version, or None if
+        the state did not match.
+        """
+        with self._condition:
+            current = self._snapshot
+            unknown = [key for key in changes if key not in current]
+            if unknown: raise KeyError(f"Неизвестные ключи состояния: {unknown}")
+            if expected and any(current[key] != value for key, value in expected.items()): return None
+            changed = {key: value for key, value in changes.items() if current[key] != value}
+            if not changed: return self._version
+            state = dict(current)
+            state.update(changed)
+            self._snapshot = MappingProxyType(state)
+            self._version += 1
+            if self._mirror is not None:
+                for key, value in changed.items(): setattr(self._mirror, key, value)
+            self._condition.notify_all()
+            snapshot, version, subscribers = self._snapshot, self._version, list(self._subscribers)
+        # Подписчики вызываются вне блокировки, в потоке, который изменил состояние
+        for callback in subscribers:
+            try:
+                callback(snapshot, changed)
+            except Exception as e:
+                logging.error(f"Ошибка подписчика состояния {callback!r}: {e}")
+        return version
+
+    def wait_for_change(self, since_version, timeout=None):
+        """Blocks until the version differs from since_version (or the timeout); returns (version, snapshot)."""
+        with self._condition:
+            self._condition.wait_for(lambda: self._version != since_version, timeout)
+            return self._version, self._snapshot
+
+    def wait_for(self, predicate, timeout=None):
+        """Blocks until predicate(snapshot) is true; returns the snapshot, or None on timeout."""
+        with self._condition:
+            if self._condition.wait_for(lambda: predicate(self._snapshot), timeout): return self._snapshot
+            return None
+
+    def subscribe(self, callback):
+        """callback(snapshot, changed) is called after every change; returns a function that unsubscribes."""
+        with self._condition:
+            self._subscribers.append(callback)
+        def unsubscribe():
+            with self._condition:
+                if callback in self._subscribers: self._subscribers.remove(callback)
+        return unsubscribe
+
+state_store = StateStore(STATE_KEYS, mirror=app_state)
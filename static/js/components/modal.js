@@ -1,5 +1,5 @@
 import { modal, modalTitle, modalConfirmBtn, modalCancelBtn, modalSettingsCol, modalContactsCol, modalPreviewCol } from '../dom.js';
-import { getSettingsFromDOM } from '../utils/helpers.js';
+import { getSettingsFromDOM, fetchPromptPreview, renderPromptBudgetInfo } from '../utils/helpers.js';
 import { initSettings, loadSettings, toggleMeetingDateSourceVisibility, updatePromptPreview } from './settings.js';
 import { initContacts, loadContactsAndSettings, updateSelectedContactsCount } from './contacts.js';
 
@@ -43,15 +43,12 @@ export function showConfirmationModal(onConfirm, recordingInfo = null) {
             // Для новой записи используем текущую дату (важно для предпросмотра "даты из папки")
             requestBody.recording_date = new Date().toISOString().split('T')[0];
         }
-        const response = await fetch('/preview_prompt_addition', {
-            method: 'POST',
-            headers: { 'Content-Type': 'application/json' },
-            body: JSON.stringify(requestBody),
-        });
-        const data = await response.json();
+        const data = await fetchPromptPreview(requestBody, 'modal');
+        if (!data) return; // Запрос вытеснен более новым
         const modalPreviewContent = modal.querySelector('#prompt-preview-content');
         if (modalPreviewContent) {
             modalPreviewContent.textContent = data.prompt_text || '';
+            renderPromptBudgetInfo(modalPreviewContent.parentElement, data.budget);
         }
 
         updateSelectedContactsCount(modal);
@@ -156,15 +153,12 @@ export function initModal() {
     // Этот обработчик будет вызывать обновление предпросмотра при любом изменении
     const saveAndPreviewFromModal = async () => {
         const settingsFromModal = getSettingsFromDOM(modal);
-        const response = await fetch('/preview_prompt_addition', {
-            method: 'POST',
-            headers: { 'Content-Type': 'application/json' },
-            body: JSON.stringify({ ...settingsFromModal }),
-        });
-        const data = await response.json();
+        const data = await fetchPromptPreview({ ...settingsFromModal }, 'modal');
+        if (!data) return; // Запрос вытеснен более новым
         const modalPreviewContent = modal.querySelector('#prompt-preview-content');
         if (modalPreviewContent) {
             modalPreviewContent.textContent = data.prompt_text || '';
+            renderPromptBudgetInfo(modalPreviewContent.parentElement, data.budget);
         }
         updateSelectedContactsCount(modal);
     };
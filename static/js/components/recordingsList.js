@@ -2,7 +2,7 @@ import { recordingsListContainer } from '../dom.js';
 import { showConfirmationModal } from './modal.js';
 
 let expandedGroups = new Set();
-let lastRecordingsState = 0;
+let recordingsState = { epoch: null, generation: 0 };
 let updatesIntervalId = null;
 let isUpdatesPaused = false;
 
@@ -45,7 +45,9 @@ async function loadRecordingsForGroup(groupEl, date) {
                 <div class="recording-cell cell-duration">${Math.floor(rec.duration / 60)} м ${Math.round(rec.duration % 60)} с</div>
                 <div class="recording-cell cell-title"><span class="editable-title" data-date="${date}" data-filename="${rec.filename}" data-prompt-addition="${escapeHtml(rec.promptAddition)}">${rec.title}</span></div>
                 <div class="recording-cell cell-files">
-                    <a href="/files/${date}/${rec.filename}" target="_blank" class="action-btn audio-link">${audioExtension}</a>
+                    ${rec.audio_evicted
+                        ? '<span class="action-btn audio-link" title="Аудио удалено политикой хранения">—</span>'
+                        : `<a href="/files/${date}/${rec.filename}" target="_blank" class="action-btn audio-link">${audioExtension}</a>`}
                     <span class="file-action-pair">
                         <a href="/files/${date}/${rec.transcription_filename}" target="_blank" class="action-btn transcription-link ${rec.transcription_exists ? 'exists' : ''}">TXT</a>
                         <span class="recreate-actions-container"><button class="action-btn recreate-transcription-btn" title="Пересоздать транскрипцию" data-date="${date}" data-filename="${rec.filename}">&#x21bb;</button></span>
@@ -153,16 +155,30 @@ async function updateRecordingsList() {
 async function checkForRecordingUpdates() {
     if (isUpdatesPaused) return;
     try {
-        const response = await fetch('/recordings_state');
+        const params = new URLSearchParams();
+        if (recordingsState.epoch) {
+            params.set('epoch', recordingsState.epoch);
+            params.set('since', recordingsState.generation);
+        }
+        const response = await fetch(`/recordings_state?${params}`);
         if (response.status === 401) {
             window.location.href = '/login';
             return;
         }
         const state = await response.json();
-        if (state.last_modified > lastRecordingsState) {
+        recordingsState = { epoch: state.epoch, generation: state.generation };
+
+        const missingDates = state.changed_dates.filter(date => !recordingsListContainer.querySelector(`.date-group[data-date="${date}"]`));
+        if (state.full || missingDates.length > 0) {
             console.log('Обнаружены изменения в записях, обновляю список...');
-            lastRecordingsState = state.last_modified;
             await updateRecordingsList();
+            return;
+        }
+        // Перезагружаем только изменившиеся и раскрытые группы дат
+        for (const date of state.changed_dates) {
+            if (!expandedGroups.has(date)) continue;
+            const groupEl = recordingsListContainer.querySelector(`.date-group[data-date="${date}"]`);
+            if (groupEl) await loadRecordingsForGroup(groupEl, date);
         }
     } catch (error) {
         console.error('Ошибка при проверке состояния записей:', error);
@@ -11,11 +11,11 @@ import {
     promptPreviewContent,
 } from '../dom.js';
 
-import { getSettingsFromDOM } from '../utils/helpers.js';
+import { getSettingsFromDOM, fetchPromptPreview, renderPromptBudgetInfo } from '../utils/helpers.js';
 
 let settings = {};
 
-function addContextRuleRow(pattern = '', prompt = '', isEnabled = true, container, onUpdate) {
+function addContextRuleRow(pattern = '', prompt = '', isEnabled = true, container, onUpdate, priority = 0, truncate = 'head') {
     const ruleItem = document.createElement('div');
     ruleItem.className = 'context-rule-item';
 
@@ -29,7 +29,18 @@ function addContextRuleRow(pattern = '', prompt = '', isEnabled = true, containe
             <button type="button" class="action-btn remove-rule-btn">&times;</button>
         </div>
         <textarea class="context-rule-prompt" rows="8" placeholder="Добавка к промпту...">${prompt}</textarea>
+        <div class="context-rule-budget">
+            <label>Приоритет <input type="number" class="context-rule-priority input-field" value="${priority}" step="1"></label>
+            <label>При нехватке бюджета
+                <select class="context-rule-truncate input-field">
+                    <option value="head">оставить начало</option>
+                    <option value="tail">оставить конец</option>
+                    <option value="rows">выборка строк</option>
+                </select>
+            </label>
+        </div>
     `;
+    ruleItem.querySelector('.context-rule-truncate').value = truncate;
 
     ruleItem.querySelector('.remove-rule-btn').addEventListener('click', () => {
         ruleItem.remove();
@@ -39,6 +50,8 @@ function addContextRuleRow(pattern = '', prompt = '', isEnabled = true, containe
     ruleItem.querySelector('.context-rule-enabled').addEventListener('change', onUpdate);
     ruleItem.querySelector('.context-rule-pattern').addEventListener('input', onUpdate);
     ruleItem.querySelector('.context-rule-prompt').addEventListener('input', onUpdate);
+    ruleItem.querySelector('.context-rule-priority').addEventListener('input', onUpdate);
+    ruleItem.querySelector('.context-rule-truncate').addEventListener('change', onUpdate);
 
     container.appendChild(ruleItem);
     return ruleItem;
@@ -49,7 +62,7 @@ function renderContextFileRules(rules = []) {
     contextRulesContainer.innerHTML = '';
     if (rules && rules.length > 0) {
         rules.forEach(rule => {
-            addContextRuleRow(rule.pattern, rule.prompt, rule.enabled, contextRulesContainer, () => saveSettings(['context_file_rules']).then(updatePromptPreview));
+            addContextRuleRow(rule.pattern, rule.prompt, rule.enabled, contextRulesContainer, () => saveSettings(['context_file_rules']).then(updatePromptPreview), rule.priority, rule.truncate);
         });
     } else {
         addContextRuleRow('', '', true, contextRulesContainer, () => saveSettings(['context_file_rules']).then(updatePromptPreview));
@@ -65,16 +78,12 @@ async function updatePromptPreview(container = document) {
 
     try {
         const settings = getSettingsFromDOM(container);
-        const response = await fetch('/preview_prompt_addition', { method: 'POST', headers: { 'Content-Type': 'application/json' }, body: JSON.stringify(settings) });
-
-        if (!response.ok) {
-            throw new Error(`HTTP error! status: ${response.status}`);
-        }
-
-        const data = await response.json();
+        const data = await fetchPromptPreview(settings, isModal ? 'modal' : 'main');
+        if (!data) return; // Запрос вытеснен более новым
         if (data.prompt_text) {
             localPromptPreviewContent.textContent = data.prompt_text;
             localPromptPreviewContainer.style.display = 'block';
+            renderPromptBudgetInfo(localPromptPreviewContainer, data.budget);
         } else {
             localPromptPreviewContainer.style.display = 'none';
         }
@@ -194,6 +203,14 @@ export async function loadSettings(settingsObj = null, container = document) {
     const localConfirmCheckbox = container.querySelector('#confirm-prompt-on-action');
     if(localConfirmCheckbox) localConfirmCheckbox.checked = settings.confirm_prompt_on_action;
 
+    const promptBudget = settings.prompt_budget || {};
+    const budgetEnabled = container.querySelector('#prompt-budget-enabled');
+    if(budgetEnabled) budgetEnabled.checked = !!promptBudget.enabled;
+    const budgetUnit = container.querySelector('#prompt-budget-unit');
+    if(budgetUnit) budgetUnit.value = promptBudget.unit || 'chars';
+    const budgetLimit = container.querySelector('#prompt-budget-limit');
+    if(budgetLimit) budgetLimit.value = promptBudget.limit ?? '';
+
     renderMeetingNameTemplates(settings.meeting_name_templates, settings.active_meeting_name_template_id, container);
     toggleMeetingDateSourceVisibility(localAddMeetingDateCheckbox, container.querySelector('#meeting-date-source-group'));
     renderContextFileRules(settings.context_file_rules, container);
@@ -221,6 +238,9 @@ export function initSettings(container = document, onUpdate = null, initialSetti
             radio.addEventListener('change', () => { saveSettings(['meeting_date_source']).then(() => updatePromptPreview()); });
         });
         form.querySelector('#confirm-prompt-on-action')?.addEventListener('change', () => { saveSettings(['confirm_prompt_on_action']).then(() => updatePromptPreview()); });
+        ['#prompt-budget-enabled', '#prompt-budget-unit', '#prompt-budget-limit'].forEach(selector => {
+            form.querySelector(selector)?.addEventListener('change', () => { saveSettings(['prompt_budget']).then(() => updatePromptPreview()); });
+        });
 
         form.addEventListener('submit', (e) => e.preventDefault());
     } else if (initialSettings) {
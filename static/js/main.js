@@ -54,28 +54,95 @@ document.addEventListener('DOMContentLoaded', function () {
         const file = event.target.files[0];
         if (!file) return;
 
-        const uploadFile = (settings) => {
-            const formData = new FormData();
-            formData.append('file', file);
-            formData.append('settings', JSON.stringify(settings));
-
-            fetch('/add_file', { method: 'POST', body: formData })
-                .then(res => {
-                    // Проверяем, не вернул ли сервер ошибку (например, 500)
-                    if (!res.ok) {
-                        // Если есть ошибка, пытаемся извлечь сообщение и пробросить его дальше
-                        return res.json().then(errData => { throw new Error(errData.message || 'Ошибка сервера'); });
-                    }
-                    return res.json();
-                })
-                .then(data => {
-                    // Показываем alert, только если в ответе от сервера есть статус "error"
-                    if (data.status === 'error') {
-                        alert(data.message || 'Произошла ошибка при обработке файла.');
-                    }
-                    // Если статус "ok", ничего не делаем.
+        const watchUpload = (jobId) => {
+            fetch(`/uploads/${jobId}`)
+                .then(res => res.ok ? res.json() : null)
+                .then(job => {
+                    if (!job) return;
+                    if (job.status === 'error') alert(`Ошибка конвертации файла в MP3: ${job.error}`);
+                    else if (job.status !== 'done') setTimeout(() => watchUpload(jobId), 2000);
                 })
-                .catch(err => alert(`Ошибка загрузки: ${err.message || err}`));
+                .catch(() => {});
+        };
+
+        const UPLOAD_CHUNK_SIZE = 8 * 1024 * 1024;
+        const UPLOAD_PARALLEL = 3;
+        const UPLOAD_MAX_ATTEMPTS = 20;
+        const toBase64 = (text) => btoa(unescape(encodeURIComponent(text)));
+        const sleep = (ms) => new Promise(resolve => setTimeout(resolve, ms));
+
+        const chunkChecksum = async (blob) => {
+            // crypto.subtle есть только на https и localhost; без него части отправляются без контрольной суммы
+            if (!window.crypto?.subtle) return null;
+            const digest = new Uint8Array(await crypto.subtle.digest('SHA-256', await blob.arrayBuffer()));
+            return 'sha256 ' + btoa(String.fromCharCode(...digest));
+        };
+
+        const sendChunk = async (location, start) => {
+            const blob = file.slice(start, start + UPLOAD_CHUNK_SIZE);
+            const headers = { 'Content-Type': 'application/offset+octet-stream', 'Upload-Offset': String(start), 'Tus-Resumable': '1.0.0' };
+            const checksum = await chunkChecksum(blob);
+            if (checksum) headers['Upload-Checksum'] = checksum;
+            const res = await fetch(location, { method: 'PATCH', headers, body: blob });
+            if (res.status === 404 || res.status === 410) {
+                const data = await res.json().catch(() => ({}));
+                throw Object.assign(new Error(data.message || 'Загрузка отменена сервером'), { fatal: true });
+            }
+            if (!res.ok) throw new Error(`HTTP ${res.status}`);
+        };
+
+        const missingChunks = async (location) => {
+            // Какие части сервер еще не получил целиком (после обрыва связи)
+            const res = await fetch(location, { cache: 'no-store' });
+            if (res.status === 404) throw Object.assign(new Error('Загрузка не найдена на сервере'), { fatal: true });
+            if (!res.ok) throw new Error(`HTTP ${res.status}`);
+            const { ranges } = await res.json();
+            const missing = [];
+            for (let start = 0; start < file.size; start += UPLOAD_CHUNK_SIZE) {
+                const end = Math.min(start + UPLOAD_CHUNK_SIZE, file.size);
+                if (!ranges.some(([s, e]) => s <= start && e >= end)) missing.push(start);
+            }
+            return missing;
+        };
+
+        const uploadFile = async (settings) => {
+            try {
+                const metadata = `filename ${toBase64(file.name)},settings ${toBase64(JSON.stringify(settings))}`;
+                const created = await fetch('/uploads/resumable', {
+                    method: 'POST',
+                    headers: { 'Upload-Length': String(file.size), 'Upload-Metadata': metadata, 'Tus-Resumable': '1.0.0' }
+                });
+                const upload = await created.json();
+                if (!created.ok) throw new Error(upload.message || 'Ошибка сервера');
+
+                // Части отправляются параллельно; после сбоя догружаются только недостающие
+                let pending = [];
+                for (let start = 0; start < file.size; start += UPLOAD_CHUNK_SIZE) pending.push(start);
+                for (let attempt = 1; pending.length; attempt++) {
+                    const queue = [...pending];
+                    let failed = false;
+                    const worker = async () => {
+                        while (queue.length) {
+                            const start = queue.shift();
+                            try {
+                                await sendChunk(upload.location, start);
+                            } catch (err) {
+                                if (err.fatal) throw err;
+                                failed = true;
+                            }
+                        }
+                    };
+                    await Promise.all(Array.from({ length: UPLOAD_PARALLEL }, worker));
+                    if (!failed) break;
+                    if (attempt >= UPLOAD_MAX_ATTEMPTS) throw new Error('Нет связи с сервером');
+                    await sleep(Math.min(30000, 1000 * 2 ** attempt));
+                    pending = await missingChunks(upload.location).catch(err => { if (err.fatal) throw err; return pending; });
+                }
+                // Конвертация идет в фоне: следим за ней, чтобы сообщить об ошибке
+                watchUpload(upload.job_id);
+            } catch (err) {
+                alert(`Ошибка загрузки: ${err.message || err}`);
+            }
         };
 
         const response = await fetch('/get_web_settings');
@@ -12,7 +12,9 @@ export function getSettingsFromDOM(container = document) {
                 rules.push({
                     pattern: pattern,
                     prompt: item.querySelector('.context-rule-prompt').value,
-                    enabled: item.querySelector('.context-rule-enabled').checked
+                    enabled: item.querySelector('.context-rule-enabled').checked,
+                    priority: parseInt(item.querySelector('.context-rule-priority')?.value, 10) || 0,
+                    truncate: item.querySelector('.context-rule-truncate')?.value || 'head'
                 });
             }
         });
@@ -53,5 +55,83 @@ export function getSettingsFromDOM(container = document) {
         context_file_rules: getContextFileRulesFromDOM(container),
         meeting_name_templates: getMeetingNameTemplatesFromDOM(container),
         confirm_prompt_on_action: getChecked('#confirm-prompt-on-action'),
+        prompt_budget: {
+            enabled: getChecked('#prompt-budget-enabled'),
+            unit: getVal('#prompt-budget-unit') || 'chars',
+            limit: parseInt(getVal('#prompt-budget-limit'), 10) || 0,
+        },
     };
 }
+
+/**
+ * Показывает под предпросмотром, сколько бюджета промпта использовано и что было сокращено.
+ * @param {HTMLElement} previewContainer - Контейнер предпросмотра.
+ * @param {object|null} budget - Отчет сервера или null, если бюджет выключен.
+ */
+export function renderPromptBudgetInfo(previewContainer, budget) {
+    if (!previewContainer) return;
+    let info = previewContainer.querySelector('.prompt-budget-info');
+    if (!budget) {
+        info?.remove();
+        return;
+    }
+    if (!info) {
+        info = document.createElement('div');
+        info.className = 'prompt-budget-info';
+        previewContainer.appendChild(info);
+    }
+    const unitLabel = budget.unit === 'tokens' ? 'токенов' : 'символов';
+    const lines = [`Бюджет: ${budget.used} из ${budget.limit} ${unitLabel}`];
+    budget.cut.forEach(c => {
+        lines.push(c.strategy === 'dropped'
+            ? `${c.source}: не поместился (${c.original})`
+            : `${c.source}: ${c.original} → ${c.kept} (${c.strategy})`);
+    });
+    info.textContent = lines.join('\n');
+    info.classList.toggle('over-budget', budget.cut.length > 0);
+}
+
+
+// --- Предпросмотр промпта ---
+// Каждая вкладка получает свой id, а каждый запрос — возрастающий номер: сервер отбрасывает устаревшие запросы,
+// а предыдущий незавершенный запрос того же канала отменяется на клиенте.
+const previewClientId = (crypto.randomUUID ? crypto.randomUUID() : `${Date.now()}-${Math.random().toString(16).slice(2)}`);
+let previewSeq = 0;
+const previewChannels = {};
+
+/**
+ * Запрашивает предпросмотр промпта. Возвращает { prompt_text } или null, если запрос был вытеснен более новым.
+ * @param {object} body - Настройки для предпросмотра.
+ * @param {string} channel - Независимый канал (например, 'main' или 'modal').
+ */
+export async function fetchPromptPreview(body, channel = 'main') {
+    const state = previewChannels[channel] || (previewChannels[channel] = { controller: null, etag: null, data: null });
+    if (state.controller) state.controller.abort();
+    const controller = new AbortController();
+    state.controller = controller;
+
+    const headers = {
+        'Content-Type': 'application/json',
+        'X-Preview-Client': previewClientId,
+        'X-Preview-Seq': String(++previewSeq),
+    };
+    if (state.etag) headers['If-None-Match'] = state.etag;
+
+    try {
+        const response = await fetch('/preview_prompt_addition', {
+            method: 'POST', headers, body: JSON.stringify(body), signal: controller.signal,
+        });
+        if (response.status === 304) return state.data;
+        if (response.status === 409) return null;
+        if (!response.ok) throw new Error(`HTTP error! status: ${response.status}`);
+        const data = await response.json();
+        state.etag = response.headers.get('ETag');
+        state.data = data;
+        return data;
+    } catch (error) {
+        if (error.name === 'AbortError') return null;
+        throw error;
+    } finally {
+        if (state.controller === controller) state.controller = null;
+    }
+}
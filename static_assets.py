@@ -0,0 +1,205 @@
+import os
+import re
+import time
+import hashlib
+import logging
+import mimetypes
+import posixpath
+import threading
+
+from flask import request, Response, abort, url_for
+
+from app_state import app
+from http_cache import brotli, compress, choose_encoding
+
+ASSETS_URL_PREFIX = '/assets/'
+ASSET_MAX_AGE = 365 * 24 * 3600
+ASSET_HASH_LENGTH = 10
+ASSET_CHECK_INTERVAL = 2.0  # Как часто (не чаще) проверять, не изменились ли файлы в static/
+PRECOMPRESS_EXTENSIONS = ('.js', '.css', '.svg', '.json', '.txt', '.html')
+PRECOMPRESS_MIN_BYTES = 512
+# Реестр Windows может сопоставить .js с text/plain, и браузер откажется выполнять модуль
+_MIMETYPES = {'.js': 'text/javascript', '.css': 'text/css', '.json': 'application/json', '.svg': 'image/svg+xml'}
+
+# Стили страницы склеиваются в один файл; порядок важен — он повторяет прежний порядок <link>
+CSS_BUNDLES = {
+    'css/index.css': [
+        'css/pages/recorder.css', 'css/layout/header.css', 'css/layout/tabs.css', 'css/components/buttons.css',
+        'css/components/forms.css', 'css/components/lists.css', 'css/components/chart.css', 'css/components/modal.css',
+    ],
+}
+
+# Статические import/export ... from '...' и динамический import('...') с относительным путем
+_IMPORT_RE = re.compile(r"""(\bfrom\s*|\bimport\s*\(?\s*)(['"])(\.{1,2}/[^'"]+)\2""")
+
+def _fingerprint(path, digest):
+    stem, ext = posixpath.splitext(path)
+    return f"{stem}.{digest[:ASSET_HASH_LENGTH]}{ext}"
+
+class AssetManifest:
+    """
+    Content-hashed copies of the files in static/, served from memory with
+    long-lived immutable caching.
+
+    Every file gets a name with a hash of its content (js/main.3f2a1b9c0d.js),
+    so a changed file gets a new URL and browsers never have to revalidate.
+    ES modules keep their relative imports, rewritten to the hashed names; the
+    hash of a module covers the modules it imports (transitively), so changing
+    helpers.js also renames every module that imports it. Stylesheets listed
+    in CSS_BUNDLES are concatenated into one file. Compressible assets are
+    gzip- and (if available) brotli-compressed once, at build time.
+
+    The manifest is rebuilt when files in static/ change; assets of previous
+    builds stay available for pages that were loaded before the change.
+    """
+
+    def __init__(self, static_dir):
+        self.static_dir = static_dir
+        self._lock = threading.Lock()
+        self._stamp = None
+        self._checked_at = 0.0
+        self._urls = {}  # Логический путь (js/main.js) -> путь с хэшем
+        self._preloads = {}  # Путь модуля с хэшем -> пути с хэшем всех модулей, которые он импортирует
+        self._assets = {}  # Путь с хэшем -> {'body', 'gzip', 'br', 'mimetype', 'etag'}
+
+    def _scan(self):
+        """Returns {relative path: (mtime_ns, size)} of the files in static/."""
+        stamp = {}
+        for root, _dirs, files in os.walk(self.static_dir):
+            for name in files:
+                path = os.path.join(root, name)
+                try: st = os.stat(path)
+                except OSError: continue
+                stamp[os.path.relpath(path, self.static_dir).replace(os.sep, '/')] = (st.st_mtime_ns, st.st_size)
+        return stamp
+
+    def ensure_current(self):
+        """Rebuilds the manifest if files in static/ changed (checked at most every ASSET_CHECK_INTERVAL seconds)."""
+        now = time.monotonic()
+        if self._stamp is not None and now - self._checked_at < ASSET_CHECK_INTERVAL: return
+        with self._lock:
+            if self._stamp is not None and now - self._checked_at < ASSET_CHECK_INTERVAL: return
+            self._checked_at = now
+            stamp = self._scan()
+            if stamp == self._stamp: return
+            start = time.perf_counter()
+            self._build(stamp)
+            self._stamp = stamp
+            logging.info(f"Статические файлы собраны: {len(self._urls)} шт. за {(time.perf_counter() - start) * 1000:.0f} мс.")
+
+    def _build(self, stamp):
+        sources = {}
+        for path in stamp:
+            try:
+                with open(os.path.join(self.static_dir, path), 'rb') as f: sources[path] = f.read()
+            except OSError as e:
+                print(f"Не удалось прочитать статический файл {path}: {e}")
+        outputs = {}  # Логический путь -> содержимое
+
+        # Зависимости модулей: хэш модуля учитывает содержимое всех модулей, которые он импортирует
+        modules = {path: body.decode('utf-8') for path, body in sources.items() if path.endswith('.js')}
+        imports = {path: self._module_imports(path, text, modules) for path, text in modules.items()}
+        closures = {path: self._closure(path, imports) for path in modules}
+        raw_hashes = {path: hashlib.sha256(body).hexdigest() for path, body in sources.items()}
+        urls = {}
+        for path in modules:
+            digest = hashlib.sha256(''.join(raw_hashes[p] for p in sorted(closures[path] | {path})).encode('ascii')).hexdigest()
+            urls[path] = _fingerprint(path, digest)
+        for path, text in modules.items():
+            outputs[path] = self._rewrite_imports(path, text, modules, urls).encode('utf-8')
+
+        for bundle, parts in CSS_BUNDLES.items():
+            missing = [part for part in parts if part not in sources]
+            if missing: print(f"В наборе стилей {bundle} нет файлов: {', '.join(missing)}")
+            outputs[bundle] = b'\n'.join(f"/* {part} */\n".encode('utf-8') + sources[part] for part in parts if part in sources)
+
+        for path, body in sources.items():
+            if path not in outputs: outputs[path] = body
+        for path, body in outputs.items():
+            if path not in urls: urls[path] = _fingerprint(path, hashlib.sha256(body).hexdigest())
+
+        assets = dict(self._assets)
+        for path, body in outputs.items():
+            url = urls[path]
+            if url not in assets: assets[url] = self._make_asset(path, body, url)
+        self._urls = urls
+        self._preloads = {urls[path]: sorted(urls[p] for p in closures[path]) for path in modules}
+        self._assets = assets
+
+    @staticmethod
+    def _module_imports(path, text, modules):
+        found = set()
+        for _prefix, _quote, specifier in _IMPORT_RE.findall(text):
+            target = posixpath.normpath(posixpath.join(posixpath.dirname(path), specifier))
+            if target in modules: found.add(target)
+        return found
+
+    @staticmethod
+    def _closure(path, imports):
+        seen, stack = set(), list(imports.get(path, ()))
+        while stack:
+            module = stack.pop()
+            if module in seen or module == path: continue
+            seen.add(module)
+            stack.extend(imports.get(module, ()))
+        return seen
+
+    @staticmethod
+    def _rewrite_imports(path, text, modules, urls):
+        base = posixpath.dirname(path)
+        def replace(match):
+            prefix, quote, specifier = match.groups()
+            target = posixpath.normpath(posixpath.join(base, specifier))
+            if target not in modules: return match.group(0)
+            relative = posixpath.relpath(urls[target], base or '.')
+            if not relative.startswith('.'): relative = './' + relative
+            return f"{prefix}{quote}{relative}{quote}"
+        return _IMPORT_RE.sub(replace, text)
+
+    @staticmethod
+    def _make_asset(path, body, url):
+        ext = posixpath.splitext(path)[1].lower()
+        mimetype = _MIMETYPES.get(ext) or mimetypes.guess_type(path)[0] or 'application/octet-stream'
+        if mimetype.startswith('text/'): mimetype += '; charset=utf-8'
+        asset = {'body': body, 'mimetype': mimetype, 'etag': '"' + url.rsplit('.', 2)[-2] + '"'}
+        if path.endswith(PRECOMPRESS_EXTENSIONS) and len(body) >= PRECOMPRESS_MIN_BYTES:
+            asset['gzip'] = compress(body, 'gzip')
+            if brotli is not None: asset['br'] = brotli.compress(body, quality=11)
+        return asset
+
+    # --- Использование в шаблонах и обработчике ---
+    def url(self, path):
+        """Returns the URL of the hashed copy of static/<path> (or of a CSS bundle)."""
+        self.ensure_current()
+        hashed = self._urls.get(path)
+        return ASSETS_URL_PREFIX + hashed if hashed else url_for('static', filename=path)
+
+    def module_preloads(self, path):
+        """Returns the URLs of all modules imported (transitively) by the module, for <link rel="modulepreload">."""
+        self.ensure_current()
+        return [ASSETS_URL_PREFIX + url for url in self._preloads.get(self._urls.get(path), [])]
+
+    def response(self, hashed_path):
+        """Serves an asset by its hashed path, picking the precompressed variant the client accepts."""
+        self.ensure_current()
+        asset = self._assets.get(hashed_path)
+        if asset is None: abort(404)
+        headers = {
+            'Cache-Control': f'public, max-age={ASSET_MAX_AGE}, immutable',
+            'ETag': asset['etag'], 'Vary': 'Accept-Encoding',
+        }
+        if request.headers.get('If-None-Match') == asset['etag']:
+            return Response(status=304, headers=headers)
+        body = asset['body']
+        encoding = choose_encoding(request.headers.get('Accept-Encoding'))
+        if encoding in asset:
+            body = asset[encoding]
+            headers['Content-Encoding'] = encoding
+        return Response(body, content_type=asset['mimetype'], headers=headers)
+
+    def init_app(self, app):
+        """Builds the manifest and exposes asset_url() and module_preloads() to templates."""
+        self.ensure_current()
+        app.jinja_env.globals.update(asset_url=self.url, module_preloads=self.module_preloads)
+
+asset_manifest = AssetManifest(app.static_folder)
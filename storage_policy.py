@@ -0,0 +1,231 @@
+import os
+import time
+import shutil
+import logging
+import platform
+import threading
+import subprocess
+from datetime import datetime
+
+import app_state
+from app_state import settings
+from config_manager import DEFAULT_SETTINGS
+from recordings_index import REC_DIR, ARCHIVE_DIR, ARCHIVE_AUDIO_EXT, recordings_index, is_date_dir_name
+
+STORAGE_POLICY_FIRST_RUN_DELAY = 300  # Секунды после запуска до первого прохода
+STORAGE_POLICY_RETRY_DELAY = 600  # Через сколько секунд повторить, если проход пришелся на запись
+STORAGE_POLICY_PAUSE = 0.2  # Пауза между файлами, чтобы не занимать диск подряд
+MP3_BITRATE = '128k'
+ARCHIVE_BITRATE = '24k'
+
+def _ffmpeg(args):
+    """Runs ffmpeg below normal CPU priority and, where the OS allows, with idle I/O priority."""
+    from pydub import AudioSegment
+    command = [AudioSegment.converter, '-v', 'error', '-nostdin', '-y'] + args
+    kwargs = {}
+    if platform.system() == "Windows":
+        kwargs['creationflags'] = subprocess.BELOW_NORMAL_PRIORITY_CLASS | subprocess.CREATE_NO_WINDOW
+    else:
+        if shutil.which('nice'): command = ['nice', '-n', '10'] + command
+        # Планировщик ввода-вывода Linux: класс idle, диск достается ffmpeg только когда он свободен
+        if shutil.which('ionice'): command = ['ionice', '-c3'] + command
+    result = subprocess.run(command, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, **kwargs)
+    if result.returncode != 0:
+        raise OSError(f"ffmpeg exited with code {result.returncode}: {result.stderr.decode('utf-8', 'replace').strip()}")
+
+def _transcode(source, target, codec_args):
+    """Transcodes into a temporary file next to the target and renames it, so a crash never leaves a truncated target."""
+    part = target + '.part'
+    try:
+        _ffmpeg(['-i', source, '-vn'] + codec_args + [part])
+        os.replace(part, target)
+    except BaseException:
+        try: os.remove(part)
+        except OSError: pass
+        raise
+
+def _date_dirs(root):
+    """Date folders of root as (date, path), oldest first."""
+    try:
+        names = sorted(e.name for e in os.scandir(root) if e.is_dir() and is_date_dir_name(e.name))
+    except OSError:
+        return []
+    return [(name, os.path.join(root, name)) for name in names]
+
+def _tree_size(path):
+    total = 0
+    for root, _dirs, files in os.walk(path):
+        for name in files:
+            try: total += os.path.getsize(os.path.join(root, name))
+            except OSError: pass
+    return total
+
+class StoragePolicy:
+    """
+    Background retention of recordings, configured by settings["storage_policy"]:
+
+    - WAVs in date folders older than compress_after_days are converted to MP3
+      (this also cleans up WAVs left next to an MP3 by a failed compression);
+    - audio older than archive_after_days is moved to the archive tier,
+      archive/<date>/<name>.ogg in 24 kbps mono Opus; metadata, transcripts
+      and protocols stay in rec/ and the recording stays in the list;
+    - if rec/ and archive/ together exceed quota_gb, the oldest audio files are
+      deleted (archived ones first by date order) until they fit; text files
+      are kept and the recording stays in the list and in search, marked
+      audio_evicted.
+
+    A value of 0 disables a step. Runs every interval_hours (when enabled) at
+    low priority, never while recording, pausing between files.
+    """
+
+    def __init__(self, rec_dir, archive_dir):
+        self.rec_dir = rec_dir
+        self.archive_dir = archive_dir
+        self.last_report = None
+        self._run_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+
+    @staticmethod
+    def config():
+        config = dict(DEFAULT_SETTINGS["storage_policy"])
+        config.update(settings.get("storage_policy") or {})
+        return config
+
+    @property
+    def running(self):
+        return self._run_lock.locked()
+
+    def trigger(self):
+        """Starts a run now, regardless of the schedule and of the enabled flag."""
+        self.start()
+        self._wake.set()
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._loop, name='storage-policy', daemon=True)
+            self._thread.start()
+
+    def _loop(self):
+        delay = STORAGE_POLICY_FIRST_RUN_DELAY
+        while True:
+            triggered = self._wake.wait(delay)
+            self._wake.clear()
+            config = self.config()
+            delay = max(float(config.get("interval_hours") or 24), 0.1) * 3600
+            if not triggered and not config.get("enabled"): continue
+            if app_state.is_recording:
+                delay = STORAGE_POLICY_RETRY_DELAY
+                continue
+            try:
+                self.run_once(config)
+            except Exception as e:
+                logging.error(f"Ошибка политики хранения: {e}")
+
+    def run_once(self, config=None):
+        """Runs all steps once and returns the report (None if a run is already in progress)."""
+        if not self._run_lock.acquire(blocking=False): return None
+        try:
+            config = config or self.config()
+            report = {
+                "started_at": datetime.now().isoformat(timespec='seconds'), "finished_at": None,
+                "compressed": 0, "archived": 0, "evicted": 0, "reclaimed_bytes": 0,
+                "total_bytes": None, "quota_bytes": None, "interrupted": False, "errors": [],
+            }
+            self.last_report = report
+            today = datetime.now().date()
+            for step, days in ((self._compress_date, config.get("compress_after_days")), (self._archive_date, config.get("archive_after_days"))):
+                if not days or days <= 0: continue
+                for date, date_path in _date_dirs(self.rec_dir):
+                    if (today - datetime.strptime(date, '%Y-%m-%d').date()).days < days: break
+                    if not step(date, date_path, report): break
+                if report["interrupted"]: break
+            if config.get("quota_gb") and not report["interrupted"]:
+                self._enforce_quota(int(float(config["quota_gb"]) * 1024 ** 3), today, report)
+            report["finished_at"] = datetime.now().isoformat(timespec='seconds')
+            logging.info(
+                f"Политика хранения: сжато {report['compressed']}, в архив {report['archived']}, удалено {report['evicted']}, "
+                f"освобождено {report['reclaimed_bytes'] / 1024 ** 2:.1f} МБ, ошибок {len(report['errors'])}."
+            )
+            return report
+        finally:
+            self._run_lock.release()
+
+    def _may_continue(self, report):
+        """Pauses between files; stops the run when a recording starts."""
+        if app_state.is_recording:
+            report["interrupted"] = True
+            return False
+        time.sleep(STORAGE_POLICY_PAUSE)
+        return True
+
+    def _apply(self, report, counter, path, action):
+        """Runs an action on one file, accounting the bytes it freed; errors are recorded and skipped."""
+        try:
+            freed = action()
+        except Exception as e:
+            report["errors"].append(f"{path}: {e}")
+            logging.error(f"Политика хранения: {path}: {e}")
+            return
+        report[counter] += 1
+        report["reclaimed_bytes"] += freed
+        recordings_index.refresh_path(path)
+
+    def _compress_date(self, date, date_path, report):
+        for name in sorted(os.listdir(date_path)):
+            if not name.lower().endswith('.wav'): continue
+            if not self._may_continue(report): return False
+            wav_path = os.path.join(date_path, name)
+            def compress():
+                mp3_path = os.path.splitext(wav_path)[0] + '.mp3'
+                before = os.path.getsize(wav_path) + (os.path.getsize(mp3_path) if os.path.exists(mp3_path) else 0)
+                _transcode(wav_path, mp3_path, ['-codec:a', 'libmp3lame', '-b:a', MP3_BITRATE, '-f', 'mp3'])
+                os.remove(wav_path)
+                return before - os.path.getsize(mp3_path)
+            self._apply(report, "compressed", wav_path, compress)
+        return True
+
+    def _archive_date(self, date, date_path, report):
+        for name in sorted(os.listdir(date_path)):
+            if not name.lower().endswith(('.wav', '.mp3')): continue
+            if not self._may_continue(report): return False
+            audio_path = os.path.join(date_path, name)
+            def archive():
+                target_dir = os.path.join(self.archive_dir, date)
+                os.makedirs(target_dir, exist_ok=True)
+                target = os.path.join(target_dir, os.path.splitext(name)[0] + ARCHIVE_AUDIO_EXT)
+                before = os.path.getsize(audio_path)
+                _transcode(audio_path, target, ['-ac', '1', '-codec:a', 'libopus', '-b:a', ARCHIVE_BITRATE, '-application', 'voip', '-f', 'ogg'])
+                os.remove(audio_path)
+                return before - os.path.getsize(target)
+            self._apply(report, "archived", audio_path, archive)
+        return True
+
+    def _enforce_quota(self, quota_bytes, today, report):
+        total = _tree_size(self.rec_dir) + _tree_size(self.archive_dir)
+        report["quota_bytes"] = quota_bytes
+        if total > quota_bytes:
+            candidates = []
+            for root, ext in ((self.archive_dir, (ARCHIVE_AUDIO_EXT,)), (self.rec_dir, ('.wav', '.mp3'))):
+                for date, date_path in _date_dirs(root):
+                    # Папку текущего дня квота не трогает: в нее пишутся новые записи и загрузки
+                    if date >= today.isoformat(): continue
+                    for name in sorted(os.listdir(date_path)):
+                        if name.lower().endswith(ext): candidates.append((date, root != self.archive_dir, name, os.path.join(date_path, name)))
+            # Сначала самые старые даты; в пределах даты — сначала архивная копия
+            for date, _in_rec, name, path in sorted(candidates):
+                if total <= quota_bytes: break
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                if not self._may_continue(report): break
+                def evict():
+                    os.remove(path)
+                    return st.st_size
+                evicted_before = report["evicted"]
+                self._apply(report, "evicted", os.path.join(self.rec_dir, date, name), evict)
+                if report["evicted"] > evicted_before: total -= st.st_size
+        report["total_bytes"] = total
+
+storage_policy = StoragePolicy(REC_DIR, ARCHIVE_DIR)
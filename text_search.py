@@ -0,0 +1,146 @@
+import re
+import html
+
+SNIPPET_CHARS = 200  # Длина фрагмента с совпадением в результатах поиска
+# Основы короче этого ищутся как точное слово, а не как префикс: префикс из 1-2 букв совпадает почти со всем
+MIN_PREFIX_STEM = 3
+
+_VOWELS = 'аеиоуыэюя'
+_WORD_RE = re.compile(r'[^\W_]+')
+_QUERY_RE = re.compile(r'"([^"]*)"|([^\W_]+)')
+
+def _by_length(*endings):
+    return tuple(sorted(endings, key=len, reverse=True))
+
+# Окончания по алгоритму Snowball для русского языка. Во второй группе каждой пары окончание
+# отбрасывается, только если перед ним стоит "а" или "я".
+_PERFECTIVE_GERUND = (_by_length('ив', 'ивши', 'ившись', 'ыв', 'ывши', 'ывшись'), _by_length('в', 'вши', 'вшись'))
+_ADJECTIVE = _by_length(
+    'ее', 'ие', 'ые', 'ое', 'ими', 'ыми', 'ей', 'ий', 'ый', 'ой', 'ем', 'им', 'ым', 'ом',
+    'его', 'ого', 'ему', 'ому', 'их', 'ых', 'ую', 'юю', 'ая', 'яя', 'ою', 'ею',
+)
+_PARTICIPLE = (_by_length('ивш', 'ывш', 'ующ'), _by_length('ем', 'нн', 'вш', 'ющ', 'щ'))
+_REFLEXIVE = _by_length('ся', 'сь')
+_VERB = (
+    _by_length(
+        'ила', 'ыла', 'ена', 'ейте', 'уйте', 'ите', 'или', 'ыли', 'ей', 'уй', 'ил', 'ыл', 'им', 'ым', 'ен',
+        'ило', 'ыло', 'ено', 'ят', 'ует', 'уют', 'ит', 'ыт', 'ены', 'ить', 'ыть', 'ишь', 'ую', 'ю',
+    ),
+    _by_length('ла', 'на', 'ете', 'йте', 'ли', 'й', 'л', 'ем', 'н', 'ло', 'но', 'ет', 'ют', 'ны', 'ть', 'ешь', 'нно'),
+)
+_NOUN = _by_length(
+    'а', 'ев', 'ов', 'ие', 'ье', 'е', 'иями', 'ями', 'ами', 'еи', 'ии', 'и', 'ией', 'ей', 'ой', 'ий', 'й',
+    'иям', 'ям', 'ием', 'ем', 'ам', 'ом', 'о', 'у', 'ах', 'иях', 'ях', 'ы', 'ь', 'ию', 'ью', 'ю', 'ия', 'ья', 'я',
+)
+_SUPERLATIVE = _by_length('ейш', 'ейше')
+_DERIVATIONAL = _by_length('ост', 'ость')
+
+def fold_text(text):
+    """Folds 'ё' to 'е': the unicode61 tokenizer keeps them apart, while people write both."""
+    return text.replace('ё', 'е').replace('Ё', 'Е')
+
+def _regions(word):
+    """Returns the start of the RV and R2 regions of the Snowball algorithm."""
+    rv = next((i + 1 for i, ch in enumerate(word) if ch in _VOWELS), len(word))
+    def after_vowel_consonant(start):
+        for i in range(start + 1, len(word)):
+            if word[i] not in _VOWELS and word[i - 1] in _VOWELS: return i + 1
+        return len(word)
+    r1 = after_vowel_consonant(0)
+    return rv, after_vowel_consonant(r1)
+
+def _strip(word, start, endings, after_a=False):
+    """Removes the longest of `endings` lying at or after `start`. Returns the shortened word or None."""
+    for ending in endings:
+        if not word.endswith(ending): continue
+        cut = len(word) - len(ending)
+        if cut < start: continue
+        if after_a and (cut - 1 < start or word[cut - 1] not in 'ая'): continue
+        return word[:cut]
+    return None
+
+def _strip_group(word, start, groups):
+    return _strip(word, start, groups[0]) or _strip(word, start, groups[1], after_a=True)
+
+def russian_stem(word):
+    """Light Snowball stemmer for Russian: 'встречами' -> 'встреч'. Words without Cyrillic vowels are returned as is."""
+    word = fold_text(word.lower())
+    rv, r2 = _regions(word)
+    if rv >= len(word): return word
+
+    # Шаг 1: деепричастие, иначе возвратная частица + прилагательное/причастие, глагол или существительное
+    stemmed = _strip_group(word, rv, _PERFECTIVE_GERUND)
+    if stemmed is None:
+        word = _strip(word, rv, _REFLEXIVE) or word
+        stemmed = _strip(word, rv, _ADJECTIVE)
+        if stemmed is not None:
+            stemmed = _strip_group(stemmed, rv, _PARTICIPLE) or stemmed
+        else:
+            stemmed = _strip_group(word, rv, _VERB) or _strip(word, rv, _NOUN)
+    word = stemmed or word
+
+    # Шаг 2-4: "и" на конце, словообразовательные "ость", превосходная степень, "нн" и мягкий знак
+    if word.endswith('и') and len(word) - 1 >= rv: word = word[:-1]
+    word = _strip(word, r2, _DERIVATIONAL) or word
+    word = _strip(word, rv, _SUPERLATIVE) or word
+    if word.endswith('нн') and len(word) - 2 >= rv: word = word[:-1]
+    elif word.endswith('ь') and len(word) - 1 >= rv: word = word[:-1]
+    return word
+
+def parse_query(text):
+    """
+    Splits a user query into terms: (words, is_prefix). Words are stemmed and
+    searched as prefixes, so 'встречи' also finds 'встреча' and 'встречами';
+    "quoted phrases" are matched exactly. Single letters outside phrases
+    (prepositions and conjunctions) are ignored.
+    """
+    terms = []
+    for phrase, word in _QUERY_RE.findall(fold_text(text)):
+        if phrase:
+            words = _WORD_RE.findall(phrase.lower())
+            if words: terms.append((words, False))
+        elif len(word) > 1:
+            stem = russian_stem(word)
+            terms.append(([stem], True) if len(stem) >= MIN_PREFIX_STEM else ([word.lower()], False))
+    return terms
+
+def build_match_query(terms):
+    """Turns parsed terms into an FTS5 MATCH expression requiring all of them. Returns '' if there are none."""
+    return ' '.join('"' + ' '.join(words) + '"' + ('*' if is_prefix else '') for words, is_prefix in terms)
+
+def highlight_pattern(terms):
+    """Returns a regex finding the same terms in (folded) text, the way the unicode61 tokenizer would match them."""
+    alternatives = []
+    for words, is_prefix in terms:
+        body = r'[\W_]+'.join(re.escape(word) for word in words)
+        alternatives.append(r'(?<![^\W_])' + body + (r'[^\W_]*' if is_prefix else r'(?![^\W_])'))
+    return re.compile('|'.join(alternatives), re.IGNORECASE) if alternatives else None
+
+def make_snippet(texts, pattern, width=SNIPPET_CHARS):
+    """
+    Builds an HTML fragment of about `width` characters around the first match
+    of `pattern` in the first of `texts` that has one, with matches wrapped in
+    <mark>. Unlike FTS5 snippet(), which tokenizes the whole column, this only
+    scans the text up to the first match.
+    """
+    for text in texts:
+        match = pattern.search(text or '') if pattern else None
+        if not match: continue
+        start = max(0, match.start() - width // 3)
+        end = min(len(text), start + width)
+        # Не обрезаем слова на краях фрагмента
+        if start > 0:
+            space = text.find(' ', start, match.start())
+            start = space + 1 if space != -1 else start
+        if end < len(text):
+            space = text.rfind(' ', match.end(), end)
+            end = space if space != -1 else end
+        fragment = ' '.join(text[start:end].split())
+        parts, position = [], 0
+        for hit in pattern.finditer(fragment):
+            parts.append(html.escape(fragment[position:hit.start()]))
+            parts.append('<mark>' + html.escape(hit.group()) + '</mark>')
+            position = hit.end()
+        parts.append(html.escape(fragment[position:]))
+        return ('…' if start > 0 else '') + ''.join(parts) + ('…' if end < len(text) else '')
+    return ''
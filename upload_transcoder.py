@@ -0,0 +1,228 @@
+import os
+import time
+import shutil
+import uuid
+import logging
+import threading
+import subprocess
+from collections import OrderedDict
+
+from audio_probe import probe_duration_ms
+from app_state import get_application_path
+
+UPLOAD_MP3_BITRATE = '128k'
+UPLOAD_KEEP_FINISHED = 50  # Сколько завершенных загрузок помнить для /uploads
+UPLOAD_STDERR_LINES = 20
+# Оригиналы и недописанные MP3 лежат здесь, а не в rec/: незавершенная загрузка не должна выглядеть записью
+UPLOAD_STAGING_DIR = os.path.join(get_application_path(), 'uploads')
+
+def staging_path(filename):
+    """Returns a unique path in the staging folder that keeps the extension of the uploaded file."""
+    os.makedirs(UPLOAD_STAGING_DIR, exist_ok=True)
+    extension = os.path.splitext(filename)[1].lower() or '.bin'
+    return os.path.join(UPLOAD_STAGING_DIR, f"{uuid.uuid4().hex[:12]}{extension}")
+
+class UploadJob:
+    """Conversion of one uploaded file to MP3, visible through /uploads/<id>."""
+
+    def __init__(self, filename):
+        self.id = uuid.uuid4().hex[:12]
+        self.filename = filename
+        self.status = 'receiving'
+        self.received_bytes = 0
+        self.size = None  # Объявленный размер файла (для загрузки частями)
+        self.sha256 = None  # SHA-256 полученного файла (для загрузки частями)
+        self.encoded_seconds = 0.0  # Сколько секунд звука кодировщик уже выдал
+        self.source_seconds = None  # Длительность исходного файла, если ее можно узнать из заголовков
+        self.mp3_path = None
+        self.error = None
+        self.created_at = time.time()
+        self.finished_at = None
+
+    @property
+    def finished(self):
+        return self.status in ('done', 'error')
+
+    def to_dict(self):
+        percent = None
+        if self.status == 'done': percent = 100.0
+        elif self.source_seconds: percent = round(min(self.encoded_seconds / self.source_seconds * 100, 99.9), 1)
+        return {
+            "id": self.id, "filename": self.filename, "status": self.status,
+            "received_bytes": self.received_bytes, "size": self.size, "sha256": self.sha256,
+            "encoded_seconds": round(self.encoded_seconds, 1),
+            "source_seconds": self.source_seconds, "percent": percent,
+            "mp3_filename": os.path.basename(self.mp3_path) if self.mp3_path else None,
+            "error": self.error, "created_at": self.created_at, "finished_at": self.finished_at,
+        }
+
+def _ffmpeg_command(source, target):
+    from pydub import AudioSegment
+    return [
+        AudioSegment.converter, '-v', 'error', '-y', '-i', source, '-vn',
+        '-codec:a', 'libmp3lame', '-b:a', UPLOAD_MP3_BITRATE, '-f', 'mp3', target,
+        # Ход кодирования (out_time_us=...) построчно в stdout
+        '-progress', 'pipe:1', '-nostats',
+    ]
+
+class _Encoder:
+    """One ffmpeg process; reads its progress and keeps the last lines of stderr."""
+
+    def __init__(self, job, source, target):
+        self.job = job
+        stdin = subprocess.PIPE if source == 'pipe:0' else subprocess.DEVNULL
+        self.process = subprocess.Popen(_ffmpeg_command(source, target), stdin=stdin, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        self.encoded_seconds = 0.0
+        self.stderr = []
+        self._readers = [
+            threading.Thread(target=self._read_progress, daemon=True),
+            threading.Thread(target=self._read_stderr, daemon=True),
+        ]
+        for reader in self._readers: reader.start()
+
+    def _read_progress(self):
+        for line in self.process.stdout:
+            key, _, value = line.decode('ascii', 'replace').strip().partition('=')
+            if key == 'out_time_us' and value.isdigit():
+                self.encoded_seconds = int(value) / 1e6
+                self.job.encoded_seconds = self.encoded_seconds
+
+    def _read_stderr(self):
+        for line in self.process.stderr:
+            self.stderr = (self.stderr + [line.decode('utf-8', 'replace').strip()])[-UPLOAD_STDERR_LINES:]
+
+    def wait(self):
+        returncode = self.process.wait()
+        for reader in self._readers: reader.join(timeout=5)
+        return returncode
+
+    def kill(self):
+        try: self.process.kill()
+        except OSError: pass
+
+class StreamingTranscoder:
+    """
+    Write-only file object for the upload form parser: every chunk of the
+    uploaded file is written to the original on disk and at the same time
+    piped into ffmpeg, so conversion runs while the upload is still
+    arriving and nothing is held in memory.
+
+    Formats that ffmpeg cannot read from a pipe (e.g. MP4 with the index at
+    the end) are converted again from the saved original after the upload.
+    With tee=False the caller writes the original itself and only feeds
+    its bytes in order.
+    """
+
+    def __init__(self, job, source_path, mp3_path, tee=True):
+        self.job = job
+        self.source_path = source_path
+        self.mp3_path = mp3_path
+        self.part_path = os.path.splitext(source_path)[0] + '.mp3.part'
+        self._file = open(source_path, 'wb') if tee else None
+        try:
+            self._encoder = _Encoder(job, 'pipe:0', self.part_path)
+        except Exception as e:
+            # ffmpeg не запустился: не оставляем пустой оригинал и незавершенное задание
+            if self._file:
+                self._file.close()
+                os.remove(source_path)
+            job.status, job.error, job.finished_at = 'error', f"Не удалось запустить ffmpeg: {e}", time.time()
+            raise
+        self._pipe_ok = True
+
+    def write(self, data):
+        if self._file:
+            self._file.write(data)
+            self.job.received_bytes += len(data)
+        if self._pipe_ok:
+            try:
+                self._encoder.process.stdin.write(data)
+            except OSError:
+                # ffmpeg завершился раньше (формат не читается из потока): дальше только сохраняем файл
+                self._pipe_ok = False
+        return len(data)
+
+    def seek(self, offset, whence=0):
+        # Парсер формы перематывает файл в начало после приема; читать его никто не будет
+        return 0
+
+    def close(self):
+        pass
+
+    def _close_inputs(self):
+        if self._file and not self._file.closed: self._file.close()
+        try: self._encoder.process.stdin.close()
+        except OSError: pass
+
+    def abort(self, reason):
+        """The upload broke off: stops ffmpeg and removes everything written so far."""
+        self._close_inputs()
+        self._encoder.kill()
+        self._encoder.wait()
+        for path in (self.source_path, self.part_path):
+            try: os.remove(path)
+            except OSError: pass
+        self.job.status, self.job.error, self.job.finished_at = 'error', reason, time.time()
+
+    def finish(self, on_done):
+        """
+        The upload is complete: lets ffmpeg drain in a background thread and
+        calls on_done(job) once the MP3 is in place.
+        """
+        self._close_inputs()
+        self.job.status = 'transcoding'
+        duration_ms = probe_duration_ms(self.source_path)
+        if duration_ms: self.job.source_seconds = duration_ms / 1000.0
+        threading.Thread(target=self._complete, args=(on_done,), name=f'upload-{self.job.id}', daemon=True).start()
+
+    def _complete(self, on_done):
+        job = self.job
+        try:
+            encoder = self._encoder
+            if encoder.wait() != 0 or not self._pipe_ok:
+                logging.info(f"Загрузка {job.filename}: поток не декодируется ({' '.join(encoder.stderr[-1:])}), повтор с файла.")
+                job.encoded_seconds = 0.0
+                encoder = _Encoder(job, self.source_path, self.part_path)
+                if encoder.wait() != 0:
+                    raise RuntimeError(f"ffmpeg: {' / '.join(encoder.stderr[-3:]) or 'ошибка конвертации'}")
+            shutil.move(self.part_path, self.mp3_path)
+            os.remove(self.source_path)
+            # Длительность — по выходу кодировщика; если он ее не сообщил, по заголовкам MP3
+            job.encoded_seconds = encoder.encoded_seconds or (probe_duration_ms(self.mp3_path) or 0) / 1000.0
+            job.mp3_path = self.mp3_path
+            on_done(job)
+            job.status = 'done'
+        except Exception as e:
+            for path in (self.source_path, self.part_path):
+                try: os.remove(path)
+                except OSError: pass
+            job.status, job.error = 'error', str(e)
+            logging.error(f"Ошибка конвертации загрузки {job.filename}: {e}")
+        job.finished_at = time.time()
+
+class UploadJobs:
+    """Registry of recent upload conversions."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._jobs = OrderedDict()
+
+    def create(self, filename):
+        job = UploadJob(filename)
+        with self._lock:
+            self._jobs[job.id] = job
+            finished = [job_id for job_id, j in self._jobs.items() if j.finished]
+            for job_id in finished[:max(len(finished) - UPLOAD_KEEP_FINISHED, 0)]:
+                del self._jobs[job_id]
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return job.to_dict() if job else None
+
+    def list(self):
+        with self._lock:
+            return [job.to_dict() for job in reversed(self._jobs.values())]
+
+upload_jobs = UploadJobs()
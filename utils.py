@@ -2,19 +2,15 @@ import os
 import sys
 import logging
 import re
+import fnmatch
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 from pathlib import Path
-import json
 
-from pydub import AudioSegment
-
-try:
-    from bs4 import BeautifulSoup
-except ImportError:
-    BeautifulSoup = None
-
-from app_state import settings, contacts_data
-from config_manager import load_settings, load_contacts
+from config_manager import get_settings_snapshot, load_contacts, contacts_store
+from html_cleaner import clean_html, clean_html_chunks
+from recordings_index import recordings_index
+from prompt_budget import PromptBudget, DEFAULT_TRUNCATE_STRATEGY
 
 def setup_logging():
     """Настраивает логирование в файл и в консоль."""
@@ -46,14 +42,11 @@ def format_date_russian(date_obj):
     return f"{day:02d} {month} {year}"
 
 def get_date_dirs_data():
-    """Gathers and structures date directory data from the 'rec' directory."""
-    from app_state import get_application_path
+    """Gathers and structures date directory data from the recordings index."""
     date_groups = []
-    rec_dir = os.path.join(get_application_path(), 'rec')
-    
-    if os.path.exists(rec_dir):
-        date_dirs = [d for d in os.listdir(rec_dir) if os.path.isdir(os.path.join(rec_dir, d))]
-        
+    date_dirs = recordings_index.date_dirs()
+
+    if date_dirs:
         day_names = {
             0: 'понедельник', 1: 'вторник', 2: 'среда', 3: 'четверг',
             4: 'пятница', 5: 'суббота', 6: 'воскресенье'
@@ -95,98 +88,88 @@ def get_date_dirs_data():
     return date_groups
 
 def get_recordings_for_date_data(date_dir):
-    """Gathers and structures recording data for a specific date directory."""
-    from app_state import get_application_path
-    recordings_in_group = []
-    rec_dir = os.path.join(get_application_path(), 'rec')
-    date_path = os.path.join(rec_dir, date_dir)
-
-    if not os.path.isdir(date_path): return []
-
-    all_files = [f for f in os.listdir(date_path) if os.path.isfile(os.path.join(date_path, f))]
-    file_groups = {}
-    for filename in all_files:
-        name, ext = os.path.splitext(filename)
-        if name not in file_groups: file_groups[name] = {}
-        file_groups[name][ext] = filename
-    
-    for base_name, file_dict in file_groups.items():
-        audio_filename = file_dict.get('.wav') or file_dict.get('.mp3')
-        if not audio_filename: continue
-
-        audio_filepath = os.path.join(date_path, audio_filename)
-        txt_filepath = os.path.join(date_path, base_name + ".txt")
-        protocol_filepath = os.path.join(date_path, base_name + "_protocol.pdf")
-        json_path = os.path.join(date_path, base_name + '.json')
-        
-        metadata = {}
-        if os.path.exists(json_path):
-            try:
-                with open(json_path, 'r', encoding='utf-8') as f: metadata = json.load(f)
-            except (json.JSONDecodeError, TypeError): pass
-        
-        title = metadata.get('title', base_name)
-        start_time_obj = datetime.fromisoformat(metadata['startTime']) if 'startTime' in metadata else datetime.fromtimestamp(os.path.getctime(audio_filepath))
-        display_time = start_time_obj.strftime('%H:%M:%S')
-        
-        duration = metadata.get('duration')
-        if duration is None:
-            try: duration = len(AudioSegment.from_file(audio_filepath)) / 1000.0
-            except Exception: duration = 0
-        
-        recordings_in_group.append({
-            'filename': audio_filename, 'size': os.path.getsize(audio_filepath), 'time': display_time,
-            'transcription_exists': os.path.exists(txt_filepath), 'transcription_filename': base_name + ".txt",
-            'protocol_exists': os.path.exists(protocol_filepath), 'protocol_filename': base_name + "_protocol.pdf",
-            'title': title, 'startTime': start_time_obj.isoformat(),
-            'promptAddition': metadata.get('promptAddition', ''), 'duration': duration
-        })
-    
-    recordings_in_group.sort(key=lambda x: x['time'], reverse=True)
-    return recordings_in_group
-
-def get_recordings_last_modified():
-    """Возвращает время последнего изменения в папке с записями."""
-    from app_state import get_application_path
-    rec_dir = os.path.join(get_application_path(), 'rec')
-    if not os.path.exists(rec_dir):
-        return 0
-
-    latest_mtime = os.path.getmtime(rec_dir)
-    for root, dirs, files in os.walk(rec_dir):
-        for name in files + dirs:
-            try:
-                path = os.path.join(root, name)
-                latest_mtime = max(latest_mtime, os.path.getmtime(path))
-            except (IOError, OSError):
-                continue
-    return latest_mtime
+    """Returns recording data for a specific date directory from the recordings index."""
+    return recordings_index.recordings_for_date(date_dir)
 
 def _clean_html_content(html_content):
-    if not html_content or not BeautifulSoup: return ""
+    if not html_content: return ""
     try:
-        soup = BeautifulSoup(html_content, 'html.parser')
-        allowed_tags = {'table', 'thead', 'tbody', 'tfoot', 'tr', 'th', 'td'}
-        for s in soup(['script', 'style']): s.decompose()
-        for tag in soup.find_all(True):
-            tag.attrs = {}
-            if tag.name not in allowed_tags: tag.unwrap()
-        if soup.body: soup = soup.body
-        for cell in soup.find_all(['td', 'th']):
-            cell.string = cell.get_text(separator=' ', strip=True)
-        cleaned_html = soup.decode(formatter=None)
-        cleaned_html = re.sub(r'(?<=>)\s*\n\s*(?=<)', '', cleaned_html)
-        return re.sub(r'\n{2,}', '\n', cleaned_html).strip()
+        return clean_html(html_content)
     except Exception as e:
         print(f"Ошибка при очистке HTML: {e}")
         return html_content
 
+CONTEXT_FILE_MAX_CHARS = 2 * 1024 * 1024 # Ограничение на объем одного файла контекста
+CONTEXT_READ_WORKERS = 4
+CONTEXT_READ_CHUNK_CHARS = 64 * 1024
+
+def _match_context_files(base_path, patterns):
+    """
+    Matches all rule patterns against the folder in a single os.scandir pass.
+    Returns one sorted list of Paths per pattern. Patterns with a path separator
+    (e.g. '**/*.html') cannot be matched from a flat listing and fall back to glob.
+    """
+    matches = [[] for _ in patterns]
+    flat_rules = []
+    for i, pattern in enumerate(patterns):
+        if '/' in pattern or os.sep in pattern:
+            matches[i] = [p for p in base_path.glob(pattern) if p.is_file()]
+        else:
+            flat_rules.append((i, re.compile(fnmatch.translate(os.path.normcase(pattern)))))
+    if flat_rules:
+        with os.scandir(base_path) as entries:
+            for entry in entries:
+                try:
+                    if not entry.is_file(): continue
+                except OSError:
+                    continue
+                name = os.path.normcase(entry.name)
+                for i, regex in flat_rules:
+                    if regex.match(name): matches[i].append(Path(entry.path))
+    return [sorted(m) for m in matches]
+
+def _iter_file_chunks(f, limit):
+    """Yields text blocks of an open file until `limit` characters have been read."""
+    remaining = limit
+    while remaining > 0:
+        chunk = f.read(min(CONTEXT_READ_CHUNK_CHARS, remaining))
+        if not chunk: break
+        remaining -= len(chunk)
+        yield chunk
+
+def _read_context_file(path):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            if path.suffix.lower() in ['.html', '.htm']:
+                # HTML очищается потоково, не загружая файл в память целиком
+                content = clean_html_chunks(_iter_file_chunks(f, CONTEXT_FILE_MAX_CHARS))
+            else:
+                content = f.read(CONTEXT_FILE_MAX_CHARS)
+        return content
+    except Exception as e:
+        print(f"Не удалось прочитать файл контекста {path}: {e}")
+        return None
+
+def _read_context_files(paths):
+    """Reads (and cleans) context files in parallel. Returns {path: content}; unreadable files map to None."""
+    paths = list(paths)
+    if len(paths) <= 1:
+        return {path: _read_context_file(path) for path in paths}
+    with ThreadPoolExecutor(max_workers=min(CONTEXT_READ_WORKERS, len(paths))) as executor:
+        return dict(zip(paths, executor.map(_read_context_file, paths)))
+
 def build_final_prompt_addition(base_path, recording_date, is_preview=False, override_settings=None):
-    current_settings = settings
-    if override_settings:
-        current_settings = override_settings
-    else:
-        load_settings() # Загружаем, если не переданы временные
+    return build_prompt_addition_with_report(base_path, recording_date, is_preview, override_settings)[0]
+
+def build_prompt_addition_with_report(base_path, recording_date, is_preview=False, override_settings=None):
+    """
+    Builds the prompt addition and returns (text, budget_report). The report is
+    None when the prompt budget is disabled; otherwise it lists the sources that
+    were truncated or dropped to fit the budget.
+    """
+    # Без временных настроек берем снимок из хранилища: диск читается, только если файл изменился
+    current_settings = override_settings if override_settings else get_settings_snapshot()
+    budget = PromptBudget(current_settings.get("prompt_budget"))
     
     prompt_addition = current_settings.get("prompt_addition", "") if current_settings.get("use_custom_prompt", False) else ""
     prompt_addition = prompt_addition.replace("{current_date}", format_date_russian(recording_date))
@@ -205,33 +188,10 @@ def build_final_prompt_addition(base_path, recording_date, is_preview=False, ove
         date_to_format = recording_date if date_source == 'folder' else datetime.now()
         date_prompt_addition = f"# Дата собрания: {format_date_russian(date_to_format)}\n\n"
 
-    context_files_prompt_addition = ""
-    context_rules = current_settings.get("context_file_rules", [])
-    if base_path.exists() and context_rules:
-        for rule in context_rules:
-            if not rule.get("enabled", False): continue
-            pattern, prompt_template = rule.get("pattern"), rule.get("prompt")
-            if not pattern or not prompt_template: continue
-            for found_file in sorted(list(base_path.glob(pattern))):
-                try:
-                    with open(found_file, 'r', encoding='utf-8') as f: content = f.read()
-                    if found_file.suffix.lower() in ['.html', '.htm']: content = _clean_html_content(content)
-                    if is_preview and len(content) > 1000: content = content[:1000] + "..."
-                    if content: context_files_prompt_addition += prompt_template.replace("{filename}", found_file.name).replace("{content}", content)
-                except Exception as e: print(f"Не удалось прочитать файл контекста {found_file}: {e}")
-
-    combined_prompt_addition = prompt_addition + context_files_prompt_addition
-    filtered_prompt_addition = "\n".join([line for line in combined_prompt_addition.splitlines() if not line.strip().startswith("//")])
-
     participants_prompt = ""
     selected_contact_ids = set(current_settings.get("selected_contacts", []))
     if selected_contact_ids:
-        participants_by_group = {}
-        for group in contacts_data.get("groups", []):
-            group_name = group.get("name", "Без группы")
-            for contact in group.get("contacts", []):
-                if contact.get("id") in selected_contact_ids:
-                    participants_by_group.setdefault(group_name, []).append(contact.get("name"))
+        participants_by_group = contacts_store.participants_by_group(selected_contact_ids)
         if participants_by_group:
             prompt_lines = ["# Список участников:\n"]
             for group_name in sorted(participants_by_group.keys()):
@@ -241,4 +201,44 @@ def build_final_prompt_addition(base_path, recording_date, is_preview=False, ove
                 prompt_lines.append("")
             participants_prompt = "\n".join(prompt_lines)
 
-    return date_prompt_addition + meeting_name_prompt_addition + participants_prompt + "\n" + filtered_prompt_addition
\ No newline at end of file
+    # Обязательные части не сокращаются: бюджет сначала резервируется под них
+    for fixed_part in (date_prompt_addition, meeting_name_prompt_addition, participants_prompt, "\n", prompt_addition):
+        budget.reserve(fixed_part)
+
+    context_files_prompt_addition = ""
+    context_rules = [r for r in current_settings.get("context_file_rules", []) if r.get("enabled", False) and r.get("pattern") and r.get("prompt")]
+    if context_rules and base_path.exists():
+        matches_per_rule = _match_context_files(base_path, [r["pattern"] for r in context_rules])
+        contents = _read_context_files({path for matches in matches_per_rule for path in matches})
+        sources = [] # (rule_index, rule, path, content) в порядке вывода
+        for rule_index, (rule, matches) in enumerate(zip(context_rules, matches_per_rule)):
+            for found_file in matches:
+                content = contents.get(found_file)
+                if content: sources.append((rule_index, rule, found_file, content))
+
+        # Бюджет распределяется по приоритету правил (больше — важнее), при равенстве — в порядке правил
+        fitted = {}
+        for order in sorted(range(len(sources)), key=lambda i: (-_rule_priority(sources[i][1]), i)):
+            rule_index, rule, found_file, content = sources[order]
+            template = rule["prompt"].replace("{filename}", found_file.name)
+            overhead = len(template.replace("{content}", ""))
+            fitted[order] = budget.fit(content, overhead, found_file.name, rule=rule["pattern"], strategy=rule.get("truncate", DEFAULT_TRUNCATE_STRATEGY))
+
+        parts = []
+        for order, (rule_index, rule, found_file, _) in enumerate(sources):
+            content = fitted[order]
+            if is_preview and len(content) > 1000: content = content[:1000] + "..."
+            if content: parts.append(rule["prompt"].replace("{filename}", found_file.name).replace("{content}", content))
+        context_files_prompt_addition = "".join(parts)
+
+    combined_prompt_addition = prompt_addition + context_files_prompt_addition
+    filtered_prompt_addition = "\n".join([line for line in combined_prompt_addition.splitlines() if not line.strip().startswith("//")])
+
+    final_prompt = date_prompt_addition + meeting_name_prompt_addition + participants_prompt + "\n" + filtered_prompt_addition
+    return final_prompt, budget.report()
+
+def _rule_priority(rule):
+    try:
+        return int(rule.get("priority", 0) or 0)
+    except (TypeError, ValueError):
+        return 0
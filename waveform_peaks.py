@@ -0,0 +1,263 @@
+import os
+import wave
+import struct
+import logging
+import threading
+import subprocess
+
+import numpy as np
+
+PEAKS_EXT = '.peaks'
+PEAKS_MAGIC = b'CXPK'
+PEAKS_VERSION = 1
+PEAKS_PER_SECOND = 100  # Разрешение нижнего уровня: один пик на 10 мс
+PEAKS_LEVEL_FACTOR = 4  # Во сколько раз каждый следующий уровень грубее предыдущего
+PEAKS_MIN_LEVEL_COUNT = 256  # Самый грубый уровень содержит не меньше стольких пиков
+PEAKS_DECODE_RATE = 8000  # Частота, до которой ffmpeg понижает звук при расчете пиков существующих файлов
+PEAKS_READ_PEAKS = 1024  # Сколько пиков рассчитывается за одно чтение файла
+
+_HEADER = struct.Struct('<4sBBHIIQ')  # magic, версия, уровней, резерв, частота, сэмплов на пик (уровень 0), всего сэмплов
+_LEVEL = struct.Struct('<IIQ')  # сэмплов на пик, число пиков, смещение данных в файле
+
+def peaks_path_for(audio_path):
+    return os.path.splitext(audio_path)[0] + PEAKS_EXT
+
+class PeakAccumulator:
+    """
+    Accumulates min/max peaks of a stream of int16 sample blocks of any size.
+    Multichannel blocks are reduced to one envelope over all channels.
+    """
+
+    def __init__(self, sample_rate):
+        self.sample_rate = sample_rate
+        self.samples_per_peak = max(sample_rate // PEAKS_PER_SECOND, 1)
+        self.total_samples = 0
+        self._mins, self._maxs = [], []
+        self._pending = np.empty(0, dtype=np.int16)
+        self._pending_max = np.empty(0, dtype=np.int16)
+
+    def add(self, block):
+        block = np.asarray(block, dtype=np.int16)
+        if block.ndim == 2 and not len(self._pending) and len(block) % self.samples_per_peak == 0:
+            # Блок из целого числа пиков: каналы и сэмплы пика сворачиваются одной редукцией
+            flat = block.reshape(-1, self.samples_per_peak * block.shape[1])
+            self._mins.append(flat.min(axis=1))
+            self._maxs.append(flat.max(axis=1))
+            self.total_samples += len(block)
+            return
+        if block.ndim == 2:
+            lows, highs = block.min(axis=1), block.max(axis=1)
+        else:
+            lows = highs = block
+        self.total_samples += len(lows)
+        if len(self._pending):
+            lows, highs = np.concatenate((self._pending, lows)), np.concatenate((self._pending_max, highs))
+        whole = len(lows) - len(lows) % self.samples_per_peak
+        if whole:
+            self._mins.append(lows[:whole].reshape(-1, self.samples_per_peak).min(axis=1))
+            self._maxs.append(highs[:whole].reshape(-1, self.samples_per_peak).max(axis=1))
+        self._pending, self._pending_max = lows[whole:].copy(), highs[whole:].copy()
+
+    def finish(self):
+        """Returns (mins, maxs) as int16 arrays, including the last partial peak."""
+        mins, maxs = list(self._mins), list(self._maxs)
+        if len(self._pending):
+            mins.append(self._pending.min(keepdims=True))
+            maxs.append(self._pending_max.max(keepdims=True))
+        if not mins: return np.empty(0, dtype=np.int16), np.empty(0, dtype=np.int16)
+        return np.concatenate(mins), np.concatenate(maxs)
+
+def mix_peaks(accumulators):
+    """
+    Combines the peaks of streams that are summed into one recording (like
+    AudioSegment.overlay): the envelope of a sum is bounded by the sums of the
+    envelopes. Returns (mins, maxs, total_samples).
+    """
+    parts = [acc.finish() for acc in accumulators if acc and acc.total_samples]
+    if not parts: return None
+    length = max(len(mins) for mins, _ in parts)
+    low, high = np.zeros(length, dtype=np.int32), np.zeros(length, dtype=np.int32)
+    for mins, maxs in parts:
+        low[:len(mins)] += mins
+        high[:len(maxs)] += maxs
+    total = max(acc.total_samples for acc in accumulators if acc)
+    return np.clip(low, -32768, 32767).astype(np.int16), np.clip(high, -32768, 32767).astype(np.int16), total
+
+def _downsample(mins, maxs, factor):
+    padding = -len(mins) % factor
+    if padding:
+        mins = np.concatenate((mins, np.full(padding, mins[-1], dtype=mins.dtype)))
+        maxs = np.concatenate((maxs, np.full(padding, maxs[-1], dtype=maxs.dtype)))
+    return mins.reshape(-1, factor).min(axis=1), maxs.reshape(-1, factor).max(axis=1)
+
+def write_peaks(path, sample_rate, samples_per_peak, total_samples, mins, maxs):
+    """
+    Writes a peaks sidecar: a header, a table of levels and per level the
+    interleaved int8 (min, max) pairs. Level 0 has PEAKS_PER_SECOND peaks per
+    second, each next one is PEAKS_LEVEL_FACTOR times coarser. An hour of audio
+    takes about 1 MB.
+    """
+    levels = [(samples_per_peak, mins, maxs)]
+    while len(levels[-1][1]) > PEAKS_MIN_LEVEL_COUNT * PEAKS_LEVEL_FACTOR:
+        spp, level_mins, level_maxs = levels[-1]
+        levels.append((spp * PEAKS_LEVEL_FACTOR, *_downsample(level_mins, level_maxs, PEAKS_LEVEL_FACTOR)))
+    offset = _HEADER.size + _LEVEL.size * len(levels)
+    table, blobs = [], []
+    for spp, level_mins, level_maxs in levels:
+        pairs = np.empty(len(level_mins) * 2, dtype=np.int8)
+        pairs[0::2] = level_mins >> 8
+        pairs[1::2] = level_maxs >> 8
+        table.append(_LEVEL.pack(spp, len(level_mins), offset))
+        blobs.append(pairs.tobytes())
+        offset += len(pairs)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(_HEADER.pack(PEAKS_MAGIC, PEAKS_VERSION, len(levels), 0, sample_rate, samples_per_peak, total_samples))
+        f.write(b''.join(table))
+        for blob in blobs: f.write(blob)
+    os.replace(tmp_path, path)
+
+def write_peaks_from(path, sample_rate, accumulators, total_samples=None):
+    """
+    Writes the mixed peaks of the recorder streams, trimmed to `total_samples`
+    (the length of the exported recording) if given. Returns False if nothing
+    was recorded.
+    """
+    mixed = mix_peaks(accumulators)
+    if mixed is None: return False
+    mins, maxs, total = mixed
+    samples_per_peak = max(sample_rate // PEAKS_PER_SECOND, 1)
+    if total_samples is not None:
+        total = total_samples
+        count = -(-total // samples_per_peak)
+        mins, maxs = mins[:count], maxs[:count]
+    write_peaks(path, sample_rate, samples_per_peak, total, mins, maxs)
+    return True
+
+def read_peaks(path, start=0.0, end=None, width=1000):
+    """
+    Returns up to `width` (min, max) pairs covering [start, end) seconds of the
+    recording, read from the coarsest level that still has enough detail.
+    Only that slice of the sidecar is read.
+    """
+    with open(path, 'rb') as f:
+        magic, version, level_count, _reserved, sample_rate, _spp, total_samples = _HEADER.unpack(f.read(_HEADER.size))
+        if magic != PEAKS_MAGIC or version != PEAKS_VERSION: raise ValueError("unsupported peaks file")
+        levels = [_LEVEL.unpack(f.read(_LEVEL.size)) for _ in range(level_count)]
+        duration = total_samples / sample_rate if sample_rate else 0
+        end = duration if end is None else min(end, duration)
+        start = max(0.0, min(start, end))
+        span = (end - start) * sample_rate
+        spp, count, offset = levels[0]
+        for level in levels:
+            if level[0] * width <= span: spp, count, offset = level
+        first = min(int(start * sample_rate // spp), count)
+        last = min(int(-(-end * sample_rate // spp)), count)
+        f.seek(offset + first * 2)
+        pairs = np.frombuffer(f.read((last - first) * 2), dtype=np.int8).reshape(-1, 2)
+    if len(pairs) > width:
+        bounds = np.linspace(0, len(pairs), width + 1).astype(np.int64)[:-1]
+        pairs = np.stack((np.minimum.reduceat(pairs[:, 0], bounds), np.maximum.reduceat(pairs[:, 1], bounds)), axis=1)
+    return {
+        "sample_rate": sample_rate, "duration": duration, "start": start, "end": end,
+        "seconds_per_peak": (end - start) / len(pairs) if len(pairs) else 0,
+        "peaks": pairs.reshape(-1).tolist(),
+    }
+
+# --- Расчет пиков для уже записанных файлов ---
+def _iter_wav_blocks(audio_path):
+    with wave.open(audio_path, 'rb') as wf:
+        if wf.getsampwidth() != 2: raise ValueError("only 16-bit WAV is supported")
+        channels, rate = wf.getnchannels(), wf.getframerate()
+        frames_per_read = max(rate // PEAKS_PER_SECOND, 1) * PEAKS_READ_PEAKS
+        def blocks():
+            while True:
+                data = wf.readframes(frames_per_read)
+                if not data: break
+                yield np.frombuffer(data, dtype='<i2').reshape(-1, channels)
+        yield rate
+        yield from blocks()
+
+def _iter_ffmpeg_blocks(audio_path):
+    from pydub import AudioSegment
+    command = [AudioSegment.converter, '-v', 'quiet', '-i', audio_path, '-ac', '1', '-ar', str(PEAKS_DECODE_RATE), '-f', 's16le', '-']
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    try:
+        yield PEAKS_DECODE_RATE
+        while True:
+            data = process.stdout.read(max(PEAKS_DECODE_RATE // PEAKS_PER_SECOND, 1) * PEAKS_READ_PEAKS * 2)
+            if not data: break
+            yield np.frombuffer(data[:len(data) - len(data) % 2], dtype='<i2')
+    finally:
+        process.stdout.close()
+        if process.wait() != 0: raise OSError(f"ffmpeg exited with code {process.returncode}")
+
+def compute_peaks_file(audio_path):
+    """Decodes an existing recording (WAV directly, anything else through ffmpeg) and writes its sidecar."""
+    try:
+        blocks = _iter_wav_blocks(audio_path) if audio_path.lower().endswith('.wav') else _iter_ffmpeg_blocks(audio_path)
+        rate = next(blocks)
+    except (wave.Error, EOFError, ValueError):
+        # Нестандартный WAV (например, float) декодируем через ffmpeg
+        blocks = _iter_ffmpeg_blocks(audio_path)
+        rate = next(blocks)
+    accumulator = PeakAccumulator(rate)
+    for block in blocks:
+        accumulator.add(block)
+    mins, maxs = accumulator.finish()
+    write_peaks(peaks_path_for(audio_path), rate, accumulator.samples_per_peak, accumulator.total_samples, mins, maxs)
+
+_generation_locks = {}
+_generation_locks_guard = threading.Lock()
+
+def ensure_peaks(audio_path):
+    """
+    Returns the path of an up-to-date sidecar for the recording, computing it
+    if it is missing or older than the audio. Concurrent callers for the same
+    file wait for one computation.
+    """
+    sidecar = peaks_path_for(audio_path)
+    with _generation_locks_guard:
+        lock = _generation_locks.setdefault(sidecar, threading.Lock())
+    with lock:
+        try:
+            if os.path.getmtime(sidecar) >= os.path.getmtime(audio_path): return sidecar
+        except OSError:
+            pass
+        compute_peaks_file(audio_path)
+    with _generation_locks_guard:
+        _generation_locks.pop(sidecar, None)
+    return sidecar
+
+def backfill_peaks(rec_dir, stop_event=None):
+    """Computes missing sidecars for existing recordings, newest dates first. Returns the number of files processed."""
+    processed = 0
+    try:
+        date_dirs = sorted((e.path for e in os.scandir(rec_dir) if e.is_dir()), reverse=True)
+    except OSError:
+        return 0
+    for date_dir in date_dirs:
+        try:
+            names = sorted(os.listdir(date_dir))
+        except OSError:
+            continue
+        for name in names:
+            if stop_event is not None and stop_event.is_set(): return processed
+            if os.path.splitext(name)[1].lower() not in ('.wav', '.mp3'): continue
+            audio_path = os.path.join(date_dir, name)
+            if os.path.exists(peaks_path_for(audio_path)): continue
+            try:
+                ensure_peaks(audio_path)
+                processed += 1
+            except Exception as e:
+                logging.warning(f"Не удалось построить форму волны для {audio_path}: {e}")
+    return processed
+
+def start_backfill(rec_dir):
+    """Runs backfill_peaks() in a background thread; files are processed one at a time."""
+    def run():
+        processed = backfill_peaks(rec_dir)
+        if processed: logging.info(f"Построены формы волны для {processed} записей.")
+    thread = threading.Thread(target=run, name='peaks-backfill', daemon=True)
+    thread.start()
+    return thread
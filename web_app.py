@@ -3,16 +3,23 @@ from flask import request, session, redirect, url_for, jsonify
 from app_state import app
 from web_endpoints_control import control_bp
 from web_endpoints_ui import ui_bp
+from web_endpoints_debug import debug_bp
+from diagnostics import request_metrics
+from static_assets import asset_manifest
 
 def create_app():
     """Creates and configures the Flask application."""
     app.register_blueprint(control_bp)
     app.register_blueprint(ui_bp)
+    app.register_blueprint(debug_bp)
+    asset_manifest.init_app(app)
+    # Регистрируется до проверки входа, чтобы в гистограммы попадали и отказы 401
+    request_metrics.init_app(app)
 
     @app.before_request
     def before_request_func():
         # Skip auth check for static files, login, favicon, and logout
-        is_public_endpoint = request.endpoint in ['static', 'ui.login', 'ui.favicon', 'ui.logout']
+        is_public_endpoint = request.endpoint in ['static', 'ui.asset', 'ui.login', 'ui.favicon', 'ui.logout']
         is_ajax = request.headers.get('X-Requested-With') == 'XMLHttpRequest'
 
         if is_public_endpoint:
@@ -1,60 +1,107 @@
 from flask import Blueprint, jsonify, request
-from threading import Thread, current_thread
+from threading import Thread, Lock
 import time
 import os
 import queue
 import wave
 
-from recorder import (
-    start_recording_from_tray, stop_recording_from_tray,
-    pause_recording_from_tray, resume_recording_from_tray,
-    get_elapsed_record_time
-)
+from app_state import get_elapsed_record_time
+from recording_commands import recording_commands, InvalidTransition
+from state_store import state_store
+from config_manager import DEFAULT_SETTINGS
 import app_state
 
+STATUS_WAIT_TIMEOUT = 25  # Предел ожидания изменения состояния в /status?since=, с
+# Каждый ждущий /status?since= занимает обработчик пула сервера: ждать может не больше четверти из них
+STATUS_WAITERS_SHARE = 4
+_status_waiters = 0
+_status_waiters_lock = Lock()
+
+def _acquire_status_waiter():
+    global _status_waiters
+    workers = app_state.settings.get("server_workers") or DEFAULT_SETTINGS["server_workers"]
+    with _status_waiters_lock:
+        if _status_waiters >= max(int(workers) // STATUS_WAITERS_SHARE, 1): return False
+        _status_waiters += 1
+        return True
+
+def _release_status_waiter():
+    global _status_waiters
+    with _status_waiters_lock: _status_waiters -= 1
+
 control_bp = Blueprint('control', __name__)
 
+def _submit(name, message, **kwargs):
+    """Queues a recording command; the response carries its id for /commands/<id>."""
+    # Повтор запроса с тем же ключом (двойной клик, повтор после обрыва связи) возвращает ту же команду
+    key = request.headers.get('Idempotency-Key') or request.args.get('idempotency_key')
+    try:
+        command = recording_commands.submit(name, key=key, **kwargs)
+    except InvalidTransition as e:
+        return jsonify({"status": "error", "message": str(e)}), 409
+    return jsonify({"status": "ok", "message": message, "command_id": command.id, "command": command.to_dict()})
+
 @control_bp.route('/rec')
 def rec():
-    # Запускаем в потоке, чтобы не блокировать ответ
-    Thread(target=start_recording_from_tray, daemon=True).start() # pragma: no cover
-    return jsonify({"status": "ok", "message": "Recording command sent."})
+    return _submit("start", "Recording command sent.")
 
 @control_bp.route('/stop', methods=['GET', 'POST'])
 def stop():
     # Получаем настройки из запроса, если они есть
     request_settings = request.get_json() if request.is_json else None
-    # Запускаем в потоке, передавая настройки
-    Thread(target=stop_recording_from_tray, kwargs={'request_settings': request_settings}, daemon=True).start() # pragma: no cover
-    return jsonify({"status": "ok", "message": "Stop command sent."})
+    return _submit("stop", "Stop command sent.", request_settings=request_settings)
 
 @control_bp.route('/pause')
 def pause():
-    Thread(target=pause_recording_from_tray, daemon=True).start()
-    return jsonify({"status": "ok", "message": "Pause command sent."})
+    return _submit("pause", "Pause command sent.")
 
 @control_bp.route('/resume')
 def resume():
-    Thread(target=resume_recording_from_tray, daemon=True).start()
-    return jsonify({"status": "ok", "message": "Resume command sent."})
+    return _submit("resume", "Resume command sent.")
+
+@control_bp.route('/commands')
+def list_commands():
+    return jsonify(recording_commands.list())
+
+@control_bp.route('/commands/<command_id>')
+def get_command(command_id):
+    command = recording_commands.get(command_id)
+    if command is None: return jsonify({"status": "error", "message": "Команда не найдена"}), 404
+    return jsonify(command)
 
 @control_bp.route('/status')
 def status():
-    if app_state.is_recording:
-        status_str = "paused" if app_state.is_paused else "rec"
+    # ?since=<version>: ответ откладывается, пока состояние не изменится (не дольше timeout секунд)
+    since = request.args.get('since', type=int)
+    waited = since is not None and _acquire_status_waiter()
+    if waited:
+        try:
+            timeout = min(max(request.args.get('timeout', STATUS_WAIT_TIMEOUT, type=float), 0), STATUS_WAIT_TIMEOUT)
+            version, state = state_store.wait_for_change(since, timeout)
+        finally:
+            _release_status_waiter()
+    else:
+        version, state = state_store.version, state_store.snapshot()
+
+    if state["is_recording"]:
+        status_str = "paused" if state["is_paused"] else "rec"
         rec_time = time.strftime('%H:%M:%S', time.gmtime(get_elapsed_record_time()))
-        recording_status = {"status": status_str, "time": rec_time, "is_paused": app_state.is_paused}
+        recording_status = {"status": status_str, "time": rec_time, "is_paused": state["is_paused"]}
     else:
         recording_status = {"status": "stop", "time": "00:00:00"}
 
-    if app_state.is_post_processing:
+    if state["is_post_processing"]:
         stage_map = {"transcribe": "Транскрибация", "protocol": "Создание протокола"}
-        info = f"{stage_map.get(app_state.post_process_stage, 'Постобработка')} файла: {os.path.basename(app_state.post_process_file_path)}"
+        info = f"{stage_map.get(state['post_process_stage'], 'Постобработка')} файла: {os.path.basename(state['post_process_file_path'])}"
     else:
         info = "Постобработка не выполняется"
     
-    recording_status["post_processing"] = {"active": app_state.is_post_processing, "info": info, "stage": app_state.post_process_stage if app_state.is_post_processing else None}
-    return jsonify(recording_status)
+    recording_status["post_processing"] = {"active": state["is_post_processing"], "info": info, "stage": state["post_process_stage"] if state["is_post_processing"] else None}
+    recording_status["version"] = version
+    response = jsonify(recording_status)
+    # Мест для ожидания нет: ответ сразу, клиенту стоит повторить запрос не раньше чем через секунду
+    if since is not None and not waited: response.headers['Retry-After'] = '1'
+    return response
 
 @control_bp.route('/audio_levels')
 def get_audio_levels():
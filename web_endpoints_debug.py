@@ -0,0 +1,60 @@
+from flask import Blueprint, jsonify, request
+
+from diagnostics import request_metrics, sampling_profiler, allocation_tracker, thread_dump, PROFILE_INTERVAL_MS
+
+debug_bp = Blueprint('debug', __name__, url_prefix='/debug')
+
+@debug_bp.route('/metrics')
+def metrics():
+    return jsonify(request_metrics.snapshot())
+
+@debug_bp.route('/metrics/reset', methods=['POST'])
+def reset_metrics():
+    request_metrics.reset()
+    return jsonify({"status": "ok"})
+
+@debug_bp.route('/profile')
+def profile():
+    return jsonify(sampling_profiler.result())
+
+@debug_bp.route('/profile/start', methods=['POST'])
+def start_profile():
+    try:
+        seconds = float(request.args.get('seconds', 10))
+        interval_ms = float(request.args.get('interval_ms', PROFILE_INTERVAL_MS))
+    except ValueError:
+        return jsonify({"status": "error", "message": "seconds и interval_ms должны быть числами"}), 400
+    if not sampling_profiler.start(seconds, interval_ms):
+        return jsonify({"status": "error", "message": "Профилировщик уже запущен"}), 409
+    return jsonify({"status": "ok", "profile": sampling_profiler.result()})
+
+@debug_bp.route('/profile/stop', methods=['POST'])
+def stop_profile():
+    return jsonify(sampling_profiler.stop())
+
+@debug_bp.route('/tracemalloc')
+def tracemalloc_diff():
+    try:
+        limit = min(max(int(request.args.get('limit', 30)), 1), 500)
+    except ValueError:
+        return jsonify({"status": "error", "message": "limit должен быть числом"}), 400
+    group_by = request.args.get('group_by', 'lineno')
+    if group_by not in ('lineno', 'filename', 'traceback'):
+        return jsonify({"status": "error", "message": "group_by: lineno, filename или traceback"}), 400
+    diff = allocation_tracker.diff(limit, group_by)
+    if diff is None: return jsonify({"status": "error", "message": "Отслеживание памяти не запущено"}), 409
+    return jsonify(diff)
+
+@debug_bp.route('/tracemalloc/start', methods=['POST'])
+def start_tracemalloc():
+    allocation_tracker.start()
+    return jsonify({"status": "ok"})
+
+@debug_bp.route('/tracemalloc/stop', methods=['POST'])
+def stop_tracemalloc():
+    allocation_tracker.stop()
+    return jsonify({"status": "ok"})
+
+@debug_bp.route('/threads')
+def threads():
+    return jsonify(thread_dump())
@@ -1,28 +1,45 @@
 import os
 import re
-import uuid
 import json
+import base64
+import sqlite3
 from threading import Thread
 import logging
 from pathlib import Path
 
-from pydub import AudioSegment
 from flask import (
     Blueprint, render_template, jsonify, request, send_file, Response,
     session, redirect, url_for
 )
 from werkzeug.security import check_password_hash
 from werkzeug.utils import secure_filename
+from werkzeug.formparser import FormDataParser, default_stream_factory
 from datetime import datetime, timedelta
 
-from app_state import get_application_path, settings, contacts_data
-from config_manager import save_settings, save_contacts
+from app_state import get_application_path, settings
+from config_manager import (
+    update_settings, get_settings_snapshot, save_contacts, contacts_store, settings_store, DEFAULT_SETTINGS, DEFAULT_GROUP_NAME
+)
 from utils import (
-    get_date_dirs_data, get_recordings_for_date_data, get_recordings_last_modified,
-    build_final_prompt_addition
+    get_date_dirs_data, get_recordings_for_date_data,
+    build_prompt_addition_with_report
+)
+from postprocessing import process_transcription_task, process_protocol_task, api_configured
+from preview_cache import preview_cache, preview_cache_key, PreviewSuperseded
+from recordings_index import recordings_index, resolve_audio_path, ARCHIVE_DIR, AUDIO_EXTENSIONS
+from recordings_watcher import recordings_watcher
+from http_cache import cached_json
+from static_assets import asset_manifest
+from waveform_peaks import ensure_peaks, read_peaks, peaks_path_for
+from audio_preview import audio_preview_cache, AUDIO_PREVIEW_FORMATS
+from batch_jobs import batch_scheduler
+from storage_policy import storage_policy
+from app_state import get_favicon_bytes
+from upload_transcoder import upload_jobs, StreamingTranscoder, staging_path
+from resumable_uploads import (
+    resumable_uploads, parse_upload_metadata, parse_checksum,
+    UploadConflict, UploadGone, ChecksumMismatch, RESUMABLE_MAX_SIZE
 )
-from postprocessing import process_transcription_task, process_protocol_task
-from app_state import is_recording, is_paused, FAVICON_REC_BYTES, FAVICON_PAUSE_BYTES, FAVICON_STOP_BYTES
 
 ui_bp = Blueprint('ui', __name__)
 
@@ -48,26 +65,90 @@ def logout():
     session.pop('logged_in', None)
     return redirect(url_for('ui.login'))
 
+def _recordings_version(date=None):
+    """Data version for ETags of the recording lists; None (no ETag) if changes on disk are not being watched."""
+    if not recordings_watcher.is_running: return None
+    generation = recordings_watcher.generation if date is None else recordings_watcher.date_generation(date)
+    return (recordings_watcher.epoch, generation)
+
 @ui_bp.route('/get_date_dirs')
 def get_date_dirs():
-    return jsonify(get_date_dirs_data())
+    # Новая папка даты может появиться через любое изменение записи, поэтому здесь общее поколение
+    return cached_json(_recordings_version(), get_date_dirs_data)
 
 @ui_bp.route('/get_recordings_for_date/<date_str>')
 def get_recordings_for_date(date_str):
     if not re.match(r'^\d{4}-\d{2}-\d{2}$', date_str):
         return jsonify({"error": "Invalid date format"}), 400
-    return jsonify(get_recordings_for_date_data(date_str))
+    return cached_json(_recordings_version(date_str), lambda: get_recordings_for_date_data(date_str))
+
+RECORDINGS_PAGE_DEFAULT = 50
+RECORDINGS_PAGE_MAX = 500
+
+def _encode_recordings_cursor(key):
+    return base64.urlsafe_b64encode(json.dumps(key, ensure_ascii=False).encode('utf-8')).decode('ascii').rstrip('=')
+
+def _decode_recordings_cursor(cursor):
+    try:
+        key = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode('utf-8'))
+    except (ValueError, UnicodeDecodeError):
+        return None
+    if not isinstance(key, list) or len(key) != 3 or not all(isinstance(part, str) for part in key): return None
+    return key
+
+@ui_bp.route('/recordings')
+def list_recordings():
+    """Recordings across date folders, newest first (order=asc for oldest first), paged with an opaque cursor."""
+    date_from, date_to = request.args.get('from'), request.args.get('to')
+    for value in (date_from, date_to):
+        if value and not re.match(r'^\d{4}-\d{2}-\d{2}$', value):
+            return jsonify({"error": "Invalid date format"}), 400
+    limit = request.args.get('limit', RECORDINGS_PAGE_DEFAULT, type=int)
+    if limit is None or limit < 1: return jsonify({"error": "Invalid limit"}), 400
+    order = request.args.get('order', 'desc')
+    if order not in ('asc', 'desc'): return jsonify({"error": "Invalid order"}), 400
+    after = None
+    if request.args.get('cursor'):
+        after = _decode_recordings_cursor(request.args['cursor'])
+        if after is None: return jsonify({"error": "Invalid cursor"}), 400
+    recordings, next_key = recordings_index.query(
+        date_from=date_from, date_to=date_to, limit=min(limit, RECORDINGS_PAGE_MAX), after=after, descending=order == 'desc'
+    )
+    return jsonify({
+        "recordings": recordings,
+        "next_cursor": _encode_recordings_cursor(next_key) if next_key else None,
+    })
+
+SEARCH_RESULTS_DEFAULT = 20
+SEARCH_RESULTS_MAX = 100
+
+@ui_bp.route('/search')
+def search_recordings():
+    """Full-text search over titles, prompt additions and transcripts, best matches first."""
+    query = request.args.get('q', '').strip()
+    if not query: return jsonify({"error": "Empty query"}), 400
+    date_from, date_to = request.args.get('from'), request.args.get('to')
+    for value in (date_from, date_to):
+        if value and not re.match(r'^\d{4}-\d{2}-\d{2}$', value):
+            return jsonify({"error": "Invalid date format"}), 400
+    limit = request.args.get('limit', SEARCH_RESULTS_DEFAULT, type=int)
+    if limit is None or limit < 1: return jsonify({"error": "Invalid limit"}), 400
+    try:
+        results = recordings_index.search(query, limit=min(limit, SEARCH_RESULTS_MAX), date_from=date_from, date_to=date_to)
+    except sqlite3.OperationalError as e:
+        logging.error(f"Ошибка полнотекстового поиска по запросу '{query}': {e}")
+        return jsonify({"error": "Invalid query"}), 400
+    return jsonify({"query": query, "results": results})
 
 @ui_bp.route('/recordings_state')
 def recordings_state():
-    return jsonify({"last_modified": get_recordings_last_modified()})
+    since = request.args.get('since', type=int)
+    return jsonify(recordings_watcher.state(since=since, epoch=request.args.get('epoch')))
 
 @ui_bp.route('/contacts_state')
 def contacts_state():
-    contacts_file_path = os.path.join(get_application_path(), 'contacts.json')
-    if os.path.exists(contacts_file_path):
-        return jsonify({"last_modified": os.path.getmtime(contacts_file_path)})
-    return jsonify({"last_modified": 0})
+    # contacts.json больше не переписывается при изменениях, поэтому отдаем версию хранилища
+    return jsonify({"last_modified": contacts_store.version})
 
 
 @ui_bp.route('/preview_prompt_addition', methods=['POST'])
@@ -80,7 +161,7 @@ def preview_prompt_addition():
             return jsonify({"error": "No settings provided"}), 400
 
         # Создаем временную копию глобальных настроек и обновляем ее данными из запроса
-        temp_settings_for_preview = settings.copy()
+        temp_settings_for_preview = dict(get_settings_snapshot())
         temp_settings_for_preview.update(current_settings_from_request)
 
         # Определяем дату для предпросмотра на основе настроек из запроса
@@ -96,9 +177,30 @@ def preview_prompt_addition():
 
         # Передаем временные настройки в функцию построения промпта
         preview_path = Path(os.path.join(get_application_path(), 'rec', date_for_preview.strftime('%Y-%m-%d'))) # is_preview=True, so path doesn't have to exist
-        final_prompt_text = build_final_prompt_addition(base_path=preview_path, recording_date=date_for_preview, is_preview=True, override_settings=temp_settings_for_preview)
-        
-        return jsonify({"prompt_text": final_prompt_text})
+
+        # Одинаковые запросы (набор текста, повторные клики) обслуживаются из кэша по хэшу входных данных
+        cache_key = preview_cache_key(temp_settings_for_preview, date_for_preview, preview_path)
+        if request.if_none_match.contains(cache_key):
+            response = Response(status=304)
+            response.set_etag(cache_key)
+            return response
+
+        client_id = request.headers.get('X-Preview-Client')
+        seq = request.headers.get('X-Preview-Seq', type=int)
+        preview_cache.register_request(client_id, seq)
+        try:
+            final_prompt_text, budget_report = preview_cache.get_or_compute(
+                cache_key,
+                lambda: build_prompt_addition_with_report(base_path=preview_path, recording_date=date_for_preview, is_preview=True, override_settings=temp_settings_for_preview),
+                client_id=client_id, seq=seq
+            )
+        except PreviewSuperseded:
+            return jsonify({"status": "superseded"}), 409
+
+        response = jsonify({"prompt_text": final_prompt_text, "budget": budget_report})
+        response.set_etag(cache_key)
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -113,6 +215,7 @@ def update_metadata(date_str, filename):
         metadata = json.load(f)
         metadata['title'] = new_title
         f.seek(0); json.dump(metadata, f, indent=4, ensure_ascii=False); f.truncate()
+    recordings_index.refresh_path(json_path)
     return jsonify({"status": "ok"})
 
 @ui_bp.route('/get_metadata/<date_str>/<filename>')
@@ -128,6 +231,8 @@ def serve_recorded_file(filepath):
     rec_dir = os.path.join(get_application_path(), 'rec')
     file_path = os.path.join(rec_dir, filepath)
     if not os.path.abspath(file_path).startswith(os.path.abspath(rec_dir)): return "Access denied", 403
+    # Аудио старых записей может быть перенесено в архив политикой хранения
+    file_path = resolve_audio_path(file_path)
     if not os.path.exists(file_path): return "File not found", 404
     
     import mimetypes
@@ -136,21 +241,63 @@ def serve_recorded_file(filepath):
         return send_file(file_path, mimetype=mime_type)
     return send_file(file_path)
 
+PEAKS_DEFAULT_WIDTH = 1000
+PEAKS_MAX_WIDTH = 8000
+
+@ui_bp.route('/peaks/<path:filepath>')
+def recording_peaks(filepath):
+    """Waveform min/max peaks of a recording for a zoom level: `width` peaks over [start, end) seconds."""
+    rec_dir = os.path.join(get_application_path(), 'rec')
+    file_path = os.path.join(rec_dir, filepath)
+    if not os.path.abspath(file_path).startswith(os.path.abspath(rec_dir)): return "Access denied", 403
+    file_path = resolve_audio_path(file_path)
+    if not os.path.exists(file_path) or not file_path.lower().endswith(AUDIO_EXTENSIONS): return "File not found", 404
+    width = request.args.get('width', PEAKS_DEFAULT_WIDTH, type=int)
+    start, end = request.args.get('start', 0.0, type=float), request.args.get('end', type=float)
+    if width is None or width < 1 or start is None or start < 0: return jsonify({"error": "Invalid parameters"}), 400
+    try:
+        sidecar = ensure_peaks(file_path)
+        st = os.stat(sidecar)
+    except Exception as e:
+        logging.error(f"Не удалось построить форму волны для {file_path}: {e}")
+        return jsonify({"error": "Не удалось построить форму волны"}), 500
+    return cached_json((st.st_mtime_ns, st.st_size), lambda: read_peaks(sidecar, start, end, min(width, PEAKS_MAX_WIDTH)))
+
+@ui_bp.route('/preview_audio/<path:filepath>')
+def preview_audio(filepath):
+    """Low-bitrate mono copy of a recording (`format=opus|mp3`), streamed while ffmpeg is still producing it."""
+    rec_dir = os.path.join(get_application_path(), 'rec')
+    file_path = os.path.join(rec_dir, filepath)
+    if not os.path.abspath(file_path).startswith(os.path.abspath(rec_dir)): return "Access denied", 403
+    file_path = resolve_audio_path(file_path)
+    if not os.path.exists(file_path) or not file_path.lower().endswith(AUDIO_EXTENSIONS): return "File not found", 404
+    fmt = request.args.get('format', 'opus')
+    if fmt not in AUDIO_PREVIEW_FORMATS: return jsonify({"error": "Invalid format"}), 400
+    mimetype = AUDIO_PREVIEW_FORMATS[fmt]['mimetype']
+    try:
+        kind, value = audio_preview_cache.get(file_path, fmt)
+    except OSError as e:
+        logging.error(f"Не удалось подготовить превью {file_path}: {e}")
+        return jsonify({"error": "Не удалось подготовить превью"}), 500
+    # Готовое превью отдается с поддержкой Range, чтобы плеер мог перематывать
+    if kind == 'file': return send_file(value, mimetype=mimetype, conditional=True)
+    if value.wait_started() is not None: return jsonify({"error": "Не удалось подготовить превью"}), 500
+    return Response(value.iter_chunks(), mimetype=mimetype, headers={'Cache-Control': 'no-store'})
+
 @ui_bp.route('/save_web_settings', methods=['POST'])
 def save_web_settings():
     try:
         data = request.get_json()
         if not data:
             return jsonify({"status": "error", "message": "Нет данных"}), 400
-        settings.update(data)
-        save_settings(settings.copy())
+        update_settings(data)
         return jsonify({"status": "ok"})
     except Exception as e:
         return jsonify({"status": "error", "message": f"Ошибка: {e}"}), 500
 
 @ui_bp.route('/get_web_settings')
 def get_web_settings():
-    return jsonify({
+    return cached_json(settings_store.version, lambda: {
         "use_custom_prompt": settings.get("use_custom_prompt", False),
         "prompt_addition": settings.get("prompt_addition", ""),
         "selected_contacts": settings.get("selected_contacts", []),
@@ -161,17 +308,52 @@ def get_web_settings():
         "active_meeting_name_template_id": settings.get("active_meeting_name_template_id", None),
         "relay_enabled": settings.get("relay_enabled", False),
         "confirm_prompt_on_action": settings.get("confirm_prompt_on_action", False),
+        "prompt_budget": settings.get("prompt_budget", DEFAULT_SETTINGS["prompt_budget"]),
+        "storage_policy": storage_policy.config(),
     })
 
+@ui_bp.route('/storage_policy')
+def storage_policy_status():
+    return jsonify({"settings": storage_policy.config(), "running": storage_policy.running, "last_report": storage_policy.last_report})
+
+@ui_bp.route('/storage_policy/run', methods=['POST'])
+def storage_policy_run():
+    if storage_policy.running: return jsonify({"status": "error", "message": "Политика хранения уже выполняется"}), 409
+    storage_policy.trigger()
+    return jsonify({"status": "ok"}), 202
+
 @ui_bp.route('/get_contacts')
 def get_contacts():
-    contacts_data.get("groups", []).sort(key=lambda g: g.get("name", ""))
-    return jsonify(contacts_data)
+    def build():
+        data = contacts_store.export()
+        data["groups"].sort(key=lambda g: g.get("name", ""))
+        return data
+    return cached_json(contacts_store.version, build)
 
 @ui_bp.route('/get_group_names')
 def get_group_names():
-    group_names = sorted(list(set([g.get("name") for g in contacts_data.get("groups", []) if g.get("name")])))
-    return jsonify(group_names)
+    return jsonify(contacts_store.group_names())
+
+@ui_bp.route('/contacts/export')
+def export_contacts_web():
+    response = jsonify(contacts_store.export())
+    response.headers['Content-Disposition'] = 'attachment; filename=contacts.json'
+    return response
+
+@ui_bp.route('/contacts/import', methods=['POST'])
+def import_contacts_web():
+    uploaded = request.files.get('file')
+    try:
+        data = json.load(uploaded.stream) if uploaded else request.get_json()
+    except (json.JSONDecodeError, UnicodeDecodeError) as e:
+        return jsonify({"status": "error", "message": f"Некорректный JSON: {e}"}), 400
+    if not isinstance(data, dict) or not isinstance(data.get("groups"), list):
+        return jsonify({"status": "error", "message": "Ожидается объект вида {\"groups\": [...]}"}), 400
+    save_contacts(data)
+    known_ids = [cid for cid in settings.get("selected_contacts", []) if contacts_store.get_contact(cid)]
+    if known_ids != settings.get("selected_contacts", []):
+        update_settings({"selected_contacts": known_ids})
+    return jsonify({"status": "ok"})
 
 @ui_bp.route('/groups/add', methods=['POST'])
 def add_group_web():
@@ -182,12 +364,9 @@ def add_group_web():
     if not group_name:
         logging.warning("Имя группы пустое, возвращаем ошибку 400.")
         return jsonify({"status": "error", "message": "Имя группы не может быть пустым"}), 400
-    if any(g['name'] == group_name for g in contacts_data.get("groups", [])):
+    if not contacts_store.add_group(group_name):
         logging.warning(f"Группа '{group_name}' уже существует, возвращаем ошибку 409.")
         return jsonify({"status": "error", "message": f"Группа '{group_name}' уже существует"}), 409
-    
-    contacts_data.setdefault('groups', []).append({"name": group_name, "contacts": []})
-    save_contacts(contacts_data)
     logging.info(f"Группа '{group_name}' успешно создана и сохранена.")
     return jsonify({"status": "ok"})
 
@@ -195,40 +374,27 @@ def add_group_web():
 def add_contact_web():
     data = request.json
     name = data.get('name', '').strip()
-    group_name = data.get('group_name', 'Без группы').strip() or 'Без группы'
+    group_name = data.get('group_name', DEFAULT_GROUP_NAME).strip() or DEFAULT_GROUP_NAME
     if not name: return jsonify({"status": "error", "message": "Имя не может быть пустым"}), 400
-    new_contact = {"id": str(uuid.uuid4()), "name": name}
-    group = next((g for g in contacts_data.get("groups", []) if g['name'] == group_name), None)
-    if group is not None: group.setdefault('contacts', []).append(new_contact)
-    else: contacts_data.setdefault('groups', []).append({"name": group_name, "contacts": [new_contact]})
-    save_contacts(contacts_data)
+    new_contact = contacts_store.add_contact(name, group_name)
     return jsonify({"status": "ok", "contact": new_contact})
 
 @ui_bp.route('/contacts/update/<contact_id>', methods=['POST'])
 def update_contact_web(contact_id):
     new_name = request.json.get('name', '').strip()
     if not new_name: return jsonify({"status": "error", "message": "Имя не может быть пустым"}), 400
-    for group in contacts_data.get("groups", []):
-        for contact in group.get("contacts", []):
-            if contact.get("id") == contact_id:
-                contact["name"] = new_name
-                save_contacts(contacts_data)
-                return jsonify({"status": "ok"})
+    if contacts_store.rename_contact(contact_id, new_name):
+        return jsonify({"status": "ok"})
     return jsonify({"status": "error", "message": "Участник не найден"}), 404
 
 @ui_bp.route('/contacts/delete/<contact_id>', methods=['POST'])
 def delete_contact_web(contact_id):
-    for group in contacts_data.get("groups", []):
-        original_len = len(group.get("contacts", []))
-        group["contacts"] = [c for c in group.get("contacts", []) if c.get("id") != contact_id]
-        if len(group.get("contacts", [])) < original_len:
-            # Группу не удаляем, даже если она стала пустой
-            if contact_id in settings.get("selected_contacts", []):
-                settings["selected_contacts"].remove(contact_id)
-                save_settings(settings)
-            save_contacts(contacts_data)
-            return jsonify({"status": "ok"})
-    return jsonify({"status": "error", "message": "Участник не найден"}), 404
+    if not contacts_store.delete_contact(contact_id):
+        return jsonify({"status": "error", "message": "Участник не найден"}), 404
+    # Группу не удаляем, даже если она стала пустой
+    if contact_id in settings.get("selected_contacts", []):
+        update_settings({"selected_contacts": [cid for cid in settings.get("selected_contacts", []) if cid != contact_id]})
+    return jsonify({"status": "ok"})
 
 @ui_bp.route('/groups/update', methods=['POST'])
 def update_group_web():
@@ -236,26 +402,19 @@ def update_group_web():
     old_name, new_name = data.get('old_name', '').strip(), data.get('new_name', '').strip()
     if not old_name or not new_name: return jsonify({"status": "error", "message": "Имя группы не может быть пустым"}), 400
     if old_name == new_name: return jsonify({"status": "ok"})
-    if any(g.get('name') == new_name for g in contacts_data.get("groups", [])): return jsonify({"status": "error", "message": f"Группа '{new_name}' уже существует"}), 409
-    for group in contacts_data.get("groups", []):
-        if group.get("name") == old_name:
-            group["name"] = new_name
-            save_contacts(contacts_data)
-            return jsonify({"status": "ok"})
+    if contacts_store.has_group(new_name): return jsonify({"status": "error", "message": f"Группа '{new_name}' уже существует"}), 409
+    if contacts_store.rename_group(old_name, new_name):
+        return jsonify({"status": "ok"})
     return jsonify({"status": "error", "message": "Группа не найдена"}), 404
 
 @ui_bp.route('/groups/delete', methods=['POST'])
 def delete_group_web():
     group_name = request.json.get('name', '').strip()
     if not group_name: return jsonify({"status": "error", "message": "Имя группы не может быть пустым"}), 400
-    group_to_delete = next((g for g in contacts_data.get("groups", []) if g.get("name") == group_name), None)
-    if not group_to_delete: return jsonify({"status": "error", "message": "Группа не найдена"}), 404
-    contact_ids_to_remove = {c.get("id") for c in group_to_delete.get("contacts", []) if c.get("id")}
-    contacts_data["groups"] = [g for g in contacts_data.get("groups", []) if g.get("name") != group_name]
+    contact_ids_to_remove = contacts_store.delete_group(group_name)
+    if contact_ids_to_remove is None: return jsonify({"status": "error", "message": "Группа не найдена"}), 404
     if contact_ids_to_remove and "selected_contacts" in settings:
-        settings["selected_contacts"] = [cid for cid in settings.get("selected_contacts", []) if cid not in contact_ids_to_remove]
-        save_settings(settings)
-    save_contacts(contacts_data)
+        update_settings({"selected_contacts": [cid for cid in settings.get("selected_contacts", []) if cid not in contact_ids_to_remove]})
     return jsonify({"status": "ok"})
 
 @ui_bp.route('/update_metadata_and_recreate/<task_type>/<date>/<filename>', methods=['POST'])
@@ -275,10 +434,13 @@ def update_metadata_and_recreate(task_type, date, filename):
         metadata["settings"] = data
         # Пересчитываем и сохраняем promptAddition
         recording_date = datetime.fromisoformat(metadata.get("startTime", datetime.now().isoformat()))
-        metadata["promptAddition"] = build_final_prompt_addition(base_path=json_path.parent, recording_date=recording_date, override_settings=data)
+        metadata["promptAddition"], budget_report = build_prompt_addition_with_report(base_path=json_path.parent, recording_date=recording_date, override_settings=data)
+        if budget_report: metadata["promptBudget"] = budget_report
+        else: metadata.pop("promptBudget", None)
         f.seek(0)
         json.dump(metadata, f, indent=4, ensure_ascii=False)
         f.truncate()
+    recordings_index.refresh_path(json_path)
 
     if task_type == 'transcription':
         return recreate_transcription(date, filename)
@@ -288,17 +450,17 @@ def update_metadata_and_recreate(task_type, date, filename):
 
 @ui_bp.route('/recreate_transcription/<date>/<filename>', methods=['POST'])
 def recreate_transcription(date, filename):
-    file_path = os.path.join(get_application_path(), 'rec', date, filename)
+    file_path = resolve_audio_path(os.path.join(get_application_path(), 'rec', date, filename))
     if not os.path.exists(file_path): return jsonify({"status": "error", "message": "Аудиофайл не найден"}), 404
-    Thread(target=process_transcription_task, args=(file_path,), daemon=True).start()
-    return jsonify({"status": "ok", "message": "Задача пересоздания транскрипции запущена."})
+    job = batch_scheduler.submit('recreate_transcription', [{"date": date, "filename": filename}])
+    return jsonify({"status": "ok", "message": "Задача пересоздания транскрипции запущена.", "job_id": job.id})
 
 @ui_bp.route('/recreate_protocol/<date>/<filename>', methods=['POST'])
 def recreate_protocol(date, filename):
     txt_file_path = os.path.join(get_application_path(), 'rec', date, os.path.splitext(filename)[0] + ".txt")
     if not os.path.exists(txt_file_path): return jsonify({"status": "error", "message": "Файл транскрипции (.txt) не найден."}), 404
-    Thread(target=process_protocol_task, args=(txt_file_path,), daemon=True).start()
-    return jsonify({"status": "ok", "message": "Задача пересоздания протокола запущена."})
+    job = batch_scheduler.submit('recreate_protocol', [{"date": date, "filename": filename}])
+    return jsonify({"status": "ok", "message": "Задача пересоздания протокола запущена.", "job_id": job.id})
 
 @ui_bp.route('/delete_recording/<date>/<filename>', methods=['DELETE'])
 def delete_recording(date, filename):
@@ -309,14 +471,23 @@ def delete_recording(date, filename):
 
     base_app_path = Path(get_application_path())
     rec_dir = base_app_path / 'rec' / date
-    base_name = Path(filename).stem
-    logging.info(f"Папка с записями: '{rec_dir}', базовое имя файла: '{base_name}'")
 
     # Проверка, чтобы избежать выхода за пределы папки с записями
     if not rec_dir.resolve().is_relative_to(base_app_path / 'rec'):
         logging.error(f"Попытка доступа за пределы папки 'rec': '{rec_dir}'")
         return jsonify({"status": "error", "message": "Доступ запрещен"}), 403
 
+    try:
+        deleted_count = _delete_recording_files(rec_dir, filename)
+    except OSError as e:
+        return jsonify({"status": "error", "message": f"Ошибка при удалении файла {Path(e.filename or '').name}: {e}"}), 500
+    return jsonify({"status": "ok", "message": f"Удалено {deleted_count} файлов."})
+
+def _delete_recording_files(rec_dir, filename):
+    """Deletes the audio, sidecar and protocol files of a recording. Returns the number of files deleted."""
+    base_name = Path(filename).stem
+    logging.info(f"Папка с записями: '{rec_dir}', базовое имя файла: '{base_name}'")
+
     # Собираем все возможные файлы для удаления
     # 1. Основные файлы (аудио, json, txt)
     pattern1 = f"{base_name}.*"
@@ -329,37 +500,126 @@ def delete_recording(date, filename):
     logging.info(f"Поиск по шаблону '{pattern2}'. Найдено файлов: {len(protocol_files)}. Файлы: {[str(f) for f in protocol_files]}")
     files_to_delete.extend(protocol_files)
 
+    # 3. Аудио в архиве и его форма волны
+    files_to_delete.extend((Path(ARCHIVE_DIR) / rec_dir.name).glob(f"{base_name}.*"))
+
     deleted_count = 0
-    # Используем set для удаления дубликатов, если они вдруг появятся
-    for file_path in set(files_to_delete):
-        try:
-            os.remove(file_path)
-            logging.info(f"Успешно удален файл: {file_path}")
-            deleted_count += 1
-        except OSError as e:
-            logging.error(f"Ошибка при удалении файла {file_path}: {e}")
-            return jsonify({"status": "error", "message": f"Ошибка при удалении файла {file_path.name}: {e}"}), 500
-    return jsonify({"status": "ok", "message": f"Удалено {deleted_count} файлов."})
+    try:
+        # Используем set для удаления дубликатов, если они вдруг появятся
+        for file_path in set(files_to_delete):
+            try:
+                os.remove(file_path)
+                logging.info(f"Успешно удален файл: {file_path}")
+                deleted_count += 1
+            except OSError as e:
+                logging.error(f"Ошибка при удалении файла {file_path}: {e}")
+                raise
+    finally:
+        recordings_index.refresh_path(rec_dir / filename)
+    return deleted_count
 
 @ui_bp.route('/compress_to_mp3/<date>/<filename>', methods=['POST'])
 def compress_to_mp3(date, filename):
     wav_path = os.path.join(get_application_path(), 'rec', date, filename)
     if not os.path.exists(wav_path) or not wav_path.lower().endswith('.wav'): return jsonify({"status": "error", "message": "WAV файл не найден"}), 404
-    def compress():
-        try:
-            mp3_path = wav_path.replace('.wav', '.mp3')
-            AudioSegment.from_wav(wav_path).export(mp3_path, format="mp3", parameters=["-y", "-loglevel", "quiet"])
-            os.remove(wav_path)
-        except Exception as e: print(f"Ошибка при сжатии в MP3: {e}")
-    Thread(target=compress, daemon=True).start()
-    return jsonify({"status": "ok"})
+    job = batch_scheduler.submit('compress', [{"date": date, "filename": filename}])
+    return jsonify({"status": "ok", "job_id": job.id})
+
+def _compress_wav(wav_path):
+    from pydub import AudioSegment
+    mp3_path = os.path.splitext(wav_path)[0] + '.mp3'
+    if os.path.normcase(mp3_path) == os.path.normcase(wav_path): raise ValueError(f"Файл уже имеет расширение .mp3: {wav_path}")
+    # MP3 пишется во временный файл и переименовывается: WAV удаляется только после готового MP3
+    part_path = mp3_path + '.part'
+    try:
+        AudioSegment.from_wav(wav_path).export(part_path, format="mp3", parameters=["-y", "-loglevel", "quiet"])
+        os.replace(part_path, mp3_path)
+        os.remove(wav_path)
+        # Звук тот же: форма волны остается актуальной для MP3
+        if os.path.exists(peaks_path_for(mp3_path)): os.utime(peaks_path_for(mp3_path))
+    except Exception as e:
+        try: os.remove(part_path)
+        except OSError: pass
+        logging.error(f"Ошибка при сжатии в MP3 {wav_path}: {e}")
+        raise
+    finally:
+        recordings_index.refresh_path(wav_path)
+
+# --- Пакетные операции ---
+BATCH_MAX_ITEMS = 1000
+
+def _batch_path(item, ext=None):
+    path = os.path.join(get_application_path(), 'rec', item['date'], item['filename'])
+    return os.path.splitext(path)[0] + ext if ext else resolve_audio_path(path)
+
+def _batch_compress(item):
+    wav_path = _batch_path(item)
+    if not os.path.exists(wav_path) or not wav_path.lower().endswith('.wav'): raise FileNotFoundError("WAV файл не найден")
+    _compress_wav(wav_path)
+
+def _batch_delete(item):
+    if not _delete_recording_files(Path(get_application_path()) / 'rec' / item['date'], item['filename']): raise FileNotFoundError("Файлы записи не найдены")
+
+def _batch_recreate_transcription(item):
+    file_path = _batch_path(item)
+    if not os.path.exists(file_path): raise FileNotFoundError("Аудиофайл не найден")
+    if not api_configured(): raise RuntimeError("Не заданы CRS_API_URL и CRS_API_KEY")
+    # Расшифровка архивной записи сохраняется рядом с остальными файлами в rec/
+    if not process_transcription_task(file_path, _batch_path(item, '.txt')): raise RuntimeError("Транскрибация не выполнена: задача отклонена API, завершилась ошибкой или не уложилась во время (подробности в журнале)")
+
+def _batch_recreate_protocol(item):
+    txt_file_path = _batch_path(item, '.txt')
+    if not os.path.exists(txt_file_path): raise FileNotFoundError("Файл транскрипции (.txt) не найден.")
+    if not api_configured(): raise RuntimeError("Не заданы CRS_API_URL и CRS_API_KEY")
+    if not process_protocol_task(txt_file_path): raise RuntimeError("Протокол не создан: задача отклонена API, завершилась ошибкой или не уложилась во время (подробности в журнале)")
+
+# Предел одновременных запусков: ffmpeg нагружает процессор, задачи API выполняются по одной
+batch_scheduler.register('compress', _batch_compress, concurrency=2)
+batch_scheduler.register('delete', _batch_delete, concurrency=4)
+batch_scheduler.register('recreate_transcription', _batch_recreate_transcription, concurrency=1)
+batch_scheduler.register('recreate_protocol', _batch_recreate_protocol, concurrency=1)
+
+@ui_bp.route('/batch', methods=['POST'])
+def batch_submit():
+    """Schedules an operation for a list of recordings: {"operation": ..., "items": [{"date": ..., "filename": ...}]}."""
+    data = request.get_json(silent=True) or {}
+    operation, items = data.get('operation'), data.get('items')
+    if operation not in batch_scheduler.operations: return jsonify({"status": "error", "message": "Неизвестная операция"}), 400
+    if not isinstance(items, list) or not items or len(items) > BATCH_MAX_ITEMS:
+        return jsonify({"status": "error", "message": f"Нужен список от 1 до {BATCH_MAX_ITEMS} записей"}), 400
+    parsed = []
+    for item in items:
+        date, filename = (item.get('date'), item.get('filename')) if isinstance(item, dict) else (None, None)
+        if not isinstance(date, str) or not re.match(r'^\d{4}-\d{2}-\d{2}$', date) or not isinstance(filename, str) \
+                or not filename or os.path.basename(filename) != filename or filename.startswith('.'):
+            return jsonify({"status": "error", "message": f"Неверная запись: {item}"}), 400
+        parsed.append({"date": date, "filename": filename})
+    job = batch_scheduler.submit(operation, parsed)
+    return jsonify(batch_scheduler.get(job.id)), 202
+
+@ui_bp.route('/batch')
+def batch_list():
+    return jsonify(batch_scheduler.list())
+
+@ui_bp.route('/batch/<job_id>')
+def batch_status(job_id):
+    job = batch_scheduler.get(job_id)
+    if job is None: return jsonify({"status": "error", "message": "Задание не найдено"}), 404
+    return jsonify(job)
+
+@ui_bp.route('/batch/<job_id>/cancel', methods=['POST'])
+def batch_cancel(job_id):
+    job = batch_scheduler.cancel(job_id)
+    if job is None: return jsonify({"status": "error", "message": "Задание не найдено"}), 404
+    return jsonify(job)
+
+@ui_bp.route('/assets/<path:name>')
+def asset(name):
+    return asset_manifest.response(name)
 
 @ui_bp.route('/favicon.ico')
 def favicon():
-    if is_recording and not is_paused: icon_bytes = FAVICON_REC_BYTES
-    elif is_recording and is_paused: icon_bytes = FAVICON_PAUSE_BYTES
-    else: icon_bytes = FAVICON_STOP_BYTES
-    return Response(icon_bytes, mimetype='image/vnd.microsoft.icon')
+    return Response(get_favicon_bytes(), mimetype='image/vnd.microsoft.icon')
 
 def process_uploaded_file_task(audio_file_path):
     """
@@ -372,69 +632,175 @@ def process_uploaded_file_task(audio_file_path):
     if os.path.exists(txt_file_path):
         process_protocol_task(txt_file_path)
 
+def _finish_uploaded_recording(mp3_file_path, now, base_filename, request_settings, duration_seconds):
+    """Writes the metadata of a converted upload and starts its transcription."""
+    rec_dir = Path(os.path.dirname(mp3_file_path))
+    # Определяем название записи
+    title = base_filename.replace('_', ' ').replace('-', ' ')
+    active_template_id = request_settings.get("active_meeting_name_template_id")
+    if active_template_id:
+        templates = request_settings.get("meeting_name_templates", [])
+        active_template = next((t for t in templates if t.get("id") == active_template_id), None)
+        if active_template and active_template.get("template"): title = active_template.get("template")
+
+    metadata = {
+        "startTime": now.isoformat(),
+        "endTime": (now + timedelta(seconds=duration_seconds)).isoformat(),
+        "duration": duration_seconds,
+        "title": title,
+        "settings": request_settings,
+    }
+    metadata["promptAddition"], budget_report = build_prompt_addition_with_report(base_path=rec_dir, recording_date=now, override_settings=request_settings)
+    if budget_report: metadata["promptBudget"] = budget_report
+    json_path = os.path.splitext(mp3_file_path)[0] + '.json'
+    with open(json_path, 'w', encoding='utf-8') as f: json.dump(metadata, f, indent=4, ensure_ascii=False)
+    recordings_index.refresh_path(json_path)
+    Thread(target=process_uploaded_file_task, args=(mp3_file_path,), daemon=True).start()
+
+def _upload_paths(now, filename):
+    """
+    Returns (base name, path of the original, path of the MP3) for an uploaded
+    file. The original is kept in the staging folder, so it never shares a
+    path with the MP3 (e.g. when an .mp3 is uploaded) and never shows up in rec/.
+    """
+    rec_dir = Path(get_application_path()) / 'rec' / now.strftime('%Y-%m-%d')
+    os.makedirs(rec_dir, exist_ok=True)
+    base_filename = os.path.splitext(secure_filename(filename))[0]
+    timestamp = now.strftime("%H-%M-%S")
+    return base_filename, staging_path(filename), os.path.join(rec_dir, f"{timestamp}_{base_filename}.mp3")
+
 @ui_bp.route('/add_file', methods=['POST'])
 def add_file():
-    if 'file' not in request.files:
+    """
+    Accepts a multipart upload ("file" and "settings"). The file is piped into
+    ffmpeg while it arrives; the response is sent as soon as the body is
+    received and carries a job_id for /uploads/<id>.
+    """
+    if request.mimetype != 'multipart/form-data':
         return jsonify({"status": "error", "message": "Файл не найден в запросе"}), 400
-    file = request.files['file']
-    if file.filename == '':
-        return jsonify({"status": "error", "message": "Файл не выбран"}), 400
+
+    now = datetime.now()
+    upload = {}
+
+    def stream_factory(total_content_length, content_type, filename, content_length=None):
+        # Вызывается парсером формы в начале каждой части-файла, до приема ее содержимого
+        if upload or not filename: return default_stream_factory(total_content_length, content_type, filename, content_length)
+        upload['base_filename'], source_path, mp3_path = _upload_paths(now, filename)
+        upload['transcoder'] = StreamingTranscoder(upload_jobs.create(filename), source_path, mp3_path)
+        return upload['transcoder']
 
     try:
-        request_settings = json.loads(request.form.get('settings', '{}'))
-
-        # 1. Сохраняем файл
-        now = datetime.now()
-        date_str = now.strftime('%Y-%m-%d')
-        rec_dir = Path(get_application_path()) / 'rec' / date_str
-        os.makedirs(rec_dir, exist_ok=True)
-
-        # Сохраняем оригинальный файл во временное место
-        base_filename = os.path.splitext(secure_filename(file.filename))[0]
-        timestamp = now.strftime("%H-%M-%S")
-        original_extension = file.filename.rsplit('.', 1)[1].lower()
-        temp_filename = f"{timestamp}_{base_filename}.{original_extension}"
-        temp_file_path = os.path.join(rec_dir, temp_filename)
-        file.save(temp_file_path)
-
-        # 2. Конвертируем в MP3
-        mp3_filename = f"{timestamp}_{base_filename}.mp3"
-        mp3_file_path = os.path.join(rec_dir, mp3_filename)
-        
-        try:
-            audio = AudioSegment.from_file(temp_file_path)
-            audio.export(mp3_file_path, format="mp3", parameters=["-y", "-loglevel", "quiet"])
-            os.remove(temp_file_path) # Удаляем временный оригинальный файл
-        except Exception as e:
-            # Если конвертация не удалась, удаляем временный файл и возвращаем ошибку
-            if os.path.exists(temp_file_path):
-                os.remove(temp_file_path)
+        parser = FormDataParser(stream_factory=stream_factory, max_form_memory_size=request.max_form_memory_size)
+        _, form, files = parser.parse(request.stream, request.mimetype, request.content_length, request.mimetype_params)
+    except Exception as e:
+        if 'transcoder' in upload:
+            upload['transcoder'].abort(f"Загрузка прервана: {e}")
+        elif upload:
+            # Часть с файлом найдена, но конвертер не запустился
+            logging.error(f"Не удалось начать конвертацию загрузки: {e}")
             return jsonify({"status": "error", "message": f"Ошибка конвертации файла в MP3: {e}"}), 500
+        return jsonify({"status": "error", "message": f"Ошибка при приеме файла: {e}"}), 400
 
-        # 3. Создаем метаданные для MP3 файла
-        duration_seconds = len(audio) / 1000.0
-
-        # Определяем название записи
-        title = base_filename.replace('_', ' ').replace('-', ' ')
-        active_template_id = request_settings.get("active_meeting_name_template_id")
-        if active_template_id:
-            templates = request_settings.get("meeting_name_templates", [])
-            active_template = next((t for t in templates if t.get("id") == active_template_id), None)
-            if active_template and active_template.get("template"): title = active_template.get("template")
-
-        metadata = {
-            "startTime": now.isoformat(),
-            "endTime": (now + timedelta(seconds=duration_seconds)).isoformat(),
-            "duration": duration_seconds,
-            "title": title,
-            "settings": request_settings,
-            "promptAddition": build_final_prompt_addition(base_path=rec_dir, recording_date=now, override_settings=request_settings),
-        }
-        json_path = os.path.splitext(mp3_file_path)[0] + '.json'
-        with open(json_path, 'w', encoding='utf-8') as f: json.dump(metadata, f, indent=4, ensure_ascii=False)
-
-        # 4. Запускаем обработку MP3 файла
-        Thread(target=process_uploaded_file_task, args=(mp3_file_path,), daemon=True).start()
-        return jsonify({"status": "ok", "message": f"Файл '{mp3_filename}' принят и поставлен в очередь на обработку."})
+    transcoder = upload.get('transcoder')
+    if transcoder is None or 'file' not in files or files['file'].stream is not transcoder:
+        if transcoder: transcoder.abort("Файл не найден в запросе")
+        return jsonify({"status": "error", "message": "Файл не найден в запросе"}), 400
+    try:
+        request_settings = json.loads(form.get('settings', '{}'))
+    except ValueError as e:
+        transcoder.abort(f"Некорректные настройки: {e}")
+        return jsonify({"status": "error", "message": f"Некорректные настройки: {e}"}), 400
+
+    base_filename = upload['base_filename']
+    transcoder.finish(lambda job: _finish_uploaded_recording(job.mp3_path, now, base_filename, request_settings, job.encoded_seconds))
+    mp3_filename = os.path.basename(transcoder.mp3_path)
+    return jsonify({"status": "ok", "message": f"Файл '{mp3_filename}' принят и поставлен в очередь на обработку.", "job_id": transcoder.job.id})
+
+@ui_bp.route('/uploads')
+def list_uploads():
+    return jsonify(upload_jobs.list())
+
+@ui_bp.route('/uploads/<job_id>')
+def get_upload(job_id):
+    job = upload_jobs.get(job_id)
+    if job is None: return jsonify({"status": "error", "message": "Загрузка не найдена"}), 404
+    return jsonify(job)
+
+TUS_HEADERS = {"Tus-Resumable": "1.0.0"}
+
+def _resumable_response(body, status, upload=None):
+    response = jsonify(body) if body is not None else Response(status=status)
+    response.status_code = status
+    response.headers.update(TUS_HEADERS)
+    response.headers['Cache-Control'] = 'no-store'
+    if upload:
+        state = upload.status()
+        response.headers['Upload-Offset'] = str(state["offset"])
+        response.headers['Upload-Length'] = str(upload.length)
+    return response
+
+@ui_bp.route('/uploads/resumable', methods=['POST'])
+def create_resumable_upload():
+    """
+    Creates a chunked upload (tus-like). Upload-Length is the file size,
+    Upload-Metadata carries filename, settings (JSON) and optionally the
+    sha256 (hex) of the whole file.
+    """
+    try:
+        length = int(request.headers.get('Upload-Length', ''))
+        metadata = parse_upload_metadata(request.headers.get('Upload-Metadata'))
+        request_settings = json.loads(metadata.get('settings', '{}'))
+    except ValueError as e:
+        return _resumable_response({"status": "error", "message": f"Некорректный запрос загрузки: {e}"}, 400)
+    filename = metadata.get('filename')
+    if not filename: return _resumable_response({"status": "error", "message": "Не указано имя файла"}, 400)
+    if length <= 0: return _resumable_response({"status": "error", "message": "Файл пуст"}, 400)
+    if length > RESUMABLE_MAX_SIZE: return _resumable_response({"status": "error", "message": "Файл слишком большой"}, 413)
+
+    now = datetime.now()
+    base_filename, source_path, mp3_path = _upload_paths(now, filename)
+    try:
+        upload = resumable_uploads.create(
+            filename, length, source_path, mp3_path, metadata.get('sha256'),
+            lambda job: _finish_uploaded_recording(job.mp3_path, now, base_filename, request_settings, job.encoded_seconds),
+        )
     except Exception as e:
-        return jsonify({"status": "error", "message": f"Ошибка при обработке файла: {e}"}), 500
\ No newline at end of file
+        logging.error(f"Не удалось начать загрузку {filename}: {e}")
+        return _resumable_response({"status": "error", "message": f"Не удалось начать загрузку: {e}"}, 500)
+    location = url_for('ui.resumable_upload', upload_id=upload.id)
+    response = _resumable_response({"status": "ok", "upload_id": upload.id, "job_id": upload.job.id, "location": location}, 201, upload)
+    response.headers['Location'] = location
+    return response
+
+@ui_bp.route('/uploads/resumable/<upload_id>', methods=['GET', 'PATCH', 'DELETE'])
+def resumable_upload(upload_id):
+    upload = resumable_uploads.get(upload_id)
+    if upload is None: return _resumable_response({"status": "error", "message": "Загрузка не найдена"}, 404)
+
+    if request.method in ('GET', 'HEAD'):
+        # HEAD обрабатывается здесь же: клиент узнает Upload-Offset, в теле GET — все принятые диапазоны
+        return _resumable_response(upload.status(), 200, upload)
+
+    if request.method == 'DELETE':
+        upload.abort("Загрузка отменена")
+        return _resumable_response(None, 204)
+
+    if request.mimetype != 'application/offset+octet-stream':
+        return _resumable_response({"status": "error", "message": "Ожидается Content-Type: application/offset+octet-stream"}, 415)
+    if request.content_length is None:
+        return _resumable_response({"status": "error", "message": "Не указан Content-Length"}, 411)
+    try:
+        offset = int(request.headers.get('Upload-Offset', ''))
+        checksum = parse_checksum(request.headers.get('Upload-Checksum'))
+    except ValueError as e:
+        return _resumable_response({"status": "error", "message": f"Некорректный запрос: {e}"}, 400)
+    try:
+        upload.write_chunk(offset, request.stream, request.content_length, checksum)
+    except UploadConflict as e:
+        return _resumable_response({"status": "error", "message": str(e)}, 409, upload)
+    except UploadGone as e:
+        return _resumable_response({"status": "error", "message": str(e)}, 410)
+    except ChecksumMismatch as e:
+        # 460 — код tus для несовпадения контрольной суммы
+        return _resumable_response({"status": "error", "message": str(e)}, 460, upload)
+    return _resumable_response(None, 204, upload)
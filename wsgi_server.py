@@ -0,0 +1,265 @@
+import time
+import queue
+import socket
+import logging
+import selectors
+import threading
+import traceback
+
+from werkzeug.serving import BaseWSGIServer, WSGIRequestHandler
+from werkzeug.wsgi import LimitedStream
+from werkzeug.exceptions import ClientDisconnected
+
+SERVER_WORKERS = 16
+SERVER_QUEUE_SIZE = 64  # Сколько соединений с готовым запросом может ждать свободного обработчика
+SERVER_KEEPALIVE_TIMEOUT = 15  # Секунды, которые простаивающее keep-alive соединение держится открытым
+SERVER_MAX_IDLE_CONNECTIONS = 256
+SERVER_REQUEST_TIMEOUT = 30  # Предел ожидания данных от клиента внутри одного запроса
+SERVER_DRAIN_LIMIT = 1024 * 1024  # Непрочитанное тело запроса больше этого не дочитывается: соединение закрывается
+SHED_BODY = "Сервер перегружен, повторите запрос позже".encode('utf-8')
+SHED_RESPONSE = (
+    b"HTTP/1.1 503 Service Unavailable\r\nContent-Type: text/plain; charset=utf-8\r\nRetry-After: 1\r\n"
+    b"Connection: close\r\nContent-Length: " + str(len(SHED_BODY)).encode('ascii') + b"\r\n\r\n" + SHED_BODY
+)
+
+class _PooledRequestHandler(WSGIRequestHandler):
+    """
+    Handles a single request per dispatch; between requests the connection
+    waits in the server's poller.
+
+    werkzeug's handler closes every connection (and drains the socket after
+    the response, which would swallow the next request), so run_wsgi is
+    replaced: the request body is consumed exactly up to Content-Length and
+    responses are delimited by Content-Length or chunked encoding.
+    """
+    protocol_version = "HTTP/1.1"
+    timeout = SERVER_REQUEST_TIMEOUT
+
+    def handle(self):
+        self.close_connection = True
+        try:
+            self.handle_one_request()
+        except (ConnectionError, socket.timeout) as e:
+            self.close_connection = True
+            self.connection_dropped(e)
+
+    def run_wsgi(self):
+        if self.headers.get("Expect", "").lower().strip() == "100-continue":
+            self.wfile.write(b"HTTP/1.1 100 Continue\r\n\r\n")
+        self.environ = environ = self.make_environ()
+        body = None
+        if environ.get("wsgi.input_terminated"):
+            # Тело chunked нельзя надежно дочитать до следующего запроса
+            self.close_connection = True
+        else:
+            body = environ["wsgi.input"] = LimitedStream(self.rfile, int(environ.get("CONTENT_LENGTH") or 0))
+        response = {"status": None, "headers": None, "sent": False, "chunked": False}
+
+        def write(data):
+            if not response["sent"]:
+                code_text, _, message = response["status"].partition(" ")
+                code = int(code_text)
+                self.send_response(code, message)
+                keys = set()
+                for key, value in response["headers"]:
+                    self.send_header(key, value)
+                    keys.add(key.lower())
+                if "content-length" not in keys and not (environ["REQUEST_METHOD"] == "HEAD" or 100 <= code < 200 or code in (204, 304)):
+                    if self.request_version == "HTTP/1.1":
+                        response["chunked"] = True
+                        self.send_header("Transfer-Encoding", "chunked")
+                    else:
+                        self.close_connection = True
+                if self.close_connection: self.send_header("Connection", "close")
+                self.end_headers()
+                response["sent"] = True
+            if data:
+                if response["chunked"]: self.wfile.write(f"{len(data):x}\r\n".encode('ascii'))
+                self.wfile.write(data)
+                if response["chunked"]: self.wfile.write(b"\r\n")
+
+        def start_response(status, headers, exc_info=None):
+            if exc_info:
+                try:
+                    if response["sent"]: raise exc_info[1].with_traceback(exc_info[2])
+                finally:
+                    exc_info = None
+            response["status"], response["headers"] = status, headers
+            return write
+
+        try:
+            iterable = self.server.app(environ, start_response)
+            if body is not None and not self.close_connection:
+                # Недочитанное приложением тело запроса дочитывается до ответа: после ответа клиент пришлет
+                # следующий запрос, и буфер rfile захватил бы его начало вместе с остатком тела
+                if body.limit - body.tell() > SERVER_DRAIN_LIMIT: self.close_connection = True
+                else:
+                    # Клиент мог оборвать соединение посреди тела (например, при загрузке части файла)
+                    try: body.exhaust()
+                    except ClientDisconnected: self.close_connection = True
+            try:
+                for data in iterable:
+                    write(data)
+                if not response["sent"]: write(b"")
+                if response["chunked"]: self.wfile.write(b"0\r\n\r\n")
+            finally:
+                if hasattr(iterable, "close"): iterable.close()
+        except (ConnectionError, socket.timeout) as e:
+            self.close_connection = True
+            self.connection_dropped(e, environ)
+        except Exception:
+            self.close_connection = True
+            self.log_error("Error on request:\n%s", traceback.format_exc())
+            if not response["sent"]:
+                error = "Внутренняя ошибка сервера".encode('utf-8')
+                response["status"], response["headers"] = "500 INTERNAL SERVER ERROR", [
+                    ("Content-Type", "text/plain; charset=utf-8"), ("Content-Length", str(len(error)))]
+                try: write(error)
+                except OSError: pass
+
+class PooledWSGIServer(BaseWSGIServer):
+    """
+    WSGI server with a fixed pool of worker threads and HTTP/1.1 keep-alive.
+
+    The accepting thread only puts connections into a bounded queue; when the
+    queue is full the connection gets an immediate 503 with Retry-After
+    instead of a new thread. After a response, a keep-alive connection does
+    not occupy a worker: it goes to a poller thread (selectors) and returns
+    to the queue when the next request arrives, or is closed after
+    keepalive_timeout seconds of silence. Long responses (file downloads,
+    streamed previews) hold their worker until they finish. Pipelined
+    requests are not supported (browsers do not send them).
+    """
+    multithread = True
+    request_queue_size = 128  # Очередь listen() ядра
+
+    def __init__(self, host, port, app, workers=SERVER_WORKERS, queue_size=SERVER_QUEUE_SIZE,
+                 keepalive_timeout=SERVER_KEEPALIVE_TIMEOUT, max_idle=SERVER_MAX_IDLE_CONNECTIONS):
+        super().__init__(host, port, app, handler=_PooledRequestHandler)
+        self.workers = max(int(workers), 1)
+        self.keepalive_timeout = keepalive_timeout
+        self.max_idle = max_idle
+        self.shed_count = 0
+        self._queue = queue.Queue(max(int(queue_size), 1))
+        self._closing = False
+        self._selector = selectors.DefaultSelector()
+        self._idle = {}  # Сокет -> (адрес, время закрытия по простою)
+        self._to_park = []
+        self._park_lock = threading.Lock()
+        self._wake_r, self._wake_w = socket.socketpair()
+        self._wake_r.setblocking(False)
+        self._wake_w.setblocking(False)
+        self._selector.register(self._wake_r, selectors.EVENT_READ)
+        self._poller = threading.Thread(target=self._poll, name='http-keepalive', daemon=True)
+        self._poller.start()
+        for number in range(self.workers):
+            threading.Thread(target=self._work, name=f'http-worker-{number}', daemon=True).start()
+
+    # --- Прием и распределение ---
+    def get_request(self):
+        sock, address = super().get_request()
+        # Заголовки и тело ответа пишутся отдельно: без TCP_NODELAY каждый ответ ждал бы отложенного ACK клиента
+        try: sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        except OSError: pass
+        return sock, address
+
+    def process_request(self, request, client_address):
+        self._dispatch(request, client_address)
+
+    def _dispatch(self, sock, address):
+        try:
+            self._queue.put_nowait((sock, address))
+        except queue.Full:
+            self._shed(sock)
+
+    def _shed(self, sock):
+        """Answers 503 without reading the request and closes the connection."""
+        self.shed_count += 1
+        if self.shed_count == 1 or self.shed_count % 100 == 0:
+            logging.warning(f"Сервер перегружен: отклонено запросов с 503: {self.shed_count}")
+        try:
+            sock.settimeout(1)
+            sock.sendall(SHED_RESPONSE)
+            # Непрочитанный запрос в буфере превратил бы закрытие в RST, и клиент не увидел бы ответ
+            sock.settimeout(0)
+            sock.recv(65536)
+        except OSError:
+            pass
+        self.shutdown_request(sock)
+
+    def _work(self):
+        while True:
+            item = self._queue.get()
+            if item is None: return
+            sock, address = item
+            keep_alive = False
+            try:
+                handler = self.RequestHandlerClass(sock, address, self)
+                keep_alive = not handler.close_connection and not self._closing
+            except Exception:
+                self.handle_error(sock, address)
+            if keep_alive: self._park(sock, address)
+            else: self.shutdown_request(sock)
+
+    # --- Простаивающие keep-alive соединения ---
+    def _park(self, sock, address):
+        with self._park_lock:
+            self._to_park.append((sock, address))
+        self._wake()
+
+    def _wake(self):
+        try: self._wake_w.send(b'\0')
+        except OSError: pass
+
+    def _poll(self):
+        while not self._closing:
+            events = self._selector.select(timeout=1.0)
+            now = time.monotonic()
+            for key, _mask in events:
+                if key.fileobj is self._wake_r:
+                    try:
+                        while self._wake_r.recv(4096): pass
+                    except OSError:
+                        pass
+                    continue
+                sock = key.fileobj
+                self._selector.unregister(sock)
+                address, _deadline = self._idle.pop(sock)
+                self._dispatch(sock, address)
+            with self._park_lock:
+                parked, self._to_park = self._to_park, []
+            for sock, address in parked:
+                if len(self._idle) >= self.max_idle:
+                    self.shutdown_request(sock)
+                    continue
+                try:
+                    self._selector.register(sock, selectors.EVENT_READ)
+                except (OSError, ValueError):
+                    self.shutdown_request(sock)
+                    continue
+                self._idle[sock] = (address, now + self.keepalive_timeout)
+            for sock, (address, deadline) in list(self._idle.items()):
+                if deadline <= now: self._close_idle(sock)
+        for sock in list(self._idle): self._close_idle(sock)
+        self._selector.close()
+
+    def _close_idle(self, sock):
+        self._selector.unregister(sock)
+        del self._idle[sock]
+        self.shutdown_request(sock)
+
+    def server_close(self):
+        """Stops the poller and the workers; requests in progress are completed, queued and idle connections are closed."""
+        # До конца __init__ (например, порт занят) пула еще нет
+        if not getattr(self, '_closing', True):
+            self._closing = True
+            self._wake()
+            self._poller.join(timeout=2)
+            while True:
+                try: item = self._queue.get_nowait()
+                except queue.Empty: break
+                if item is not None: self.shutdown_request(item[0])
+            for _ in range(self.workers): self._queue.put(None)
+            self._wake_r.close()
+            self._wake_w.close()
+        super().server_close()